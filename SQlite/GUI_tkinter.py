@@ -3,6 +3,7 @@ from tkinter import ttk, messagebox, filedialog
 import sqlite3
 import logging
 import csv
+from payload_store import decode_payload_row
 
 # Configure logging
 logging.basicConfig(
@@ -22,7 +23,8 @@ current_results = []  # To store query results for export
 def get_db_connection():
     try:
         conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
+        # sqlite3.Row over the row with compressed info / ANN payloads decoded
+        conn.row_factory = lambda cursor, row: sqlite3.Row(cursor, decode_payload_row(cursor, row))
         return conn
     except sqlite3.Error as e:
         messagebox.showerror("Database Connection Error", f"Failed to connect to database: {e}")
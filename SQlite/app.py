@@ -1,31 +1,246 @@
 # app.py
-from flask import Flask, render_template, request, abort
+from flask import Flask, render_template, request, abort, g, jsonify, Response
 import sqlite3
 import json
-import copy
+import os
+import sys
+import base64
+import csv
+import io
+import zlib
+import threading
+import queue
+from collections import OrderedDict
+from urllib.request import pathname2url
+from genomic_regions import parse_regions, region_overlap_clause
+from carrier_index import query_carriers, variant_carrier_samples
+from payload_store import PAYLOAD_COLUMNS, decode_payload_row
+
+# ResultCache is shared with the TinyDB browser and lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_cache import ResultCache
 
 app = Flask(__name__)
 
 DATABASE = '/home/mohadese/Desktop/Task2/SQlite/genomic_variants.db' # Ensure the filename and path are correct
+PER_PAGE = 20
+COUNT_CACHE_SIZE = 256  # Filter-result counts kept per database generation
+CARRIER_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Resolved carrier expressions (JSON variant_id lists) kept per generation
+
+# Result cache of listing pages, keyed on the normalized search and cleared when the generation changes
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Total pickled size of the cached pages
+RESULT_CACHE_TTL = 300  # Seconds a cached page is served before it is recomputed
+
+# Connection pool: requests check out a read-only connection and return it when they end
+POOL_SIZE = 8  # Idle connections kept open
+MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the database file memory-mapped per connection (0 disables)
+CACHE_SIZE = -65536  # Page cache per connection; negative values are KiB (64 MiB)
+# immutable=1 skips all locking and change detection; only for a database file that is
+# never written while the app runs (replacing the file is detected by its mtime and size)
+IMMUTABLE = False
+
+# Streaming export: rows are fetched and written EXPORT_BATCH_SIZE at a time, so memory
+# stays bounded whatever the result size; format -> (mimetype, file extension)
+EXPORT_BATCH_SIZE = 1000
+EXPORT_GZIP_LEVEL = 6  # zlib level of gzip=1 exports (1 fastest, 9 smallest)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'tsv': ('text/tab-separated-values', 'tsv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Keyset ordering of the variant listing; (chrom, pos) is indexed and variant_id breaks ties
+SORT_KEY = "variants.chrom, variants.pos, variants.variant_id"
+
+count_cache = OrderedDict()
+count_cache_lock = threading.Lock()
+
+# Idle (connection, database identity) pairs, most recently used first to keep page caches warm
+connection_pool = queue.LifoQueue(maxsize=POOL_SIZE)
 
 def dict_factory(cursor, row):
-    """Convert database row objects to a dictionary keyed by column name."""
+    """Convert database row objects to a dictionary keyed by column name, decoding compressed info / ANN payloads."""
+    row = decode_payload_row(cursor, row)
     return {col[0]: row[idx] for idx, col in enumerate(cursor.description)}
 
-def get_db_connection():
-    """Establish a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE)
+def database_identity():
+    """
+    Identify the database file, so pooled connections to a replaced file are recycled.
+
+    A new file (rebuilt elsewhere and moved into place) has a new inode; connections
+    opened with immutable=1 also do not see in-place writes, so for them a changed
+    mtime or size counts as a new file too.
+    """
+    stat = os.stat(DATABASE)
+    identity = (stat.st_dev, stat.st_ino)
+    if IMMUTABLE:
+        identity += (stat.st_mtime_ns, stat.st_size)
+    return identity
+
+def open_db_connection():
+    """Open a read-only connection to the SQLite database with the pool's PRAGMA settings."""
+    uri = f"file:{pathname2url(os.path.abspath(DATABASE))}?mode=ro"
+    if IMMUTABLE:
+        uri += "&immutable=1"
+    # Pooled connections move between request threads, one request at a time
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
     conn.row_factory = dict_factory  # Use dict_factory to get dictionaries
+    conn.execute(f"PRAGMA mmap_size = {int(MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = {int(CACHE_SIZE)}")
+    conn.execute("PRAGMA query_only = ON")
     return conn
 
-def get_filterable_columns():
-    """Return a list of all filterable columns with their data types."""
+def connection_is_healthy(conn):
+    """Check that a pooled connection can still read the database."""
+    try:
+        conn.execute("PRAGMA schema_version").fetchone()
+        return True
+    except sqlite3.Error:
+        return False
+
+def get_db_connection():
+    """
+    Check out a pooled read-only connection for the current request.
+
+    The connection is returned to the pool when the request ends (release_db_connection),
+    so views do not close it. Idle connections to a replaced database file or failing
+    their health check are closed and replaced by a new one.
+    """
+    if 'db' in g:
+        return g.db[0]
+    identity = database_identity()
+    conn = None
+    while conn is None:
+        try:
+            pooled_conn, pooled_identity = connection_pool.get_nowait()
+        except queue.Empty:
+            break
+        if pooled_identity == identity and connection_is_healthy(pooled_conn):
+            conn = pooled_conn
+        else:
+            pooled_conn.close()
+    if conn is None:
+        conn = open_db_connection()
+    g.db = (conn, identity)
+    return conn
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Return the request's connection to the pool, or close it if the pool is full."""
+    entry = g.pop('db', None)
+    if entry is None:
+        return
+    conn = entry[0]
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        connection_pool.put_nowait(entry)
+    except queue.Full:
+        conn.close()
+
+def get_database_generation(conn):
+    """
+    Return the generation number bumped by models.py on every load.
+
+    Databases built before the metadata table existed fall back to the file's
+    modification time and size.
+    """
+    try:
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row:
+        return row['value']
+    stat = os.stat(DATABASE)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def count_variants(conn, where_clause, params, key_params=None):
+    """
+    Count the variants matching a WHERE clause, cached per database generation.
+
+    key_params replace params in the cache key (see build_where_clause), so carrier
+    expressions are keyed on their text rather than on their variant_id lists.
+    """
+    cache_key = (get_database_generation(conn), where_clause, tuple(params if key_params is None else key_params))
+    with count_cache_lock:
+        if cache_key in count_cache:
+            count_cache.move_to_end(cache_key)
+            return count_cache[cache_key]
+
+    count_query = "SELECT COUNT(*) AS total_variants FROM variants LEFT JOIN clinvar_annotations ON variants.variant_id = clinvar_annotations.variant_id" + where_clause
+    total_variants_result = conn.execute(count_query, params).fetchone()
+    total_variants = total_variants_result['total_variants'] if total_variants_result else 0
+
+    with count_cache_lock:
+        count_cache[cache_key] = total_variants
+        while len(count_cache) > COUNT_CACHE_SIZE:
+            count_cache.popitem(last=False)
+    return total_variants
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+carrier_cache = ResultCache(CARRIER_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+
+def resolve_carrier_expression(conn, expression):
+    """
+    Return the matching variant_ids of a carrier expression as a JSON list, evaluated
+    once per database generation and then served from carrier_cache.
+
+    Raises:
+        ValueError: If the expression is invalid or names an unknown sample.
+    """
+    generation = get_database_generation(conn)
+    variant_ids = carrier_cache.get(generation, expression)
+    if variant_ids is None:
+        variant_ids = json.dumps(query_carriers(conn, expression))
+        carrier_cache.put(generation, expression, variant_ids)
+    return variant_ids
+
+def encode_cursor(direction, page, variant=None):
+    """
+    Encode an opaque pagination token.
+
+    Args:
+        direction (str): 'next' (rows after the key), 'prev' (rows before the key) or 'last'.
+        page (int): Page number the token leads to, for display only.
+        variant (dict): Row whose (chrom, pos, variant_id) is the keyset boundary.
+    """
+    key = [variant['chrom'], variant['pos'], variant['variant_variant_id']] if variant else None
+    payload = json.dumps([direction, page, key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(token):
+    """
+    Decode a pagination token into (direction, page, key); invalid tokens lead to the first page.
+    """
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, page, key = json.loads(payload)
+        if direction not in ('next', 'prev', 'last') or (direction != 'last' and len(key) != 3):
+            raise ValueError(token)
+        return direction, max(1, int(page)), key
+    except (ValueError, TypeError):
+        return None, 1, None
+
+def get_filterable_columns(conn=None):
+    """
+    Return a list of all filterable columns with their data types.
+
+    With a connection, the INFO columns projected at ingest (info_columns table) that
+    are not listed here are added as well.
+    """
     # Define columns with their data types: 'text' or 'numeric'
-    return [
+    columns = [
+        {'name': 'region', 'type': 'region'},
+        {'name': 'carriers', 'type': 'carrier'},
+        {'name': 'gene', 'type': 'annotation', 'column': 'variant_annotations.gene'},
+        {'name': 'consequence', 'type': 'annotation', 'column': 'variant_annotations.consequence'},
+        {'name': 'impact', 'type': 'annotation', 'column': 'variant_annotations.impact'},
+        {'name': 'transcript', 'type': 'annotation', 'column': 'variant_annotations.transcript'},
+        {'name': 'hgvs_c', 'type': 'annotation', 'column': 'variant_annotations.hgvs_c'},
+        {'name': 'hgvs_p', 'type': 'annotation', 'column': 'variant_annotations.hgvs_p'},
         {'name': 'chrom', 'type': 'text'},
-        {'name': 'start_pos', 'type': 'numeric'},
-        {'name': 'end_pos', 'type': 'numeric'},
         {'name': 'pos', 'type': 'numeric'},
+        {'name': 'end_pos', 'type': 'numeric'},
         {'name': 'ref', 'type': 'text'},
         {'name': 'alt', 'type': 'text'},
         {'name': 'qual', 'type': 'numeric'},
@@ -59,20 +274,143 @@ def get_filterable_columns():
         {'name': 'CLNHGVS', 'type': 'text'},
         {'name': 'AF_EXAC', 'type': 'numeric'}
     ]
+    if conn is None:
+        return columns
+
+    known = {column['name'].lower() for column in columns}
+    try:
+        info_columns = conn.execute("""
+            SELECT column_name, info_type, info_number FROM info_columns ORDER BY column_name
+        """).fetchall()
+    except sqlite3.OperationalError:
+        return columns  # Database built before INFO columns were projected
+    for row in info_columns:
+        column_name, info_type, info_number = row['column_name'], row['info_type'], row['info_number']
+        if column_name.lower() in known:
+            continue
+        numeric = info_type in ('Integer', 'Float', 'Flag') and info_number in ('0', '1', 'A', 'R')
+        columns.append({
+            'name': column_name,
+            'type': 'numeric' if numeric else 'text',
+            'column': f'variants."{column_name}"'
+        })
+    return columns
+
+def get_search_columns(conn):
+    """
+    Return the names of the ClinVar columns covered by the clinvar_search text index.
+
+    Databases built without the index (or SQLite builds without FTS5) return an empty set.
+    """
+    if conn is None:
+        return set()
+    try:
+        return {row['name'] for row in conn.execute("PRAGMA table_info(clinvar_search)")}
+    except sqlite3.Error:
+        return set()
+
+def get_ann_display_columns(conn):
+    """
+    Return the ann_<field> columns of the variant_ann_display table, in table order.
+
+    Databases built before the table existed return an empty list.
+    """
+    try:
+        return [row['name'] for row in conn.execute("PRAGMA table_info(variant_ann_display)") if row['name'] != 'variant_id']
+    except sqlite3.Error:
+        return []
 
-def build_where_clause(filters, logic):
+def variant_select_query(conn):
+    """
+    Return the SELECT ... FROM part of the listing and detail queries.
+
+    The fields of a variant's first ANN entry are read from variant_ann_display,
+    precomputed at ingest, as the last columns of the row. Databases without that
+    table select the ANN JSON instead, for flatten_ann.
+    """
+    display_columns = get_ann_display_columns(conn)
+    if display_columns:
+        ann_select = ", ".join(f'variant_ann_display."{column}"' for column in display_columns)
+        ann_join = "LEFT JOIN variant_ann_display ON variants.variant_id = variant_ann_display.variant_id"
+    else:
+        ann_select = "variants.ANN"
+        ann_join = ""
+    return f"""
+        SELECT 
+            variants.variant_id AS variant_variant_id, 
+            variants.chrom, variants.pos, variants.ref, variants.alt,
+            variants.qual, variants.filter, variants.DP, variants.AF, variants.AC, variants.AN,
+            variants.ExcessHet, variants.FS, variants.MLEAC, variants.MLEAF, variants.MQ,
+            variants.QD, variants.SOR, variants.RS,
+            clinvar_annotations.clinvar_id, clinvar_annotations.clinical_significance,
+            clinvar_annotations.condition, clinvar_annotations.review_status,
+            clinvar_annotations.CLNREVSTAT, clinvar_annotations.CLNSIG,
+            clinvar_annotations.CLNVC, clinvar_annotations.CLNVCSO,
+            clinvar_annotations.GENEINFO, clinvar_annotations.MC,
+            clinvar_annotations.ORIGIN, clinvar_annotations.ALLELEID,
+            clinvar_annotations.CLNDISDB, clinvar_annotations.CLNDN,
+            clinvar_annotations.CLNHGVS, clinvar_annotations.AF_EXAC,
+            {ann_select}
+        FROM variants
+        LEFT JOIN clinvar_annotations ON variants.variant_id = clinvar_annotations.variant_id
+        {ann_join}
+    """
+
+def flatten_ann(variant):
+    """
+    Replace a row's ANN JSON by ann_<field> keys holding its first entry's fields
+    (the layout of variant_ann_display), for databases built without that table.
+    """
+    ann = variant.pop('ANN')
+    if ann:
+        try:
+            ann_data = json.loads(ann)
+            # ANN is a list of entries; the first one is shown in the table
+            for ann_key, ann_value in (ann_data[0] if ann_data else {}).items():
+                variant[f"ann_{ann_key}"] = ann_value
+        except json.JSONDecodeError:
+            variant['ann'] = 'N/A'
+    return variant
+
+def text_condition(field, operator, value):
+    """
+    Build the SQL condition and parameter of a text operator, or None for other operators.
+    """
+    if operator == 'equals':
+        return f"{field} = ?", value
+    if operator == 'contains':
+        return f"{field} LIKE ?", f"%{value}%"
+    if operator == 'starts_with':
+        return f"{field} LIKE ?", f"{value}%"
+    if operator == 'ends_with':
+        return f"{field} LIKE ?", f"%{value}"
+    return None
+
+def build_where_clause(filters, logic, conn=None):
     """
     Build the WHERE clause for the SQL query based on the provided filters.
 
     Args:
         filters (list of dict): Each dict contains 'field', 'operator', 'value'.
         logic (str): 'and' or 'or' to combine the filters.
+        conn (sqlite3.Connection): Connection used to evaluate carrier expressions.
 
     Returns:
-        tuple: (where_clause as string, params as list)
+        tuple: (where_clause as string, params as list, key_params as list). key_params
+        are params with each carrier expression's variant_id list replaced by the
+        expression, for cache keys.
+
+    Raises:
+        ValueError: If a region list cannot be parsed, or a carrier expression is invalid
+            or names an unknown sample.
     """
     where_clauses = []
     params = []
+    carrier_params = {}  # Index in params -> carrier expression
+    annotation_conditions = []
+    search_columns = get_search_columns(conn)
+    # Looked up once per search: with a connection this also reads the info_columns table
+    filterable_columns = {column['name']: column for column in get_filterable_columns(conn)}
     for filter in filters:
         field = filter.get('field')
         operator = filter.get('operator')
@@ -82,11 +420,37 @@ def build_where_clause(filters, logic):
             continue  # Skip incomplete filters
 
         # Determine the type of the field
-        column = next((col for col in get_filterable_columns() if col['name'] == field), None)
+        column = filterable_columns.get(field)
         if not column:
             continue  # Skip unknown fields
-
-        if column['type'] == 'numeric':
+        field = column.get('column', field)
+
+        if column['type'] == 'region':
+            # Region list such as "chr17:43,044,295-43,125,483; chr13:32315474-32400266",
+            # matched by overlap with the variant's reference span for any operator
+            regions = parse_regions(value)  # ValueError for an invalid region
+            if regions:
+                region_clause, region_params = region_overlap_clause(regions)
+                where_clauses.append(region_clause)
+                params.extend(region_params)
+        elif column['type'] == 'carrier':
+            # Carrier expression such as "A:hom_alt AND B:hom_alt AND C:ref", answered from
+            # the carrier index bitmaps for any operator
+            if conn is None:
+                continue
+            try:
+                variant_ids = resolve_carrier_expression(conn, value)
+            except sqlite3.OperationalError:
+                continue  # Skip carrier filters on databases without a carrier index
+            where_clauses.append("variants.variant_id IN (SELECT value FROM json_each(?))")
+            carrier_params[len(params)] = value
+            params.append(variant_ids)
+        elif column['type'] == 'annotation':
+            # Functional annotation fields, matched through the variant_annotations table
+            condition = text_condition(field, operator, value)
+            if condition:
+                annotation_conditions.append(condition)
+        elif column['type'] == 'numeric':
             # Handle numeric operators
             try:
                 if operator == 'equals':
@@ -112,109 +476,112 @@ def build_where_clause(filters, logic):
             except ValueError:
                 continue  # Skip filters with invalid numeric values
         else:
-            # Handle text operators
-            if operator == 'equals':
-                where_clauses.append(f"{field} = ?")
-                params.append(value)
-            elif operator == 'contains':
-                where_clauses.append(f"{field} LIKE ?")
-                params.append(f"%{value}%")
-            elif operator == 'starts_with':
-                where_clauses.append(f"{field} LIKE ?")
-                params.append(f"{value}%")
-            elif operator == 'ends_with':
-                where_clauses.append(f"{field} LIKE ?")
-                params.append(f"%{value}")
+            # Handle text operators; LIKE patterns on indexed ClinVar columns are answered by
+            # the clinvar_search trigram index instead of a scan of every annotation
+            condition = text_condition(field, operator, value)
+            if condition and operator != 'equals' and column['name'] in search_columns:
+                where_clauses.append(
+                    "variants.variant_id IN (SELECT clinvar_annotations.variant_id FROM clinvar_annotations "
+                    "WHERE clinvar_annotations.annotation_id IN "
+                    f"(SELECT rowid FROM clinvar_search WHERE clinvar_search.{column['name']} LIKE ?))"
+                )
+                params.append(condition[1])
+            elif condition:
+                where_clauses.append(condition[0])
+                params.append(condition[1])
+
+    # With AND, the annotation conditions must hold for the same ANN entry (e.g. gene BRCA1
+    # with HIGH impact), which is also a single lookup on the (gene, impact) index
+    if annotation_conditions:
+        groups = [annotation_conditions] if logic == 'and' else [[condition] for condition in annotation_conditions]
+        for group in groups:
+            where_clauses.append(
+                "variants.variant_id IN (SELECT variant_annotations.variant_id FROM variant_annotations WHERE "
+                + " AND ".join(condition for condition, _ in group) + ")"
+            )
+            params.extend(param for _, param in group)
 
     if where_clauses:
-        where_clause = " WHERE " + f" {logic.upper()} ".join(where_clauses)
+        where_clause = " WHERE (" + f" {logic.upper()} ".join(where_clauses) + ")"
     else:
         where_clause = ""
 
-    return where_clause, params
+    key_params = [carrier_params.get(index, param) for index, param in enumerate(params)]
+    return where_clause, params, key_params
 
-@app.route('/', methods=['GET'], endpoint='variants')
-def index():
-    # Get all filterable columns
-    filterable_columns = get_filterable_columns()
-
-    # Retrieve advanced search criteria from the form
-    criteria = []
-    num_criteria = int(request.args.get('num_criteria', 0))
-    logic = request.args.get('logic', 'and').lower()
-    for i in range(1, num_criteria + 1):
-        field = request.args.get(f'field_{i}')
-        operator = request.args.get(f'operator_{i}')
-        value = request.args.get(f'value_{i}')
-        if field and operator and value:
-            criteria.append({'field': field, 'operator': operator, 'value': value})
+def fetch_variant_page(conn, filters, logic, direction, page, key):
+    """
+    Run the count and keyset page queries of a search and flatten the page's ANN fields.
 
-    # Pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    offset = (page - 1) * per_page
+    Args:
+        conn (sqlite3.Connection): Database connection.
+        filters (list of dict): Normalized search criteria.
+        logic (str): 'and' or 'or' to combine the criteria.
+        direction, page, key: Decoded pagination cursor (see decode_cursor).
 
-    # Build WHERE clause
-    where_clause, params = build_where_clause(criteria, logic)
+    Returns:
+        dict: The page's variants, header_keys, page, total_pages, total_variants and
+        prev/next/last cursors, as passed to the template.
+    """
+    per_page = PER_PAGE
+    try:
+        where_clause, params, key_params = build_where_clause(filters, logic, conn)
+    except ValueError as e:
+        abort(400, description=str(e))
 
     # Base SQL query with aliases to prevent duplication
-    base_query = """
-        SELECT 
-            variants.variant_id AS variant_variant_id, 
-            variants.chrom, variants.pos, variants.ref, variants.alt,
-            variants.qual, variants.filter, variants.DP, variants.AF, variants.AC, variants.AN,
-            variants.ExcessHet, variants.FS, variants.MLEAC, variants.MLEAF, variants.MQ,
-            variants.QD, variants.SOR, variants.RS, variants.ANN,
-            clinvar_annotations.clinvar_id, clinvar_annotations.clinical_significance,
-            clinvar_annotations.condition, clinvar_annotations.review_status,
-            clinvar_annotations.CLNREVSTAT, clinvar_annotations.CLNSIG,
-            clinvar_annotations.CLNVC, clinvar_annotations.CLNVCSO,
-            clinvar_annotations.GENEINFO, clinvar_annotations.MC,
-            clinvar_annotations.ORIGIN, clinvar_annotations.ALLELEID,
-            clinvar_annotations.CLNDISDB, clinvar_annotations.CLNDN,
-            clinvar_annotations.CLNHGVS, clinvar_annotations.AF_EXAC
-        FROM variants
-        LEFT JOIN clinvar_annotations ON variants.variant_id = clinvar_annotations.variant_id
-    """
+    base_query = variant_select_query(conn)
 
-    # Final query for fetching variants with pagination
-    final_query = base_query + where_clause + " ORDER BY chrom, pos LIMIT ? OFFSET ?"
+    try:
+        total_variants = count_variants(conn, where_clause, params, key_params)
+    except Exception as e:
+        abort(500, description=f"Database count query failed: {e}")
+    total_pages = max(1, (total_variants + per_page - 1) // per_page)
+
+    # Final query for fetching variants: seek past the cursor key instead of using OFFSET.
+    # Backward pages are read in descending order and reversed.
     query_params = params.copy()
-    query_params.extend([per_page, offset])
+    limit = per_page
+    if direction == 'last':
+        page = total_pages
+        limit = total_variants - (total_pages - 1) * per_page or per_page
+    if direction in ('next', 'prev'):
+        comparison = '>' if direction == 'next' else '<'
+        keyset_clause = f"({SORT_KEY}) {comparison} (?, ?, ?)"
+        final_where = f"{where_clause} AND {keyset_clause}" if where_clause else f" WHERE {keyset_clause}"
+        query_params.extend(key)
+    else:
+        final_where = where_clause
+    if direction in ('prev', 'last'):
+        order_by = ", ".join(f"{column} DESC" for column in SORT_KEY.split(", "))
+    else:
+        order_by = SORT_KEY
+    final_query = base_query + final_where + f" ORDER BY {order_by} LIMIT ?"
+    query_params.append(limit + 1)  # One extra row tells whether another page follows
 
     # Fetch variants from the database
-    conn = get_db_connection()
     try:
         variants = conn.execute(final_query, query_params).fetchall()
     except Exception as e:
-        conn.close()
         abort(500, description=f"Database query failed: {e}")
 
-    # Process each variant to flatten 'ANN' fields (if necessary)
-    processed_variants = []
-    for variant in variants:
-        variant_copy = copy.deepcopy(variant)  # Create a copy to modify
-
-        # If 'ANN' field exists and is a JSON string, parse and flatten it
-        if 'ANN' in variant_copy and variant_copy['ANN']:
-            try:
-                ann_data = json.loads(variant_copy['ANN'])
-                for ann_key, ann_value in ann_data.items():
-                    new_key = f"ann_{ann_key}"
-                    variant_copy[new_key] = ann_value
-            except json.JSONDecodeError:
-                # Handle JSON parsing errors if 'ANN' is not a valid JSON
-                variant_copy['ann'] = 'N/A'
-        else:
-            # If 'ANN' is missing, you can set default values or leave as is
-            pass  # Optionally set default values
+    has_more = len(variants) > limit
+    variants = variants[:limit]
+    if direction in ('prev', 'last'):
+        variants.reverse()
+        has_previous, has_next = has_more, direction == 'prev'
+    else:
+        has_previous, has_next = direction == 'next', has_more
+    page = min(page, total_pages)
 
-        # Remove the original 'ANN' field as it's now flattened
-        if 'ANN' in variant_copy:
-            del variant_copy['ANN']
+    # Tokens for the neighbouring pages
+    prev_cursor = encode_cursor('prev', page - 1, variants[0]) if has_previous and variants else None
+    next_cursor = encode_cursor('next', page + 1, variants[-1]) if has_next and variants else None
+    last_cursor = encode_cursor('last', total_pages) if has_next else None
 
-        # Append the processed variant to the list
-        processed_variants.append(variant_copy)
+    # Rows carry the precomputed ann_<field> columns; only databases without
+    # variant_ann_display still select the ANN JSON, flattened here
+    processed_variants = [flatten_ann(variant) if 'ANN' in variant else variant for variant in variants]
 
     # Update header_keys based on the first processed variant
     if processed_variants:
@@ -222,75 +589,202 @@ def index():
     else:
         header_keys = []
 
-    # Pagination logic
-    count_query = "SELECT COUNT(*) AS total_variants FROM variants LEFT JOIN clinvar_annotations ON variants.variant_id = clinvar_annotations.variant_id" + where_clause
-    try:
-        total_variants_result = conn.execute(count_query, params).fetchone()
-        total_variants = total_variants_result['total_variants'] if total_variants_result else 0
-    except Exception as e:
-        conn.close()
-        abort(500, description=f"Database count query failed: {e}")
-    conn.close()
-    total_pages = max(1, (total_variants + per_page - 1) // per_page)
+    return {
+        'variants': processed_variants,
+        'header_keys': list(header_keys),
+        'page': page,
+        'total_pages': total_pages,
+        'total_variants': total_variants,
+        'prev_cursor': prev_cursor,
+        'next_cursor': next_cursor,
+        'last_cursor': last_cursor,
+    }
+
+def export_chunks(cursor, columns, export_format, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield an export file as text chunks: the header (CSV / TSV), then one chunk per
+    fetchmany batch of the cursor.
+
+    Args:
+        cursor (sqlite3.Cursor): Executed query returning tuples.
+        columns (list): Column names of the query.
+        export_format (str): 'csv', 'tsv' or 'ndjson' (one JSON object per line).
+        batch_size (int): Rows fetched per chunk.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter='\t' if export_format == 'tsv' else ',', lineterminator='\n')
+    if export_format != 'ndjson':
+        writer.writerow(columns)
+        yield buffer.getvalue()
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        buffer.seek(0)
+        buffer.truncate()
+        if export_format == 'ndjson':
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(columns, row)), separators=(',', ':')))
+                buffer.write('\n')
+        else:
+            writer.writerows(rows)
+        yield buffer.getvalue()
+
+def get_search_criteria():
+    """
+    Read the advanced search criteria of the request's query string.
+
+    Returns:
+        tuple: (criteria as submitted, normalized criteria, logic). The normalized
+        criteria are (field, operator, value) tuples with stripped values, sorted so
+        equivalent searches share cached counts and pages.
+    """
+    criteria = []
+    num_criteria = int(request.args.get('num_criteria', 0))
+    logic = request.args.get('logic', 'and').lower()
+    for i in range(1, num_criteria + 1):
+        field = request.args.get(f'field_{i}')
+        operator = request.args.get(f'operator_{i}')
+        value = request.args.get(f'value_{i}')
+        if field and operator and value:
+            criteria.append({'field': field, 'operator': operator, 'value': value})
+    normalized_criteria = sorted(
+        (criterion['field'], criterion['operator'], criterion['value'].strip()) for criterion in criteria
+    )
+    return criteria, normalized_criteria, logic
 
-    # Prepare filtered_args by removing 'page' from query parameters
+@app.route('/', methods=['GET'], endpoint='variants')
+def index():
+
+    # Retrieve advanced search criteria from the form
+    criteria, normalized_criteria, logic = get_search_criteria()
+
+    # Keyset pagination: the cursor token carries the boundary row, so every page costs the same
+    direction, page, key = decode_cursor(request.args.get('cursor', ''))
+    conn = get_db_connection()
+
+    # Get all filterable columns, including the INFO columns of this database
+    filterable_columns = get_filterable_columns(conn)
+
+    # Serve repeated searches from the result cache; the key holds everything the page depends on
+    generation = get_database_generation(conn)
+    cache_key = (tuple(normalized_criteria), logic, SORT_KEY, direction, page, tuple(key) if key else None)
+    result = result_cache.get(generation, cache_key)
+    if result is None:
+        result = fetch_variant_page(
+            conn,
+            [{'field': field, 'operator': operator, 'value': value} for field, operator, value in normalized_criteria],
+            logic,
+            direction,
+            page,
+            key
+        )
+        result_cache.put(generation, cache_key, result)
+
+    # Prepare filtered_args by removing pagination from query parameters
     filtered_args = request.args.to_dict(flat=False)
     filtered_args.pop('page', None)
+    filtered_args.pop('cursor', None)
 
     return render_template(
         'index.html',
-        variants=processed_variants,
-        page=page,
-        total_pages=total_pages,
         criteria=criteria or [],
-        header_keys=header_keys,
         filterable_columns=filterable_columns,
-        filtered_args=filtered_args
+        filtered_args=filtered_args,
+        **result
     )
 
+@app.route('/export', methods=['GET'])
+def export_variants():
+    """
+    Stream the variants matching the search criteria as a file download.
+
+    Takes the search form's query string, plus format=csv|tsv|ndjson (default csv)
+    and gzip=1 to compress the file on the fly. The rows are read with fetchmany
+    from a dedicated connection, outside the pool, which the export keeps for its
+    whole duration; its read transaction gives the file a consistent snapshot.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description=f"Unknown export format '{export_format}'; expected one of {', '.join(EXPORT_FORMATS)}")
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    _, normalized_criteria, logic = get_search_criteria()
+
+    conn = open_db_connection()
+    try:
+        where_clause, params, _ = build_where_clause(
+            [{'field': field, 'operator': operator, 'value': value} for field, operator, value in normalized_criteria],
+            logic,
+            conn
+        )
+        cursor = conn.cursor()
+        cursor.row_factory = None  # Plain tuples
+        cursor.execute(variant_select_query(conn) + where_clause + f" ORDER BY {SORT_KEY}", params)
+    except ValueError as e:
+        conn.close()
+        abort(400, description=str(e))
+    except Exception as e:
+        conn.close()
+        abort(500, description=f"Export query failed: {e}")
+    columns = [column[0] for column in cursor.description]
+    if any(column in PAYLOAD_COLUMNS for column in columns):
+        cursor.row_factory = decode_payload_row  # ANN selected by databases without variant_ann_display
+
+    def generate():
+        compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None  # wbits 31: gzip
+        try:
+            for chunk in export_chunks(cursor, columns, export_format):
+                data = chunk.encode('utf-8')
+                if compressor is None:
+                    yield data
+                else:
+                    data = compressor.compress(data)
+                    if data:
+                        yield data
+            if compressor is not None:
+                yield compressor.flush()
+        finally:
+            conn.close()
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"variants.{extension}"
+    if compress:
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(generate(), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment;filename={filename}"})
+
+@app.route('/cache-stats')
+def cache_stats():
+    """Report the result cache's hit/miss counters and occupancy as JSON, with the carrier cache's under 'carrier_cache'."""
+    stats = result_cache.stats()
+    stats['carrier_cache'] = carrier_cache.stats()
+    return jsonify(stats)
+
 @app.route('/variant/<int:variant_id>')
 def variant_detail(variant_id):
     conn = get_db_connection()
-    variant = conn.execute("""
-        SELECT 
-            variants.variant_id AS variant_variant_id, 
-            variants.chrom, variants.pos, variants.ref, variants.alt,
-            variants.qual, variants.filter, variants.DP, variants.AF, variants.AC, variants.AN,
-            variants.ExcessHet, variants.FS, variants.MLEAC, variants.MLEAF, variants.MQ,
-            variants.QD, variants.SOR, variants.RS, variants.ANN,
-            clinvar_annotations.clinvar_id, clinvar_annotations.clinical_significance,
-            clinvar_annotations.condition, clinvar_annotations.review_status,
-            clinvar_annotations.CLNREVSTAT, clinvar_annotations.CLNSIG,
-            clinvar_annotations.CLNVC, clinvar_annotations.CLNVCSO,
-            clinvar_annotations.GENEINFO, clinvar_annotations.MC,
-            clinvar_annotations.ORIGIN, clinvar_annotations.ALLELEID,
-            clinvar_annotations.CLNDISDB, clinvar_annotations.CLNDN,
-            clinvar_annotations.CLNHGVS, clinvar_annotations.AF_EXAC
-        FROM variants
-        LEFT JOIN clinvar_annotations ON variants.variant_id = clinvar_annotations.variant_id
-        WHERE variants.variant_id = ?
-    """, (variant_id,)).fetchone()
-    conn.close()
+    variant = conn.execute(
+        variant_select_query(conn) + " WHERE variants.variant_id = ?", (variant_id,)
+    ).fetchone()
+    try:
+        carriers = variant_carrier_samples(conn, variant_id)
+    except sqlite3.OperationalError:
+        carriers = {'het': [], 'hom_alt': []}  # Database built without a carrier index
+    try:
+        annotations = conn.execute("""
+            SELECT allele, consequence, impact, gene, gene_id, transcript, biotype, hgvs_c, hgvs_p
+            FROM variant_annotations WHERE variant_id = ? ORDER BY annotation_id
+        """, (variant_id,)).fetchall()
+    except sqlite3.OperationalError:
+        annotations = []  # Database built without the variant_annotations table
     if variant is None:
         abort(404, description="Variant not found")
 
-    # Process the 'ANN' field if needed
-    variant_copy = copy.deepcopy(variant)
-    if 'ANN' in variant_copy and variant_copy['ANN']:
-        try:
-            ann_data = json.loads(variant_copy['ANN'])
-            for ann_key, ann_value in ann_data.items():
-                new_key = f"ann_{ann_key}"
-                variant_copy[new_key] = ann_value
-        except json.JSONDecodeError:
-            variant_copy['ann'] = 'N/A'
-    else:
-        pass  # Optionally set default values
-
-    if 'ANN' in variant_copy:
-        del variant_copy['ANN']
+    if 'ANN' in variant:
+        flatten_ann(variant)
 
-    return render_template('variant_detail.html', variant=variant_copy)
+    return render_template('variant_detail.html', variant=variant, carriers=carriers, annotations=annotations)
 
 @app.errorhandler(404)
 def page_not_found(e):
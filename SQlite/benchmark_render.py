@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the Genome Browser's listing page render time.
+
+Renders the first pages of the variant listing through Flask's test client, with the
+result cache disabled, twice: reading the ANN display fields precomputed in
+variant_ann_display, and parsing the ANN JSON of every row per request (the path
+of databases built without that table). Prints the median latency per page.
+
+Usage: python benchmark_render.py [database]
+"""
+import re
+import sys
+import time
+import statistics
+import app as browser
+
+# ---------------------------- Configuration ---------------------------- #
+
+DATABASE = browser.DATABASE
+PAGES = 50  # Listing pages rendered per round, following the Next cursors
+ROUNDS = 11  # Rounds per mode; the first one warms the page cache and is not counted
+
+NEXT_LINK = re.compile(rb'href="([^"]*)" aria-label="Next"')
+
+# ---------------------------- Benchmark ---------------------------- #
+
+def render_pages(client, pages):
+    """
+    Render the listing from the first page on and return each page's latency in seconds.
+    """
+    latencies = []
+    url = '/'
+    for _ in range(pages):
+        start_time = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start_time)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        next_link = NEXT_LINK.search(response.data)
+        if next_link is None:
+            break
+        url = next_link.group(1).decode().replace('&amp;', '&')
+    return latencies
+
+def benchmark(pages=PAGES, rounds=ROUNDS):
+    """
+    Return the median page latency in milliseconds of both modes: 'parsed' and
+    'precomputed'. The modes alternate round by round, so both see the same load.
+    """
+    get_ann_display_columns = browser.get_ann_display_columns
+    client = browser.app.test_client()
+    latencies = {'parsed': [], 'precomputed': []}
+    try:
+        for round_number in range(rounds):
+            for mode, mode_latencies in latencies.items():
+                if mode == 'parsed':
+                    browser.get_ann_display_columns = lambda conn: []  # Select and flatten the ANN JSON
+                else:
+                    browser.get_ann_display_columns = get_ann_display_columns
+                round_latencies = render_pages(client, pages)
+                if round_number:
+                    mode_latencies.extend(round_latencies)
+    finally:
+        browser.get_ann_display_columns = get_ann_display_columns
+    return {mode: statistics.median(mode_latencies) * 1000 for mode, mode_latencies in latencies.items()}
+
+def main():
+    browser.DATABASE = sys.argv[1] if len(sys.argv) > 1 else DATABASE
+    browser.result_cache.max_bytes = 0  # Render every page instead of serving it from the cache
+    results = benchmark()
+    print(f"Listing page render time ({PAGES} pages x {ROUNDS - 1} rounds, median):")
+    for mode, latency in results.items():
+        print(f"  {mode:<12} {latency:.2f} ms")
+    print(f"  speedup      {results['parsed'] / results['precomputed']:.2f}x")
+
+# ---------------------------- Entry Point ---------------------------- #
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import re
+import zlib
+from functools import lru_cache
+import numpy as np
+from genotype_store import unpack_alleles, sample_positions
+
+
+# ---------------------------- Configuration ---------------------------- #
+
+# Number of variant_ids covered by one block of a per-sample bitmap
+CARRIER_BLOCK_SIZE = 32768
+
+# Genotype states kept in the per-sample bitmaps; 'called' marks any non-missing genotype
+CARRIER_STATES = ('het', 'hom_alt', 'called')
+
+# Query states: stored ones plus those derived from them
+QUERY_STATES = ('het', 'hom_alt', 'called', 'carrier', 'ref', 'missing')
+
+# Cell codes of the block state matrix; 0 means no genotype written yet
+STATE_MISSING = 1
+STATE_REF = 2
+STATE_HET = 3
+STATE_HOM_ALT = 4
+
+TOKEN_PATTERN = re.compile(r'\s*(\(|\)|&|\||!|[^\s()&|!]+)')
+
+# ---------------------------- Bitmap Helpers ---------------------------- #
+
+def pack_bitmap(mask):
+    """
+    Pack a boolean array into a zlib-compressed little-endian bitmap.
+    """
+    return zlib.compress(np.packbits(mask, bitorder='little').tobytes())
+
+def unpack_bitmap(blob):
+    """
+    Read a zlib-compressed bitmap as a Python int (bit i set for position i).
+    """
+    return int.from_bytes(zlib.decompress(blob), 'little')
+
+def bitmap_positions(bitmap):
+    """
+    Return the positions of the set bits of a Python int bitmap as a sorted list.
+    """
+    if not bitmap:
+        return []
+    data = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder='little')).tolist()
+
+def positions_bitmap(positions):
+    """
+    Build a Python int bitmap with the bits of the given positions set.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if not positions.size:
+        return 0
+    mask = np.zeros(int(positions.max()) + 1, dtype=bool)
+    mask[positions] = True
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+@lru_cache(maxsize=None)
+def genotype_state(genotype):
+    """
+    Classify a genotype string ('0/1', './.', '1', ...) as a STATE_* code.
+    """
+    alleles = genotype.replace('|', '/').split('/')
+    if '.' in alleles:
+        return STATE_MISSING
+    if all(allele == '0' for allele in alleles):
+        return STATE_REF
+    if len(set(alleles)) == 1:
+        return STATE_HOM_ALT
+    return STATE_HET
+
+def allele_states(alleles):
+    """
+    Classify an allele pair array (see genotype_store) as STATE_* codes, matching genotype_state.
+    """
+    first, second = alleles[:, 0], alleles[:, 1]
+    haploid = second == -2
+    states = np.full(first.shape, STATE_HET, dtype=np.uint8)
+    states[(first == second) | haploid] = STATE_HOM_ALT
+    states[(first == 0) & ((second == 0) | haploid)] = STATE_REF
+    states[(first < 0) | (second == -1)] = STATE_MISSING
+    return states
+
+# ---------------------------- Index Build ---------------------------- #
+
+def load_block_states(conn, block_start, block_end, sample_count):
+    """
+    Build the (sample_id, variant offset) state matrix of one block of variant_ids.
+
+    The first genotype written for a variant and sample wins, as INSERT OR IGNORE
+    does in the genotype table.
+    """
+    states = np.zeros((sample_count + 1, block_end - block_start), dtype=np.uint8)
+    for sample_ids, variant_id, blob in conn.execute("""
+        SELECT sample_sets.sample_ids, genotype_matrix.variant_id, genotype_matrix.genotypes
+        FROM genotype_matrix
+        JOIN sample_sets ON sample_sets.sample_set_id = genotype_matrix.sample_set_id
+        WHERE genotype_matrix.variant_id >= ? AND genotype_matrix.variant_id < ?
+        ORDER BY genotype_matrix.rowid
+    """, (block_start, block_end)):
+        column = states[:, variant_id - block_start]
+        set_sample_ids = np.fromiter(sample_positions(sample_ids), dtype=np.intp)
+        blob_states = allele_states(unpack_alleles(blob))
+        unset = column[set_sample_ids] == 0
+        column[set_sample_ids[unset]] = blob_states[unset]
+
+    rows = conn.execute("""
+        SELECT variant_id, sample_id, genotype FROM genotype
+        WHERE variant_id >= ? AND variant_id < ?
+    """, (block_start, block_end)).fetchall()
+    for variant_id, sample_id, genotype in rows:
+        if genotype is not None and states[sample_id, variant_id - block_start] == 0:
+            states[sample_id, variant_id - block_start] = genotype_state(genotype)
+    return states
+
+def build_carrier_index(conn, block_size=CARRIER_BLOCK_SIZE, first_variant_id=0):
+    """
+    Rebuild the carrier index from the genotype store (genotype rows and packed blobs).
+
+    variant_carriers holds, per variant, bitmaps of the het and hom-alt sample_ids;
+    sample_carriers holds, per sample and block of variant_ids, bitmaps of the
+    variants where the sample is het, hom-alt or called.
+
+    Only the blocks from the one holding first_variant_id on are rebuilt; an
+    incremental ingest passes the lowest variant_id it wrote genotypes for.
+
+    Returns:
+        int: Number of variants with at least one carrier in the rebuilt blocks.
+    """
+    cursor = conn.cursor()
+    max_variant_id = cursor.execute("SELECT COALESCE(MAX(variant_id), 0) FROM variants").fetchone()[0]
+    sample_count = cursor.execute("SELECT COALESCE(MAX(sample_id), 0) FROM samples").fetchone()[0]
+    first_block = first_variant_id // block_size
+    carrier_variants = 0
+    try:
+        conn.execute('BEGIN TRANSACTION')
+        cursor.execute("DELETE FROM variant_carriers WHERE variant_id >= ?", (first_block * block_size,))
+        cursor.execute("DELETE FROM sample_carriers WHERE block >= ?", (first_block,))
+        for block in range(first_block, max_variant_id // block_size + 1):
+            block_start = block * block_size
+            states = load_block_states(conn, block_start, block_start + block_size, sample_count)
+
+            het = states == STATE_HET
+            hom_alt = states == STATE_HOM_ALT
+            carriers = np.flatnonzero((het | hom_alt).any(axis=0))
+            cursor.executemany("""
+                INSERT INTO variant_carriers (variant_id, het, hom_alt) VALUES (?, ?, ?)
+            """, [
+                (block_start + int(offset), pack_bitmap(het[:, offset]), pack_bitmap(hom_alt[:, offset]))
+                for offset in carriers
+            ])
+            carrier_variants += len(carriers)
+
+            sample_rows = []
+            for state, mask in zip(CARRIER_STATES, (het, hom_alt, states >= STATE_REF)):
+                for sample_id in np.flatnonzero(mask.any(axis=1)):
+                    sample_rows.append((int(sample_id), state, block, pack_bitmap(mask[sample_id])))
+            cursor.executemany("""
+                INSERT INTO sample_carriers (sample_id, state, block, bitmap) VALUES (?, ?, ?, ?)
+            """, sample_rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return carrier_variants
+
+# ---------------------------- Queries ---------------------------- #
+
+def tuple_cursor(conn):
+    """
+    Open a cursor returning plain tuples, whatever row_factory the connection uses.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+def sample_state_bitmap(conn, sample_name, state, block_size=CARRIER_BLOCK_SIZE):
+    """
+    Return the variant_id bitmap of a sample for one of QUERY_STATES.
+    """
+    if state == 'carrier':
+        return (sample_state_bitmap(conn, sample_name, 'het', block_size)
+                | sample_state_bitmap(conn, sample_name, 'hom_alt', block_size))
+    if state == 'ref':
+        called = sample_state_bitmap(conn, sample_name, 'called', block_size)
+        return called & ~sample_state_bitmap(conn, sample_name, 'carrier', block_size)
+    if state == 'missing':
+        return all_variants_bitmap(conn) & ~sample_state_bitmap(conn, sample_name, 'called', block_size)
+
+    bitmap = 0
+    for block, blob in tuple_cursor(conn).execute("""
+        SELECT sample_carriers.block, sample_carriers.bitmap
+        FROM sample_carriers
+        JOIN samples ON samples.sample_id = sample_carriers.sample_id
+        WHERE samples.sample_name = ? AND sample_carriers.state = ?
+    """, (sample_name, state)):
+        bitmap |= unpack_bitmap(blob) << (block * block_size)
+    return bitmap
+
+def all_variants_bitmap(conn):
+    """
+    Return the bitmap of every variant_id, the universe for NOT.
+    """
+    variant_ids = np.fromiter((row[0] for row in tuple_cursor(conn).execute("SELECT variant_id FROM variants")), dtype=np.int64)
+    return positions_bitmap(variant_ids)
+
+def tokenize_carrier_expression(expression):
+    """
+    Split a carrier expression into '(', ')', 'AND', 'OR', 'NOT' and (sample, state) terms.
+    """
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise ValueError(f"Invalid carrier expression '{expression}'")
+        token = match.group(1)
+        position = match.end()
+        operator = {'&': 'AND', '|': 'OR', '!': 'NOT'}.get(token, token.upper())
+        if operator in ('(', ')', 'AND', 'OR', 'NOT'):
+            tokens.append(operator)
+            continue
+        sample_name, _, state = token.rpartition(':')
+        state = state.lower()
+        if not sample_name or state not in QUERY_STATES:
+            raise ValueError(f"Invalid carrier term '{token}'; expected SAMPLE:{'|'.join(QUERY_STATES)}")
+        tokens.append((sample_name, state))
+    return tokens
+
+def query_carriers(conn, expression, block_size=CARRIER_BLOCK_SIZE):
+    """
+    Return the sorted variant_ids matching a carrier expression.
+
+    Terms are SAMPLE:STATE with STATE one of het, hom_alt, carrier (het or hom_alt),
+    ref, called or missing. Terms combine with AND, OR, NOT (or &, |, !) and
+    parentheses, e.g. 'A:hom_alt AND B:hom_alt AND C:ref'.
+
+    Raises:
+        ValueError: If the expression cannot be parsed or names a sample that is not in
+            the database (whose bitmap would be silently empty).
+    """
+    tokens = tokenize_carrier_expression(expression)
+    sample_names = {token[0] for token in tokens if isinstance(token, tuple)}
+    known_samples = {
+        row[0] for row in tuple_cursor(conn).execute(
+            f"SELECT sample_name FROM samples WHERE sample_name IN ({', '.join('?' * len(sample_names))})",
+            tuple(sample_names)
+        )
+    } if sample_names else set()
+    unknown_samples = sorted(sample_names - known_samples)
+    if unknown_samples:
+        raise ValueError(f"Unknown sample(s) {', '.join(unknown_samples)} in carrier expression '{expression}'")
+    position = 0
+    universe = None
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def advance():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        bitmap = parse_and()
+        while peek() == 'OR':
+            advance()
+            bitmap |= parse_and()
+        return bitmap
+
+    def parse_and():
+        bitmap = parse_not()
+        while peek() == 'AND':
+            advance()
+            bitmap &= parse_not()
+        return bitmap
+
+    def parse_not():
+        nonlocal universe
+        if peek() == 'NOT':
+            advance()
+            if universe is None:
+                universe = all_variants_bitmap(conn)
+            return universe & ~parse_not()
+        return parse_atom()
+
+    def parse_atom():
+        token = advance() if peek() is not None else None
+        if token == '(':
+            bitmap = parse_or()
+            if peek() != ')':
+                raise ValueError(f"Unbalanced parentheses in carrier expression '{expression}'")
+            advance()
+            return bitmap
+        if isinstance(token, tuple):
+            return sample_state_bitmap(conn, token[0], token[1], block_size)
+        raise ValueError(f"Invalid carrier expression '{expression}'")
+
+    bitmap = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"Invalid carrier expression '{expression}'")
+    return bitmap_positions(bitmap)
+
+def variant_carrier_samples(conn, variant_id):
+    """
+    Return the names of the het and hom-alt samples of a variant.
+
+    Returns:
+        dict: {'het': [sample names], 'hom_alt': [sample names]}
+    """
+    cursor = tuple_cursor(conn)
+    row = cursor.execute("SELECT het, hom_alt FROM variant_carriers WHERE variant_id = ?", (variant_id,)).fetchone()
+    if row is None:
+        return {'het': [], 'hom_alt': []}
+    sample_names = dict(cursor.execute("SELECT sample_id, sample_name FROM samples"))
+    return {
+        state: [sample_names[sample_id] for sample_id in bitmap_positions(unpack_bitmap(blob))]
+        for state, blob in zip(('het', 'hom_alt'), row)
+    }
@@ -0,0 +1,111 @@
+import re
+
+
+# ---------------------------- UCSC Binning ---------------------------- #
+
+# Standard UCSC binning scheme: 5 levels of bins of 128 kb, 1 Mb, 8 Mb, 64 Mb
+# and 512 Mb, covering coordinates up to 2^29
+BIN_OFFSETS = [512 + 64 + 8 + 1, 64 + 8 + 1, 8 + 1, 1, 0]
+BIN_FIRST_SHIFT = 17
+BIN_NEXT_SHIFT = 3
+
+# Region separators: ';', whitespace, or a comma that starts a new region: a 'chrom:'
+# prefix (numeric names included, e.g. '17:1-2,13:3-4'), a chromosome name with a letter
+# (X, Y, MT, chr13) or a bare 1-2 digit chromosome ('17,13'); the 3-digit groups of
+# thousands separators ('43,044,295') are not split
+REGION_SEPARATOR = re.compile(r'[;\s]+|,(?=\s*(?:[0-9A-Za-z_.]+:|[A-Za-z]|\d{1,2}\s*(?:[;,\s]|$)))')
+REGION_PATTERN = re.compile(r'^([0-9A-Za-z_.]+)(?::([\d,]+)(?:-([\d,]+))?)?$')
+
+def normalize_chrom(chrom):
+    """
+    Normalize chromosome names by removing 'chr' prefix if present and converting to uppercase.
+    """
+    chrom = chrom.strip()
+    if chrom.lower().startswith('chr'):
+        chrom = chrom[3:]
+    if chrom.upper() == 'M':
+        return 'MT'
+    return chrom.upper()
+
+def region_bin(start, end):
+    """
+    Return the smallest UCSC bin fully containing the 0-based, half-open interval [start, end).
+    """
+    start_bin = start >> BIN_FIRST_SHIFT
+    end_bin = max(start, end - 1) >> BIN_FIRST_SHIFT
+    for offset in BIN_OFFSETS:
+        if start_bin == end_bin:
+            return offset + start_bin
+        start_bin >>= BIN_NEXT_SHIFT
+        end_bin >>= BIN_NEXT_SHIFT
+    raise ValueError(f"Interval {start}-{end} is out of range for the binning scheme")
+
+def overlapping_bins(start, end):
+    """
+    Return every UCSC bin that may hold an interval overlapping [start, end) (0-based, half-open).
+    """
+    bins = []
+    start_bin = start >> BIN_FIRST_SHIFT
+    end_bin = max(start, end - 1) >> BIN_FIRST_SHIFT
+    for offset in BIN_OFFSETS:
+        bins.extend(range(offset + start_bin, offset + end_bin + 1))
+        start_bin >>= BIN_NEXT_SHIFT
+        end_bin >>= BIN_NEXT_SHIFT
+    return bins
+
+# ---------------------------- Region Parsing ---------------------------- #
+
+def parse_regions(value):
+    """
+    Parse a region list such as 'chr17:43,044,295-43,125,483; chr13:32315474-32400266'.
+
+    Each region is 'chrom', 'chrom:pos' or 'chrom:start-end' (1-based, inclusive,
+    thousands separators allowed). Regions are separated by ';', whitespace or a comma
+    followed by the next region's chromosome.
+
+    Returns:
+        list: (chrom, start, end) tuples, with start and end None for whole chromosomes.
+
+    Raises:
+        ValueError: If a region cannot be parsed.
+    """
+    regions = []
+    for token in REGION_SEPARATOR.split(value.strip()):
+        if not token:
+            continue
+        match = REGION_PATTERN.match(token)
+        if not match:
+            raise ValueError(f"Invalid region '{token}'")
+        chrom = normalize_chrom(match.group(1))
+        start = int(match.group(2).replace(',', '')) if match.group(2) else None
+        end = int(match.group(3).replace(',', '')) if match.group(3) else start
+        if start is not None and (start < 1 or end < start):
+            raise ValueError(f"Invalid region '{token}'")
+        regions.append((chrom, start, end))
+    return regions
+
+def region_overlap_clause(regions):
+    """
+    Build a SQL condition matching variants (pos..end_pos) that overlap any of the regions.
+
+    Interval regions are answered through the (chrom, bin, pos) index: only the bins
+    that can hold an overlapping variant are probed.
+
+    Returns:
+        tuple: (condition as string, params as list)
+    """
+    clauses = []
+    params = []
+    for chrom, start, end in regions:
+        if start is None:
+            clauses.append("chrom = ?")
+            params.append(chrom)
+            continue
+        bins = overlapping_bins(start - 1, end)
+        clauses.append(
+            f"(chrom = ? AND bin IN ({', '.join('?' * len(bins))}) AND pos <= ? AND end_pos >= ?)"
+        )
+        params.append(chrom)
+        params.extend(bins)
+        params.extend([end, start])
+    return "(" + " OR ".join(clauses) + ")", params
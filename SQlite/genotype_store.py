@@ -0,0 +1,215 @@
+import json
+import struct
+import zlib
+from functools import lru_cache
+import numpy as np
+
+
+# ---------------------------- Packed Genotype Format ---------------------------- #
+
+# A packed blob holds one variant's genotypes for an ordered sample set:
+# a 5-byte header (format byte, uint32 sample count) followed by the payload.
+#   GENOTYPE_FORMAT_2BIT:   4 samples per byte; 0/0, 0/1, 1/1 and ./. only
+#   GENOTYPE_FORMAT_NIBBLE: 1 byte per sample; (a + 2) << 4 | (b + 2), alleles up to 13
+#   GENOTYPE_FORMAT_WIDE:   2 little-endian uint16 per sample; a + 2, b + 2
+# The high bit of the format byte marks a zlib-compressed payload.
+GENOTYPE_FORMAT_2BIT = 1
+GENOTYPE_FORMAT_NIBBLE = 2
+GENOTYPE_FORMAT_WIDE = 3
+GENOTYPE_COMPRESSED_FLAG = 0x80
+GENOTYPE_HEADER = struct.Struct('<BI')
+
+# 2-bit codes and the allele pairs they decode to
+TWO_BIT_ALLELES = np.array([[0, 0], [0, 1], [1, 1], [-1, -1]], dtype=np.int32)
+
+@lru_cache(maxsize=None)
+def genotype_lookup_table(max_allele):
+    """
+    Build a flat lookup table of genotype strings for allele indexes up to max_allele.
+
+    Alleles are offset by 2 so that vector-end (-2) and missing (-1) get their own
+    slots: a/b is stored at (a + 2) * (max_allele + 3) + (b + 2).
+    """
+    width = max_allele + 3
+    table = np.empty(width * width, dtype=object)
+    for a in range(-2, max_allele + 1):
+        for b in range(-2, max_allele + 1):
+            if b == -2:
+                # Haploid call: second allele is the vector-end marker
+                genotype = '.' if a < 0 else str(a)
+            elif a < 0 or b < 0:
+                genotype = './.'  # Missing genotype
+            else:
+                genotype = f"{a}/{b}"
+            table[(a + 2) * width + (b + 2)] = genotype
+    return table
+
+def genotype_alleles(gt_array, sample_index=None):
+    """
+    Extract the (first, second) allele indexes of each sample from a cyvcf2 genotype array.
+
+    Haploid calls get -2 (vector-end) as their second allele and values below -2 are clamped.
+
+    Returns:
+        np.ndarray: int32 array of shape (samples, 2).
+    """
+    if sample_index is not None:
+        gt_array = gt_array[sample_index]
+    if gt_array.shape[1] < 3:
+        # All-haploid record: pad the missing second allele with vector-end
+        alleles = np.full((gt_array.shape[0], 2), -2, dtype=np.int32)
+        alleles[:, 0] = gt_array[:, 0]
+    else:
+        alleles = gt_array[:, :2].astype(np.int32)
+    np.maximum(alleles, -2, out=alleles)
+    return alleles
+
+def split_alleles(alleles, alt_count):
+    """
+    Split a record's allele pair array into one array per ALT allele, as bcftools norm -m-
+    splits multi-allelic records: in the array of ALT allele k, k becomes 1 and the other
+    ALT alleles become 0 (reference); missing and vector-end values are kept.
+
+    Returns:
+        list: alt_count allele pair arrays (the array itself for a single ALT).
+    """
+    if alt_count <= 1:
+        return [alleles]
+    return [np.where(alleles == k, 1, np.where(alleles > 0, 0, alleles)) for k in range(1, alt_count + 1)]
+
+def alleles_to_strings(alleles):
+    """
+    Convert an allele pair array to genotype strings ('0/1', './.', '1', ...).
+    """
+    max_allele = max(int(alleles.max(initial=0)), 1)
+    width = max_allele + 3
+    codes = (alleles[:, 0] + 2) * width + (alleles[:, 1] + 2)
+    return genotype_lookup_table(max_allele)[codes].tolist()
+
+def pack_alleles(alleles, compress=False):
+    """
+    Pack an allele pair array into a genotype blob, using the smallest format that fits.
+    """
+    sample_count = alleles.shape[0]
+    first, second = alleles[:, 0], alleles[:, 1]
+    missing = (first < 0) | (second < 0)
+    if not (second == -2).any() and (missing | ((first <= second) & (second <= 1))).all():
+        codes = np.where(missing, 3, first + second).astype(np.uint8)
+        codes = np.concatenate([codes, np.zeros(-sample_count % 4, dtype=np.uint8)]).reshape(-1, 4)
+        payload = (codes[:, 0] | codes[:, 1] << 2 | codes[:, 2] << 4 | codes[:, 3] << 6).tobytes()
+        genotype_format = GENOTYPE_FORMAT_2BIT
+    elif alleles.max(initial=0) <= 13:
+        payload = ((first + 2) << 4 | (second + 2)).astype(np.uint8).tobytes()
+        genotype_format = GENOTYPE_FORMAT_NIBBLE
+    else:
+        payload = (alleles + 2).astype('<u2').tobytes()
+        genotype_format = GENOTYPE_FORMAT_WIDE
+
+    if compress:
+        payload = zlib.compress(payload)
+        genotype_format |= GENOTYPE_COMPRESSED_FLAG
+    return GENOTYPE_HEADER.pack(genotype_format, sample_count) + payload
+
+def unpack_alleles(blob):
+    """
+    Unpack a genotype blob into an int32 allele pair array of shape (samples, 2).
+    """
+    genotype_format, sample_count = GENOTYPE_HEADER.unpack_from(blob)
+    payload = blob[GENOTYPE_HEADER.size:]
+    if genotype_format & GENOTYPE_COMPRESSED_FLAG:
+        payload = zlib.decompress(payload)
+        genotype_format &= ~GENOTYPE_COMPRESSED_FLAG
+
+    data = np.frombuffer(payload, dtype=np.uint8)
+    if genotype_format == GENOTYPE_FORMAT_2BIT:
+        codes = np.stack([data & 3, data >> 2 & 3, data >> 4 & 3, data >> 6], axis=1).reshape(-1)
+        return TWO_BIT_ALLELES[codes[:sample_count]]
+    if genotype_format == GENOTYPE_FORMAT_NIBBLE:
+        return np.stack([data >> 4, data & 15], axis=1).astype(np.int32) - 2
+    if genotype_format == GENOTYPE_FORMAT_WIDE:
+        return np.frombuffer(payload, dtype='<u2').reshape(-1, 2).astype(np.int32) - 2
+    raise ValueError(f"Unknown genotype blob format {genotype_format}")
+
+def decode_genotypes(blob):
+    """
+    Decode a genotype blob into genotype strings in sample-set order.
+    """
+    return alleles_to_strings(unpack_alleles(blob))
+
+def genotype_at(blob, index):
+    """
+    Return the genotype string of the sample at position index of the blob's sample set.
+    """
+    genotype_format, sample_count = GENOTYPE_HEADER.unpack_from(blob)
+    if not 0 <= index < sample_count:
+        return None
+    if genotype_format == GENOTYPE_FORMAT_2BIT:
+        code = blob[GENOTYPE_HEADER.size + index // 4] >> (index % 4 * 2) & 3
+        alleles = TWO_BIT_ALLELES[code:code + 1]
+    elif genotype_format == GENOTYPE_FORMAT_NIBBLE:
+        value = blob[GENOTYPE_HEADER.size + index]
+        alleles = np.array([[(value >> 4) - 2, (value & 15) - 2]], dtype=np.int32)
+    else:
+        alleles = unpack_alleles(blob)[index:index + 1]
+    return alleles_to_strings(alleles)[0]
+
+# ---------------------------- SQL Functions ---------------------------- #
+
+@lru_cache(maxsize=64)
+def sample_positions(sample_ids):
+    """
+    Map each sample_id of a sample set (JSON list from sample_sets.sample_ids) to its blob position.
+    """
+    return {sample_id: position for position, sample_id in enumerate(json.loads(sample_ids))}
+
+def sql_sample_genotype(blob, sample_ids, sample_id):
+    """
+    SQL function sample_genotype(genotypes, sample_ids, sample_id): one sample's genotype string.
+    """
+    if blob is None or sample_ids is None:
+        return None
+    position = sample_positions(sample_ids).get(sample_id)
+    return None if position is None else genotype_at(blob, position)
+
+def sql_genotype_at(blob, index):
+    """
+    SQL function genotype_at(genotypes, index): genotype string at a 0-based blob position.
+    """
+    return None if blob is None or index is None else genotype_at(blob, index)
+
+def sql_decode_genotypes(blob):
+    """
+    SQL function decode_genotypes(genotypes): all genotype strings as a JSON list.
+    """
+    return None if blob is None else json.dumps(decode_genotypes(blob))
+
+def register_genotype_functions(conn):
+    """
+    Register the packed-genotype SQL functions on a connection:
+    sample_genotype(genotypes, sample_ids, sample_id), genotype_at(genotypes, index)
+    and decode_genotypes(genotypes).
+    """
+    conn.create_function('sample_genotype', 3, sql_sample_genotype, deterministic=True)
+    conn.create_function('genotype_at', 2, sql_genotype_at, deterministic=True)
+    conn.create_function('decode_genotypes', 1, sql_decode_genotypes, deterministic=True)
+
+def load_variant_genotypes(conn, variant_id):
+    """
+    Decode the packed genotypes stored for a variant.
+
+    Returns:
+        dict: sample_name -> genotype string. A sample found in several sample sets keeps
+        the genotype written first, as INSERT OR IGNORE does in the genotype table.
+    """
+    sample_names = dict(conn.execute("SELECT sample_id, sample_name FROM samples"))
+    genotypes = {}
+    for sample_ids, blob in conn.execute("""
+        SELECT sample_sets.sample_ids, genotype_matrix.genotypes
+        FROM genotype_matrix
+        JOIN sample_sets ON sample_sets.sample_set_id = genotype_matrix.sample_set_id
+        WHERE genotype_matrix.variant_id = ?
+        ORDER BY genotype_matrix.rowid
+    """, (variant_id,)):
+        for sample_id, genotype in zip(json.loads(sample_ids), decode_genotypes(blob)):
+            genotypes.setdefault(sample_names.get(sample_id, sample_id), genotype)
+    return genotypes
@@ -0,0 +1,152 @@
+import re
+import logging
+import numpy as np
+
+
+# ---------------------------- INFO Column Projection ---------------------------- #
+
+# SQLite column types of the VCF header's INFO Types; a Flag is stored as 0/1
+INFO_SQL_TYPES = {
+    'Integer': 'INTEGER',
+    'Float': 'REAL',
+    'Flag': 'INTEGER',
+    'String': 'TEXT',
+    'Character': 'TEXT',
+}
+
+# INFO IDs usable as column names as they are
+COLUMN_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def quote_column(name):
+    """
+    Quote a column name for SQL, as INFO IDs may be SQL keywords (e.g. END, GROUP).
+    """
+    return f'"{name}"'
+
+def info_field_kind(info_type, info_number):
+    """
+    Return how an INFO field is decoded into one value per ALT allele:
+    'flag' (0/1), 'scalar' (Number=1), 'allele' (Number=A, the ALT's own value),
+    'ref_allele' (Number=R, the ALT's own value after the REF one) or
+    'list' (any other Number, comma-joined text).
+    """
+    if info_type == 'Flag':
+        return 'flag'
+    return {'1': 'scalar', 'A': 'allele', 'R': 'ref_allele'}.get(info_number, 'list')
+
+def header_info_fields(vcf, fields=None, reserved=()):
+    """
+    Read the INFO definitions of a VCF header for the fields to project into columns.
+
+    Args:
+        vcf (cyvcf2.VCF): Opened VCF file.
+        fields (list): INFO IDs to project, or None for every declared INFO field.
+            Listed fields missing from the header are not projected.
+        reserved (iterable): Column names INFO fields may not take (compared case-insensitively).
+
+    Returns:
+        list: One dict per projected field with 'id', 'kind', 'sql_type', 'type',
+        'number' and 'description', in header order.
+    """
+    wanted = None if fields is None else set(fields)
+    reserved = {name.lower() for name in reserved}
+    info_fields = []
+    for header in vcf.header_iter():
+        if header['HeaderType'] != 'INFO':
+            continue
+        definition = header.info()
+        info_id = definition['ID']
+        if wanted is not None and info_id not in wanted:
+            continue
+        if not COLUMN_NAME_PATTERN.match(info_id) or info_id.lower() in reserved:
+            logging.warning(f"INFO field '{info_id}' cannot be stored in its own column, keeping it in 'info'.")
+            continue
+        kind = info_field_kind(definition.get('Type'), definition.get('Number'))
+        info_fields.append({
+            'id': info_id,
+            'kind': kind,
+            'sql_type': 'TEXT' if kind == 'list' else INFO_SQL_TYPES.get(definition.get('Type'), 'TEXT'),
+            'type': definition.get('Type'),
+            'number': definition.get('Number'),
+            'description': definition.get('Description', '').strip('"'),
+        })
+    return info_fields
+
+def ensure_info_columns(cursor, info_fields, schema='main'):
+    """
+    Add a typed variants column for each INFO field that has none yet and record the
+    field's header definition in info_columns.
+    """
+    existing = {row[1].lower() for row in cursor.execute(f"PRAGMA {schema}.table_info(variants)")}
+    for field in info_fields:
+        if field['id'].lower() not in existing:
+            cursor.execute(
+                f"ALTER TABLE {schema}.variants ADD COLUMN {quote_column(field['id'])} {field['sql_type']}"
+            )
+            existing.add(field['id'].lower())
+            logging.info(f"Added {field['sql_type']} column '{field['id']}' for INFO field '{field['id']}'.")
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO {schema}.info_columns (column_name, info_type, info_number, description)
+            VALUES (?, ?, ?, ?)
+        """, (field['id'], field['type'], field['number'], field['description']))
+
+def load_info_fields(cursor, schema='main'):
+    """
+    Rebuild the INFO field dicts of the columns recorded in info_columns.
+    """
+    info_fields = []
+    for column_name, info_type, info_number, description in cursor.execute(
+            f"SELECT column_name, info_type, info_number, description FROM {schema}.info_columns"):
+        kind = info_field_kind(info_type, info_number)
+        info_fields.append({
+            'id': column_name,
+            'kind': kind,
+            'sql_type': 'TEXT' if kind == 'list' else INFO_SQL_TYPES.get(info_type, 'TEXT'),
+            'type': info_type,
+            'number': info_number,
+            'description': description,
+        })
+    return info_fields
+
+def plain_value(value):
+    """
+    Convert a numpy scalar from cyvcf2 to the equivalent Python value.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+def info_values(info, info_fields, allele_count):
+    """
+    Decode the projected INFO fields of a record into one value tuple per ALT allele.
+
+    Only the projected fields are decoded (one INFO.get each).
+
+    Args:
+        info: cyvcf2 ``variant.INFO``.
+        info_fields (list): Field dicts from header_info_fields.
+        allele_count (int): Number of variants rows of the record.
+
+    Returns:
+        list: allele_count tuples of values in info_fields order.
+    """
+    columns = []
+    for field in info_fields:
+        value = info.get(field['id'])
+        kind = field['kind']
+        if kind == 'flag':
+            columns.append([int(bool(value))] * allele_count)
+        elif value is None:
+            columns.append([None] * allele_count)
+        elif kind == 'scalar':
+            columns.append([plain_value(value[0] if isinstance(value, tuple) else value)] * allele_count)
+        elif kind == 'list':
+            text = ','.join(str(plain_value(v)) for v in value) if isinstance(value, tuple) else plain_value(value)
+            columns.append([text] * allele_count)
+        else:
+            # Number=A / Number=R: cyvcf2 returns a scalar when there is a single value
+            values = value if isinstance(value, tuple) else (value,)
+            offset = 1 if kind == 'ref_allele' else 0
+            columns.append([
+                plain_value(values[index + offset]) if index + offset < len(values) else None
+                for index in range(allele_count)
+            ])
+    return list(zip(*columns)) if columns else [()] * allele_count
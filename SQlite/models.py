@@ -4,7 +4,22 @@ from cyvcf2 import VCF
 import os
 import sys
 import logging
+import time
+import multiprocessing
+import queue
+import hashlib
+from functools import lru_cache
+from itertools import chain
+from datetime import datetime, timezone
 import numpy as np
+from genomic_regions import normalize_chrom, region_bin
+from carrier_index import build_carrier_index
+from info_columns import header_info_fields, ensure_info_columns, load_info_fields, info_values, quote_column
+from payload_store import compress_payloads, register_payload_functions, decode_payload
+from genotype_store import (
+    genotype_alleles, split_alleles, alleles_to_strings, pack_alleles, unpack_alleles,
+    GENOTYPE_HEADER, register_genotype_functions
+)
 
 
 # ---------------------------- Configuration ---------------------------- #
@@ -21,6 +36,97 @@ DATABASE_PATH = 'genomic_variants.db'
 # Log file path
 LOG_FILE = 'insert_vcfs.log'
 
+# Ingest mode: 'row' inserts one variant/genotype at a time, 'batched' buffers
+# rows and flushes them with executemany, 'parallel' parses files in worker
+# processes and writes their batches from a single writer, 'sharded' splits
+# indexed files into genomic regions ingested in parallel
+INGEST_MODE = 'batched'
+
+# Maximum number of buffered variant + genotype rows before a batch is flushed
+INGEST_BATCH_SIZE = 50000
+
+# 'parallel' mode: number of VCF parsing worker processes and the maximum number of
+# row batches waiting for the single writer
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+INGEST_QUEUE_DEPTH = 16
+
+# 'sharded' mode: indexed (.tbi/.csi) VCF.GZ files are split into regions of
+# SHARD_WINDOW_SIZE bp (None for one region per contig), each ingested by its own
+# worker into a shard database under SHARD_DIRECTORY and merged afterwards
+SHARD_WINDOW_SIZE = 10_000_000
+SHARD_DIRECTORY = 'shards'
+
+# ClinVar join: 'merge' walks the ClinVar VCF and the variants table in coordinate
+# order (falling back to a hash join for unsorted input), 'lookup' runs one
+# SELECT per ClinVar allele
+CLINVAR_JOIN_MODE = 'merge'
+
+# Genotype store: 'rows' writes one genotype row per variant and sample, 'packed'
+# writes one blob per variant and VCF sample set (2 bits or 1 byte per sample, see
+# genotype_store.py), 'packed_zlib' additionally zlib-compresses each blob
+GENOTYPE_STORE = 'rows'
+
+# Build the carrier index (per-variant sample bitmaps and per-sample variant bitmaps,
+# see carrier_index.py) after the VCF files are loaded
+CARRIER_INDEX = True
+
+# Incremental ingest: keep the existing tables and only ingest files that are new or
+# changed since the last run (per the ingest_manifest table), merging their samples
+# and variants into the database. False drops and rebuilds every table.
+INCREMENTAL_INGEST = False
+
+# Checkpointed ingest ('row', 'batched' and 'parallel' modes): commit every
+# CHECKPOINT_INTERVAL VCF records together with the file's position in the
+# ingest_checkpoints table, so that a load interrupted by a crash resumes from its
+# last checkpoint on the next run. None keeps one transaction per file.
+CHECKPOINT_INTERVAL = None
+
+# INFO fields stored in their own typed variants columns, typed from the ##INFO
+# header lines (Integer/Flag -> INTEGER, Float -> REAL, String -> TEXT; Number=A/R
+# fields get each ALT's own value). A column is added the first time a file declares
+# one of these fields. None projects every INFO field declared in the header.
+INFO_COLUMNS = ['DP', 'AF', 'AC', 'AN', 'ExcessHet', 'FS', 'MLEAC', 'MLEAF', 'MQ', 'QD', 'SOR', 'RS']
+
+# The other INFO fields (ANN has its own column): 'raw' keeps them as VCF KEY=VALUE text
+# in the info column, 'json' keeps them as a JSON object, 'skip' leaves info empty
+INFO_REMAINDER = 'raw'
+
+# Compressed payloads: None keeps the info and ANN columns as text; 'zlib' (or 'zstd',
+# which needs the zstandard package) compresses them once the files are loaded, with a
+# per-column dictionary trained on PAYLOAD_DICTIONARY_SAMPLES random values of at most
+# PAYLOAD_DICTIONARY_SIZE bytes (see payload_store.py)
+PAYLOAD_COMPRESSION = None
+PAYLOAD_DICTIONARY_SIZE = 32768
+PAYLOAD_DICTIONARY_SAMPLES = 5000
+
+# ClinVar text columns indexed for substring search in the clinvar_search FTS5 table
+# (trigram tokenizer), which serves the browser's contains / starts_with / ends_with
+CLINVAR_SEARCH_COLUMNS = ['clinical_significance', 'condition', 'CLNSIG', 'GENEINFO', 'MC',
+                          'CLNDISDB', 'CLNDN', 'CLNHGVS']
+
+# Maximum number of (chrom, pos, ref, alt) -> variant_id entries cached during an
+# ingest (about 25-50 bytes each, see VariantIdCache); the cache is emptied and
+# refilled when it grows past this size
+VARIANT_ID_CACHE_SIZE = 20_000_000
+
+# Bulk-load mode: load with BULK_LOAD_PRAGMAS and, for new tables, without the
+# secondary indexes; the indexes are built once the data is in, followed by ANALYZE
+# and DURABLE_PRAGMAS. synchronous = OFF survives a crash of the ingest process but
+# not of the machine, so rebuild (or resume) after a power loss.
+BULK_LOAD = False
+BULK_LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # Negative values are KiB: 256 MiB page cache
+    'temp_store': 'MEMORY',
+}
+DURABLE_PRAGMAS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size': -2000,
+    'temp_store': 'DEFAULT',
+}
+
 # ---------------------------- Logging Setup ---------------------------- #
 
 logging.basicConfig(
@@ -48,17 +154,6 @@ def serialize_info(info):
 
     return {k: convert(v) for k, v in info.items()}
 
-def normalize_chrom(chrom):
-    """
-    Normalize chromosome names by removing 'chr' prefix if present and converting to uppercase.
-    """
-    chrom = chrom.strip()
-    if chrom.lower().startswith('chr'):
-        chrom = chrom[3:]
-    if chrom.upper() == 'M':
-        return 'MT'
-    return chrom.upper()
-
 def connect_db(db_path=DATABASE_PATH):
     """
     Connect to the SQLite database.
@@ -66,24 +161,44 @@ def connect_db(db_path=DATABASE_PATH):
     try:
         conn = sqlite3.connect(db_path)
         conn.execute("PRAGMA foreign_keys = ON;")
+        register_genotype_functions(conn)
+        register_payload_functions(conn)
         logging.info(f"Connected to SQLite database at {db_path}.")
         return conn
     except sqlite3.Error as e:
         logging.error(f"Error connecting to database: {e}")
         sys.exit(1)
 
-def initialize_database(conn):
+def initialize_database(conn, rebuild=True, create_indexes=True):
     """
     Initialize the database by creating necessary tables and indexes.
+
+    With rebuild=False, existing tables and their rows are kept (incremental ingest).
+    With create_indexes=False, the secondary indexes are left to create_secondary_indexes
+    (bulk load); lookups during ingest only need the UNIQUE constraints' indexes.
     """
     cursor = conn.cursor()
     try:
-        cursor.executescript("""
-        DROP TABLE IF EXISTS variants;
-        DROP TABLE IF EXISTS samples;
-        DROP TABLE IF EXISTS genotype;
-        DROP TABLE IF EXISTS clinvar_annotations;
+        if rebuild:
+            cursor.executescript("""
+            DROP TABLE IF EXISTS variants;
+            DROP TABLE IF EXISTS samples;
+            DROP TABLE IF EXISTS genotype;
+            DROP TABLE IF EXISTS clinvar_annotations;
+            DROP TABLE IF EXISTS genotype_matrix;
+            DROP TABLE IF EXISTS sample_sets;
+            DROP TABLE IF EXISTS variant_carriers;
+            DROP TABLE IF EXISTS sample_carriers;
+            DROP TABLE IF EXISTS ingest_manifest;
+            DROP TABLE IF EXISTS ingest_checkpoints;
+            DROP TABLE IF EXISTS info_columns;
+            DROP TABLE IF EXISTS payload_dictionaries;
+            DROP TABLE IF EXISTS variant_annotations;
+            DROP TABLE IF EXISTS variant_ann_display;
+            DROP TABLE IF EXISTS clinvar_search;
+            """)
 
+        cursor.executescript("""
         CREATE TABLE IF NOT EXISTS variants (
             variant_id INTEGER PRIMARY KEY AUTOINCREMENT,
             chrom TEXT NOT NULL,
@@ -106,9 +221,44 @@ def initialize_database(conn):
             SOR REAL,
             ANN TEXT,
             RS INTEGER,
+            end_pos INTEGER,
+            bin INTEGER,
             UNIQUE(chrom, pos, ref, alt)
         );
 
+        -- INFO fields projected into variants columns (INFO_COLUMNS) and their header definition
+        CREATE TABLE IF NOT EXISTS info_columns (
+            column_name TEXT PRIMARY KEY,
+            info_type TEXT,
+            info_number TEXT,
+            description TEXT
+        );
+
+        -- Dictionaries of the compressed info / ANN payloads, keyed by their CRC-32
+        CREATE TABLE IF NOT EXISTS payload_dictionaries (
+            dictionary_id INTEGER PRIMARY KEY,
+            column_name TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            dictionary BLOB NOT NULL,
+            created_at TEXT NOT NULL
+        );
+
+        -- Functional annotation: one row per ANN entry (and consequence term) of a variant
+        CREATE TABLE IF NOT EXISTS variant_annotations (
+            annotation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            variant_id INTEGER NOT NULL,
+            allele TEXT,
+            consequence TEXT,
+            impact TEXT,
+            gene TEXT,
+            gene_id TEXT,
+            transcript TEXT,
+            biotype TEXT,
+            hgvs_c TEXT,
+            hgvs_p TEXT,
+            FOREIGN KEY (variant_id) REFERENCES variants(variant_id)
+        );
+
         CREATE TABLE IF NOT EXISTS samples (
             sample_id INTEGER PRIMARY KEY AUTOINCREMENT,
             sample_name TEXT UNIQUE NOT NULL
@@ -124,6 +274,22 @@ def initialize_database(conn):
             UNIQUE(variant_id, sample_id)
         );
 
+        -- Ordered sample_ids (JSON list) of a VCF file, the column order of packed genotype blobs
+        CREATE TABLE IF NOT EXISTS sample_sets (
+            sample_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sample_ids TEXT UNIQUE NOT NULL
+        );
+
+        -- Packed genotypes: one blob per variant and sample set, rowid in insertion order
+        CREATE TABLE IF NOT EXISTS genotype_matrix (
+            variant_id INTEGER NOT NULL,
+            sample_set_id INTEGER NOT NULL,
+            genotypes BLOB NOT NULL,
+            FOREIGN KEY (variant_id) REFERENCES variants(variant_id),
+            FOREIGN KEY (sample_set_id) REFERENCES sample_sets(sample_set_id),
+            PRIMARY KEY (variant_id, sample_set_id)
+        );
+
         CREATE TABLE IF NOT EXISTS clinvar_annotations (
             annotation_id INTEGER PRIMARY KEY AUTOINCREMENT,
             variant_id INTEGER NOT NULL,
@@ -147,13 +313,85 @@ def initialize_database(conn):
             UNIQUE(variant_id)
         );
 
+        -- Carrier index: het / hom-alt sample_id bitmaps per variant
+        CREATE TABLE IF NOT EXISTS variant_carriers (
+            variant_id INTEGER PRIMARY KEY,
+            het BLOB,
+            hom_alt BLOB,
+            FOREIGN KEY (variant_id) REFERENCES variants(variant_id)
+        );
+
+        -- Carrier index: variant_id bitmaps per sample, state ('het', 'hom_alt', 'called')
+        -- and block of CARRIER_BLOCK_SIZE variant_ids
+        CREATE TABLE IF NOT EXISTS sample_carriers (
+            sample_id INTEGER NOT NULL,
+            state TEXT NOT NULL,
+            block INTEGER NOT NULL,
+            bitmap BLOB NOT NULL,
+            FOREIGN KEY (sample_id) REFERENCES samples(sample_id),
+            PRIMARY KEY (sample_id, state, block)
+        ) WITHOUT ROWID;
+
+        -- Files ingested so far, used by incremental ingest to skip unchanged files
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            variant_count INTEGER,
+            genotype_count INTEGER,
+            ingested_at TEXT NOT NULL
+        );
+
+        -- Position reached by checkpointed ingest in files not yet in ingest_manifest:
+        -- the number of VCF records written, the last of them and how many of them
+        -- are at its position
+        CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            record_count INTEGER NOT NULL,
+            chrom TEXT,
+            pos INTEGER,
+            pos_record_count INTEGER,
+            variant_count INTEGER NOT NULL,
+            genotype_count INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL
+        );
+
+        -- Kept across rebuilds so the generation number only ever increases
+        CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        );
+
         -- Create indexes
-        CREATE INDEX IF NOT EXISTS idx_variants_chrom_pos ON variants (chrom, pos);
-        CREATE INDEX IF NOT EXISTS idx_variants_chrom_pos_ref_alt ON variants (chrom, pos, ref, alt);
-        CREATE INDEX IF NOT EXISTS idx_clinvar_variant_id ON clinvar_annotations (variant_id);
-        CREATE INDEX IF NOT EXISTS idx_genotype_variant_id ON genotype (variant_id);
-        CREATE INDEX IF NOT EXISTS idx_genotype_sample_id ON genotype (sample_id);
+        -- Duplicates of the UNIQUE constraints' indexes, dropped from older databases
+        DROP INDEX IF EXISTS idx_variants_chrom_pos_ref_alt;
+        DROP INDEX IF EXISTS idx_clinvar_variant_id;
+        DROP INDEX IF EXISTS idx_genotype_variant_id;
         """)
+        # ANN display fields of each variant; column names come from ANN_KEYS (e.g. "ann_HGVS.c")
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS variant_ann_display (
+                variant_id INTEGER PRIMARY KEY,
+                {', '.join(f'{quote_column(column)} TEXT' for column in ANN_DISPLAY_COLUMNS)},
+                FOREIGN KEY (variant_id) REFERENCES variants(variant_id)
+            )
+        """)
+        # Older databases have an ann_WARNINGS column, a field ANN entries do not have
+        display_columns = {row[1] for row in cursor.execute("PRAGMA table_info(variant_ann_display)")}
+        for column in display_columns - set(ANN_DISPLAY_COLUMNS) - {'variant_id'}:
+            cursor.execute(f"ALTER TABLE variant_ann_display DROP COLUMN {quote_column(column)}")
+        # Checkpoints of older databases lack pos_record_count; their files resume by re-reading
+        checkpoint_columns = {row[1] for row in cursor.execute("PRAGMA table_info(ingest_checkpoints)")}
+        if 'pos_record_count' not in checkpoint_columns:
+            cursor.execute("ALTER TABLE ingest_checkpoints ADD COLUMN pos_record_count INTEGER")
+        create_clinvar_search_index(conn)
+        if create_indexes:
+            create_secondary_indexes(conn)
+        bump_generation(conn)
         conn.commit()
         logging.info("Database initialized successfully with required tables and indexes.")
     except sqlite3.Error as e:
@@ -163,6 +401,69 @@ def initialize_database(conn):
     finally:
         cursor.close()
 
+# Indexes serving the browsers' queries; lookups during ingest go through the
+# UNIQUE constraints' own indexes
+SECONDARY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_variants_chrom_pos ON variants (chrom, pos)",
+    "CREATE INDEX IF NOT EXISTS idx_variants_chrom_bin ON variants (chrom, bin, pos)",
+    "CREATE INDEX IF NOT EXISTS idx_genotype_sample_id ON genotype (sample_id)",
+    "CREATE INDEX IF NOT EXISTS idx_annotations_gene_impact ON variant_annotations (gene, impact)",
+    "CREATE INDEX IF NOT EXISTS idx_annotations_consequence_impact ON variant_annotations (consequence, impact)",
+    "CREATE INDEX IF NOT EXISTS idx_annotations_variant_id ON variant_annotations (variant_id)",
+]
+
+def create_secondary_indexes(conn):
+    """
+    Create the indexes used by the browsers' queries (not needed while loading).
+    """
+    for index_sql in SECONDARY_INDEXES:
+        conn.execute(index_sql)
+    conn.commit()
+
+def apply_pragmas(conn, pragmas):
+    """
+    Apply a dict of PRAGMA settings (BULK_LOAD_PRAGMAS or DURABLE_PRAGMAS) to a connection.
+    """
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+def finish_bulk_load(conn):
+    """
+    Build the deferred secondary indexes, run ANALYZE and restore DURABLE_PRAGMAS.
+
+    Returns:
+        float: Seconds spent building the indexes and running ANALYZE.
+    """
+    start_time = time.perf_counter()
+    create_secondary_indexes(conn)
+    index_elapsed = time.perf_counter() - start_time
+    conn.execute("ANALYZE")
+    conn.commit()
+    apply_pragmas(conn, DURABLE_PRAGMAS)
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"Index build phase took {elapsed:.2f}s (indexes {index_elapsed:.2f}s, "
+                 f"ANALYZE {elapsed - index_elapsed:.2f}s)")
+    return elapsed
+
+def bump_generation(conn):
+    """
+    Increment the database generation number so readers drop results cached for older contents.
+    """
+    conn.execute("""
+        INSERT INTO metadata (key, value) VALUES ('generation', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+    """)
+    conn.commit()
+
+# Fields of an ANN entry, in their '|'-separated order (the 16 fields of the SnpEff
+# ANN format; the last one holds the entry's ERRORS / WARNINGS / INFO messages)
+ANN_KEYS = [
+    'Allele', 'Consequence', 'Impact', 'Symbol',
+    'Gene', 'Feature_type', 'Feature', 'Biotype',
+    'Rank', 'HGVS.c', 'HGVS.p', 'cDNA_position', 'CDS_position',
+    'Protein_position', 'Distance', 'ERRORS'
+]
+
 def parse_ann_field(ann_field):
     """
     Parse the ANN field into a list of dictionaries.
@@ -176,20 +477,188 @@ def parse_ann_field(ann_field):
 
         for ann_entry in ann_entries:
             ann_parts = ann_entry.split('|')
-            ann_keys = [
-                'Allele', 'Consequence', 'Impact', 'Symbol',
-                'Gene', 'Feature_type', 'Feature', 'Biotype',
-                'Rank', 'HGVS.c', 'HGVS.p', 'cDNA_position', 'CDS_position',
-                'Protein_position', 'Distance', 'ERRORS', 'WARNINGS'
-            ]
-            ann_dict = dict(zip(ann_keys, ann_parts))
+            ann_dict = dict(zip(ANN_KEYS, ann_parts))
             annotations.append(ann_dict)
     return annotations
 
-def insert_variant(cursor, variant):
+# variant_ann_display columns: the fields of a variant's first ANN entry as the
+# listing pages show them, so the app does not parse ANN per request
+ANN_DISPLAY_COLUMNS = [f"ann_{key}" for key in ANN_KEYS]
+
+# variant_annotations columns and the parse_ann_field keys they are read from
+ANNOTATION_FIELDS = {
+    'allele': 'Allele',
+    'consequence': 'Consequence',
+    'impact': 'Impact',
+    'gene': 'Symbol',
+    'gene_id': 'Gene',
+    'transcript': 'Feature',
+    'biotype': 'Biotype',
+    'hgvs_c': 'HGVS.c',
+    'hgvs_p': 'HGVS.p',
+}
+
+def build_annotation_rows(variant_id, alt, annotations):
     """
-    Insert a variant into the variants table with normalized chromosome names and serialized INFO field.
-    Also extract specific INFO fields into separate columns.
+    Build the variant_annotations rows of a variants row from its parsed ANN entries.
+
+    Entries whose Allele is the row's ALT belong to it; if none match (e.g. the
+    annotator wrote the allele differently), every entry of the record is kept.
+    An entry with several '&'-joined consequences gets one row per consequence, so
+    each consequence term can be looked up through the index. Empty fields are NULL.
+    """
+    matching = [entry for entry in annotations if entry.get('Allele') == alt]
+    rows = []
+    for entry in matching or annotations:
+        values = {column: entry.get(key) or None for column, key in ANNOTATION_FIELDS.items()}
+        for consequence in (values['consequence'] or '').split('&'):
+            values['consequence'] = consequence or None
+            rows.append((variant_id,) + tuple(values.values()))
+    return rows
+
+def build_variant_annotations(conn, batch_size=INGEST_BATCH_SIZE, rebuild=False):
+    """
+    Write the variant_annotations and variant_ann_display rows of the variants added
+    since the last run, or with rebuild, of every variant (after existing variants
+    were updated by a changed file).
+
+    The rows are derived from the stored ANN column, so every ingest mode is covered
+    and a variant gets the annotation of the file that inserted it. Variants above the
+    highest variant_id of a table are new to it (variant_ids only grow).
+
+    Returns:
+        int: Number of annotation rows written.
+    """
+    cursor = conn.cursor()
+    write_cursor = conn.cursor()
+    annotation_count = 0
+    columns = ', '.join(ANNOTATION_FIELDS)
+    insert_sql = f"""
+        INSERT INTO variant_annotations (variant_id, {columns})
+        VALUES ({', '.join('?' * (len(ANNOTATION_FIELDS) + 1))})
+    """
+    display_sql = f"""
+        INSERT INTO variant_ann_display (variant_id, {', '.join(quote_column(column) for column in ANN_DISPLAY_COLUMNS)})
+        VALUES ({', '.join('?' * (len(ANN_DISPLAY_COLUMNS) + 1))})
+    """
+    try:
+        conn.execute('BEGIN TRANSACTION')
+        if rebuild:
+            cursor.execute("DELETE FROM variant_annotations")
+            cursor.execute("DELETE FROM variant_ann_display")
+        last_variant_id = cursor.execute("SELECT COALESCE(MAX(variant_id), 0) FROM variant_annotations").fetchone()[0]
+        last_display_id = cursor.execute("SELECT COALESCE(MAX(variant_id), 0) FROM variant_ann_display").fetchone()[0]
+        cursor.execute("""
+            SELECT variant_id, alt, ANN FROM variants
+            WHERE variant_id > ? AND ANN IS NOT NULL
+            ORDER BY variant_id
+        """, (min(last_variant_id, last_display_id),))
+        pending = []
+        pending_display = []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for variant_id, alt, ann in rows:
+                try:
+                    annotations = json.loads(decode_payload(conn, ann))
+                except ValueError as e:
+                    logging.warning(f"Skipping unreadable ANN of variant ID {variant_id}: {e}")
+                    continue
+                if variant_id > last_variant_id:
+                    pending.extend(build_annotation_rows(variant_id, alt, annotations))
+                if variant_id > last_display_id and annotations:
+                    # The listing shows the record's first entry
+                    pending_display.append((variant_id,) + tuple(annotations[0].get(key) for key in ANN_KEYS))
+            write_cursor.executemany(insert_sql, pending)
+            write_cursor.executemany(display_sql, pending_display)
+            annotation_count += len(pending)
+            pending.clear()
+            pending_display.clear()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        write_cursor.close()
+    return annotation_count
+
+# Columns written for each variant row, in build_variant_rows order; the projected
+# INFO columns of the file follow them
+VARIANT_COLUMNS = ['chrom', 'pos', 'ref', 'alt', 'qual', 'filter', 'info', 'ANN', 'end_pos', 'bin']
+
+# Names INFO fields cannot take as columns
+RESERVED_COLUMNS = VARIANT_COLUMNS + ['variant_id']
+
+@lru_cache(maxsize=None)
+def upsert_variant_sql(info_columns=(), update_existing=False):
+    """
+    Build the variants INSERT ... ON CONFLICT statement for the core columns followed
+    by the given INFO columns.
+
+    An existing variant is kept as it is (DO NOTHING), or with update_existing, gets
+    the new values of every written column except its chrom/pos/ref/alt key (DO UPDATE).
+    """
+    columns = VARIANT_COLUMNS + [quote_column(column) for column in info_columns]
+    conflict_action = "DO NOTHING"
+    if update_existing:
+        conflict_action = "DO UPDATE SET " + ', '.join(
+            f"{column} = excluded.{column}" for column in columns[4:]
+        )
+    return f"""
+    INSERT INTO variants ({', '.join(columns)})
+    VALUES ({', '.join('?' * len(columns))})
+    ON CONFLICT (chrom, pos, ref, alt) {conflict_action}
+"""
+
+def file_info_fields(vcf):
+    """
+    Return the INFO fields of a VCF file projected into columns (see INFO_COLUMNS).
+    """
+    return header_info_fields(vcf, INFO_COLUMNS, RESERVED_COLUMNS + ['ANN'])
+
+def format_info_value(value):
+    """
+    Format a decoded INFO value as VCF text; floats use their shortest single-precision
+    form (cyvcf2 decodes Float fields from float32), so 0.1 stays '0.1'.
+    """
+    if isinstance(value, (list, tuple)):
+        return ','.join(format_info_value(v) for v in value)
+    if value is None:
+        return '.'
+    if isinstance(value, float):
+        return str(np.float32(value))
+    return str(value)
+
+def remainder_info(variant, info_fields, mode=None):
+    """
+    Encode the INFO fields that are neither projected into columns nor ANN for the info column.
+
+    'raw' writes them as VCF KEY=VALUE;... text (flags as KEY), 'json' serializes them as
+    a JSON object and 'skip' returns None. Both read the decoded variant.INFO fields;
+    the record is never formatted as a whole line, which would include every sample column.
+    """
+    mode = mode or INFO_REMAINDER
+    if mode == 'skip':
+        return None
+    excluded = {field['id'] for field in info_fields}
+    excluded.add('ANN')
+    if mode == 'json':
+        return json.dumps(serialize_info({
+            key: value for key, value in variant.INFO if key not in excluded
+        }))
+    remainder = ';'.join(
+        key if value is True else f"{key}={format_info_value(value)}"
+        for key, value in variant.INFO if key not in excluded
+    )
+    return remainder or None
+
+def build_variant_rows(variant, info_fields=()):
+    """
+    Build the variants table rows (one per ALT allele) for a VCF record, with normalized
+    chromosome names, the remaining INFO fields (see remainder_info), the parsed ANN field
+    and the values of the projected INFO fields.
     """
     chrom = normalize_chrom(variant.CHROM)
     pos = variant.POS
@@ -198,75 +667,192 @@ def insert_variant(cursor, variant):
     qual = float(variant.QUAL) if variant.QUAL not in ('.', None) else None
     filter_status = ';'.join(variant.FILTER) if variant.FILTER else 'PASS'
 
-    # Serialize INFO field
     try:
-        info_dict = dict(variant.INFO)
-        info_serialized = serialize_info(info_dict)
-        info_json = json.dumps(info_serialized)
+        info = remainder_info(variant, info_fields)
+        allele_values = info_values(variant.INFO, info_fields, len(alt_list))
     except Exception as e:
-        logging.error(f"Failed to serialize INFO field for variant {chrom}:{pos}:{ref}>{','.join(alt_list)}: {e}", exc_info=True)
-        info_serialized = {}
-        info_json = json.dumps(info_serialized)
-
-    # Extract and handle specific INFO fields
-    def handle_field(value, field_name, expected_type):
-        if value is None:
-            return None
-        if isinstance(value, list):
-            logging.debug(f"Field '{field_name}' is a list: {value}. Using first element.")
-            value = value[0]
-        try:
-            return expected_type(value)
-        except ValueError:
-            logging.warning(f"Could not convert field '{field_name}' value '{value}' to {expected_type}. Setting as None.")
-            return None
+        logging.error(f"Failed to decode INFO field for variant {chrom}:{pos}:{ref}>{','.join(alt_list)}: {e}", exc_info=True)
+        info = None
+        allele_values = [(None,) * len(info_fields)] * len(alt_list)
 
-    AC = handle_field(info_serialized.get('AC'), 'AC', int)
-    AF = handle_field(info_serialized.get('AF'), 'AF', float)
-    AN = handle_field(info_serialized.get('AN'), 'AN', int)
-    DP = handle_field(info_serialized.get('DP'), 'DP', int)
-    ExcessHet = handle_field(info_serialized.get('ExcessHet'), 'ExcessHet', float)
-    FS = handle_field(info_serialized.get('FS'), 'FS', float)
-    MLEAC = handle_field(info_serialized.get('MLEAC'), 'MLEAC', int)
-    MLEAF = handle_field(info_serialized.get('MLEAF'), 'MLEAF', float)
-    MQ = handle_field(info_serialized.get('MQ'), 'MQ', float)
-    QD = handle_field(info_serialized.get('QD'), 'QD', float)
-    SOR = handle_field(info_serialized.get('SOR'), 'SOR', float)
-    RS = handle_field(info_serialized.get('RS'), 'RS', int)
-
-    ANN_raw = info_serialized.get('ANN')
+    ANN_raw = variant.INFO.get('ANN')
     ANN_json = None
     if ANN_raw:
         ANN_parsed = parse_ann_field(ANN_raw)
         ANN_json = json.dumps(ANN_parsed)
 
-    variant_id = None
+    # Reference span and UCSC bin for region overlap queries
+    end_pos = pos + max(len(ref), 1) - 1
+    variant_bin = region_bin(pos - 1, end_pos)
 
-    try:
-        for alt in alt_list:
-            cursor.execute("""
-                INSERT INTO variants (
-                    chrom, pos, ref, alt, qual, filter, info, DP, AF, AC, AN,
-                    ExcessHet, FS, MLEAC, MLEAF, MQ, QD, SOR, ANN, RS
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                chrom, pos, ref, alt, qual, filter_status, info_json, DP, AF, AC, AN,
-                ExcessHet, FS, MLEAC, MLEAF, MQ, QD, SOR, ANN_json, RS
-            ))
-            variant_id = cursor.lastrowid
-    except sqlite3.IntegrityError:
-        # Variant already exists
-        cursor.execute("""
-            SELECT variant_id FROM variants
-            WHERE chrom = ? AND pos = ? AND ref = ? AND alt = ?
-        """, (chrom, pos, ref, alt))
-        result = cursor.fetchone()
-        variant_id = result[0] if result else None
-    except Exception as e:
-        logging.error(f"Unexpected error inserting variant {chrom}:{pos}:{ref}>{alt}: {e}", exc_info=True)
-        raise
+    return [
+        (chrom, pos, ref, alt, qual, filter_status, info, ANN_json, end_pos, variant_bin) + values
+        for alt, values in zip(alt_list, allele_values)
+    ]
+
+def variant_key(chrom, pos, ref, alt):
+    """
+    Encode (chrom, pos, ref, alt) as a single tab-separated string, the key hashed by
+    VariantIdCache.
+    """
+    return f"{chrom}\t{pos}\t{ref}\t{alt}"
 
-    return variant_id
+class VariantIdCache:
+    """
+    The ingest's variant_key -> variant_id cache, kept compact: an open-addressing hash
+    table of 64-bit key hashes and variant_ids in two numpy arrays (16 bytes per slot,
+    at most MAX_LOAD full), instead of a dict of key strings (about 130 bytes per entry).
+
+    Only the hashes of the keys are stored, so two keys with the same 64-bit hash
+    (odds of about 1e-5 among 20 million keys) would share a variant_id. The table
+    doubles as it fills and is emptied when it would grow past max_size keys.
+    """
+
+    MAX_LOAD = 0.7
+    INITIAL_SLOTS = 1 << 16
+
+    def __init__(self, max_size=VARIANT_ID_CACHE_SIZE):
+        self.max_size = max_size
+        self.clear()
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.hashes = np.zeros(self.INITIAL_SLOTS, dtype=np.uint64)  # 0 marks an empty slot
+        self.ids = np.zeros(self.INITIAL_SLOTS, dtype=np.int64)
+        self.size = 0
+
+    @staticmethod
+    def key_hash(key):
+        """
+        Return the non-zero 64-bit hash of a variant_key (str hashes are stable within a process).
+        """
+        return (hash(key) & 0xFFFFFFFFFFFFFFFF) or 1
+
+    def get(self, key, default=None):
+        """
+        Return the cached variant_id of a variant_key, or default.
+        """
+        key_hash = self.key_hash(key)
+        mask = len(self.hashes) - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash = self.hashes.item(slot)
+            if slot_hash == key_hash:
+                return self.ids.item(slot)
+            if slot_hash == 0:
+                return default
+            slot = (slot + 1) & mask
+
+    def get_many(self, keys):
+        """
+        Look up a list of variant_keys at once.
+
+        Returns:
+            np.ndarray: int64 variant_id of each key, 0 for keys not in the cache.
+        """
+        hashes = np.fromiter((self.key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+        ids = np.zeros(len(keys), dtype=np.int64)
+        mask = len(self.hashes) - 1
+        slots = (hashes & np.uint64(mask)).astype(np.int64)
+        pending = np.arange(len(keys))
+        while pending.size:
+            slot_hashes = self.hashes[slots[pending]]
+            found = slot_hashes == hashes[pending]
+            ids[pending[found]] = self.ids[slots[pending[found]]]
+            pending = pending[~found & (slot_hashes != 0)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return ids
+
+    def update(self, new_ids):
+        """
+        Add (or overwrite) variant_key -> variant_id entries, emptying the cache first
+        if it would grow past max_size keys.
+        """
+        if not new_ids:
+            return
+        if self.size + len(new_ids) > self.max_size:
+            logging.debug(f"Variant ID cache reached {self.size} keys, emptying it.")
+            self.clear()
+        slot_count = len(self.hashes)
+        while self.size + len(new_ids) > slot_count * self.MAX_LOAD:
+            slot_count *= 2
+        if slot_count != len(self.hashes):
+            old_hashes, old_ids = self.hashes, self.ids
+            occupied = old_hashes != 0
+            self.hashes = np.zeros(slot_count, dtype=np.uint64)
+            self.ids = np.zeros(slot_count, dtype=np.int64)
+            self.size = 0
+            self.place(old_hashes[occupied], old_ids[occupied])
+        self.place(
+            np.fromiter((self.key_hash(key) for key in new_ids), dtype=np.uint64, count=len(new_ids)),
+            np.fromiter(new_ids.values(), dtype=np.int64, count=len(new_ids))
+        )
+
+    def place(self, hashes, ids):
+        """
+        Insert hash -> id entries with vectorized linear probing: every round, each entry
+        takes its slot if it holds its hash or is empty (one entry per empty slot),
+        and the others move to the next slot.
+        """
+        mask = np.uint64(len(self.hashes) - 1)
+        slots = (hashes & mask).astype(np.int64)
+        pending = np.arange(len(hashes))
+        while pending.size:
+            pending_slots = slots[pending]
+            slot_hashes = self.hashes[pending_slots]
+            existing = slot_hashes == hashes[pending]
+            self.ids[pending_slots[existing]] = ids[pending[existing]]
+            empty = np.flatnonzero(slot_hashes == 0)
+            empty_slots, first = np.unique(pending_slots[empty], return_index=True)
+            claimed = pending[empty[first]]
+            self.hashes[empty_slots] = hashes[claimed]
+            self.ids[empty_slots] = ids[claimed]
+            self.size += len(claimed)
+            placed = existing.copy()
+            placed[empty[first]] = True
+            pending = pending[~placed]
+            slots[pending] = (slots[pending] + 1) & int(mask)
+
+def insert_variant(cursor, variant, variant_ids=None, info_fields=(), update_existing=False):
+    """
+    Insert a variant into the variants table with normalized chromosome names and serialized INFO field.
+    Also extract specific INFO fields into separate columns.
+
+    Each ALT allele is looked up in the variant_ids cache, then inserted with
+    ON CONFLICT DO NOTHING RETURNING; an allele already in the table returns no row
+    and is looked up once, so duplicates never raise. info_fields are the file's
+    projected INFO fields (see file_info_fields). With update_existing, every allele
+    is written and an existing one takes the record's values (see upsert_variant_sql).
+
+    Returns:
+        list: variant_id of each ALT allele, in ALT order.
+    """
+    if variant_ids is None:
+        variant_ids = VariantIdCache()
+    upsert_sql = upsert_variant_sql(tuple(field['id'] for field in info_fields), update_existing) + "RETURNING variant_id"
+    allele_ids = []
+    for row in build_variant_rows(variant, info_fields):
+        chrom, pos, ref, alt = row[:4]
+        key = variant_key(chrom, pos, ref, alt)
+        variant_id = None if update_existing else variant_ids.get(key)
+        if variant_id is None:
+            try:
+                result = cursor.execute(upsert_sql, row).fetchone()
+                if result is None:
+                    # Variant already exists
+                    result = cursor.execute("""
+                        SELECT variant_id FROM variants
+                        WHERE chrom = ? AND pos = ? AND ref = ? AND alt = ?
+                    """, (chrom, pos, ref, alt)).fetchone()
+            except Exception as e:
+                logging.error(f"Unexpected error inserting variant {chrom}:{pos}:{ref}>{alt}: {e}", exc_info=True)
+                raise
+            variant_id = result[0]
+            variant_ids.update({key: variant_id})
+        allele_ids.append(variant_id)
+    return allele_ids
 
 def insert_sample(cursor, sample_name, sample_ids):
     """
@@ -276,48 +862,80 @@ def insert_sample(cursor, sample_name, sample_ids):
     if normalized_sample in sample_ids:
         return sample_ids[normalized_sample]
     try:
-        cursor.execute("""
+        result = cursor.execute("""
             INSERT INTO samples (sample_name)
             VALUES (?)
-        """, (normalized_sample,))
-        sample_id = cursor.lastrowid
-        sample_ids[normalized_sample] = sample_id
-    except sqlite3.IntegrityError:
-        # Sample already exists
-        cursor.execute("""
-            SELECT sample_id FROM samples
-            WHERE sample_name = ?
-        """, (normalized_sample,))
-        result = cursor.fetchone()
-        sample_id = result[0] if result else None
-        if sample_id:
-            sample_ids[normalized_sample] = sample_id
-        else:
-            logging.error(f"Failed to retrieve sample ID for '{normalized_sample}'.")
+            ON CONFLICT (sample_name) DO NOTHING
+            RETURNING sample_id
+        """, (normalized_sample,)).fetchone()
+        if result is None:
+            # Sample already exists
+            result = cursor.execute("""
+                SELECT sample_id FROM samples
+                WHERE sample_name = ?
+            """, (normalized_sample,)).fetchone()
     except Exception as e:
         logging.error(f"Unexpected error inserting sample '{normalized_sample}': {e}", exc_info=True)
         raise
+    sample_id = result[0]
+    sample_ids[normalized_sample] = sample_id
     return sample_id
 
-def insert_genotype(cursor, variant_id, sample_id, genotype):
+INSERT_GENOTYPE_SQL = """
+    INSERT INTO genotype (variant_id, sample_id, genotype)
+    VALUES (?, ?, ?)
+    ON CONFLICT (variant_id, sample_id) DO NOTHING
+"""
+
+UPSERT_GENOTYPE_SQL = """
+    INSERT INTO genotype (variant_id, sample_id, genotype)
+    VALUES (?, ?, ?)
+    ON CONFLICT (variant_id, sample_id) DO UPDATE SET genotype = excluded.genotype
+"""
+
+def insert_genotype(cursor, variant_id, sample_id, genotype, update_existing=False):
     """
-    Insert a genotype into the genotype table.
+    Insert a genotype into the genotype table; an existing genotype is kept, or
+    replaced with update_existing.
     """
     try:
-        cursor.execute("""
-            INSERT INTO genotype (variant_id, sample_id, genotype)
-            VALUES (?, ?, ?)
-        """, (variant_id, sample_id, genotype))
-    except sqlite3.IntegrityError:
-        # Genotype already exists
-        pass
+        cursor.execute(UPSERT_GENOTYPE_SQL if update_existing else INSERT_GENOTYPE_SQL,
+                       (variant_id, sample_id, genotype))
     except Exception as e:
         logging.error(f"Unexpected error inserting genotype for variant ID {variant_id}, sample ID {sample_id}: {e}", exc_info=True)
         raise
 
-def insert_clinvar_annotation(cursor, variant_id, clinvar_info):
+INSERT_GENOTYPE_MATRIX_SQL = """
+    INSERT OR IGNORE INTO genotype_matrix (variant_id, sample_set_id, genotypes)
+    VALUES (?, ?, ?)
+"""
+
+UPSERT_GENOTYPE_MATRIX_SQL = """
+    INSERT INTO genotype_matrix (variant_id, sample_set_id, genotypes)
+    VALUES (?, ?, ?)
+    ON CONFLICT (variant_id, sample_set_id) DO UPDATE SET genotypes = excluded.genotypes
+"""
+
+def get_sample_set(cursor, sample_id_list):
     """
-    Insert a ClinVar annotation into the clinvar_annotations table.
+    Return the sample_set_id of an ordered list of sample_ids, inserting it if new.
+    """
+    sample_ids_json = json.dumps(sample_id_list)
+    cursor.execute("INSERT OR IGNORE INTO sample_sets (sample_ids) VALUES (?)", (sample_ids_json,))
+    cursor.execute("SELECT sample_set_id FROM sample_sets WHERE sample_ids = ?", (sample_ids_json,))
+    return cursor.fetchone()[0]
+
+INSERT_CLINVAR_ANNOTATION_SQL = """
+    INSERT OR IGNORE INTO clinvar_annotations (
+        variant_id, clinvar_id, clinical_significance, condition, review_status,
+        CLNREVSTAT, CLNSIG, CLNVC, CLNVCSO, GENEINFO, MC, ORIGIN,
+        ALLELEID, CLNDISDB, CLNDN, CLNHGVS, AF_EXAC
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def build_clinvar_annotation_row(variant_id, clinvar_info):
+    """
+    Build the clinvar_annotations table row for a variant from the ClinVar INFO field.
     """
     def get_value(value):
         if isinstance(value, list):
@@ -375,27 +993,65 @@ def insert_clinvar_annotation(cursor, variant_id, clinvar_info):
     except ValueError:
         AF_EXAC = None
 
+    return (
+        variant_id, clinvar_id, clinical_significance, condition, review_status,
+        CLNREVSTAT, CLNSIG, CLNVC, CLNVCSO, GENEINFO, MC, ORIGIN,
+        ALLELEID, CLNDISDB, CLNDN, CLNHGVS, AF_EXAC
+    )
+
+def insert_clinvar_annotation(cursor, variant_id, clinvar_info):
+    """
+    Insert a ClinVar annotation into the clinvar_annotations table.
+    """
     try:
-        cursor.execute("""
-            INSERT OR IGNORE INTO clinvar_annotations (
-                variant_id, clinvar_id, clinical_significance, condition, review_status,
-                CLNREVSTAT, CLNSIG, CLNVC, CLNVCSO, GENEINFO, MC, ORIGIN,
-                ALLELEID, CLNDISDB, CLNDN, CLNHGVS, AF_EXAC
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            variant_id, clinvar_id, clinical_significance, condition, review_status,
-            CLNREVSTAT, CLNSIG, CLNVC, CLNVCSO, GENEINFO, MC, ORIGIN,
-            ALLELEID, CLNDISDB, CLNDN, CLNHGVS, AF_EXAC
-        ))
+        cursor.execute(INSERT_CLINVAR_ANNOTATION_SQL, build_clinvar_annotation_row(variant_id, clinvar_info))
     except Exception as e:
         logging.error(f"Error inserting ClinVar annotation for variant ID {variant_id}: {e}", exc_info=True)
         raise
 
-def process_vcf(conn, vcf_path, sample_ids):
+def get_sample_columns(samples, sample_ids):
+    """
+    Resolve the VCF sample columns that have a sample_id, once per file.
+
+    Returns:
+        tuple: (np.ndarray of sample column indexes, list of matching sample_ids)
+    """
+    sample_index = []
+    sample_id_list = []
+    for sample_idx, sample in enumerate(samples):
+        normalized_sample = sample.strip()
+        if normalized_sample not in sample_ids:
+            continue  # Skip genotypes for this sample
+        sample_index.append(sample_idx)
+        sample_id_list.append(sample_ids[normalized_sample])
+    return np.asarray(sample_index, dtype=np.intp), sample_id_list
+
+def process_vcf(conn, vcf_path, sample_ids, genotype_store=GENOTYPE_STORE, checkpoint_interval=None,
+                variant_ids=None, update_existing=False):
     """
     Process a single VCF or VCF.GZ file and insert its data into the database.
+
+    variant_ids is the ingest's variant_key -> variant_id cache, shared across files.
+    With update_existing (a changed file ingested again), variants and genotypes
+    already in the database take the file's values instead of keeping theirs.
+
+    With checkpoint_interval, the rows are committed every checkpoint_interval VCF
+    records together with a checkpoint, and a file with a checkpoint resumes after it.
+
+    Returns:
+        tuple: (variant rows, genotypes) written, or None if the file failed.
     """
+    if variant_ids is None:
+        variant_ids = VariantIdCache()
     cursor = conn.cursor()
+    start_time = time.perf_counter()
+    variant_count = 0
+    genotype_count = 0
+    record_count = 0
+    checkpoint = load_checkpoint(conn, vcf_path) if checkpoint_interval else None
+    if checkpoint and checkpoint['done']:
+        logging.info(f"Skipping VCF file finished before the last interruption: {vcf_path}")
+        return checkpoint['variant_count'], checkpoint['genotype_count']
     try:
         conn.execute('BEGIN TRANSACTION')
         logging.info(f"Processing VCF file: {vcf_path}")
@@ -405,41 +1061,296 @@ def process_vcf(conn, vcf_path, sample_ids):
         for sample in vcf.samples:
             insert_sample(cursor, sample, sample_ids)
 
+        sample_index, sample_id_list = get_sample_columns(vcf.samples, sample_ids)
+        if genotype_store != 'rows':
+            sample_set_id = get_sample_set(cursor, sample_id_list)
+        info_fields = file_info_fields(vcf)
+        ensure_info_columns(cursor, info_fields)
+
+        records = vcf
+        last_record = None
+        if checkpoint:
+            records = skip_checkpointed_records(vcf, checkpoint, vcf_path)
+            record_count = checkpoint['record_count']
+            last_record = (checkpoint['chrom'], checkpoint['pos'], checkpoint['pos_record_count'])
+            variant_count = checkpoint['variant_count']
+            genotype_count = checkpoint['genotype_count']
+
         # Insert variants and genotypes
-        for variant in vcf:
-            variant_id = insert_variant(cursor, variant)
-            if variant_id is None:
-                continue  # Skip if variant ID couldn't be retrieved
-
-            for sample_idx, sample in enumerate(vcf.samples):
-                normalized_sample = sample.strip()
-                if normalized_sample not in sample_ids:
-                    continue  # Skip inserting genotype for this sample
-
-                sample_id = sample_ids[normalized_sample]
-                gt = variant.genotypes[sample_idx]
-                if gt[0] == -1 or gt[1] == -1:
-                    genotype = './.'  # Missing genotype
+        has_genotypes = bool(vcf.samples)
+        for variant in records:
+            allele_ids = insert_variant(cursor, variant, variant_ids, info_fields, update_existing)
+            variant_count += len(allele_ids)
+            if not has_genotypes or variant.genotype is None:
+                allele_splits = []  # Sites-only record
+            else:
+                # Each ALT allele's variant_id gets the record's genotypes split for that allele
+                allele_splits = split_alleles(genotype_alleles(variant.genotype.array(), sample_index),
+                                              len(allele_ids))
+            for variant_id, alleles in zip(allele_ids, allele_splits):
+                if genotype_store != 'rows':
+                    cursor.execute(
+                        UPSERT_GENOTYPE_MATRIX_SQL if update_existing else INSERT_GENOTYPE_MATRIX_SQL,
+                        (variant_id, sample_set_id, pack_alleles(alleles, genotype_store == 'packed_zlib'))
+                    )
+                    genotype_count += len(sample_id_list)
                 else:
-                    genotype = f"{gt[0]}/{gt[1]}"
-                insert_genotype(cursor, variant_id, sample_id, genotype)
+                    genotypes = alleles_to_strings(alleles)
+                    for sample_id, genotype in zip(sample_id_list, genotypes):
+                        insert_genotype(cursor, variant_id, sample_id, genotype, update_existing)
+                    genotype_count += len(genotypes)
 
+            record_count += 1
+            last_record = advance_record_position(last_record, normalize_chrom(variant.CHROM), variant.POS)
+            if checkpoint_interval and record_count % checkpoint_interval == 0:
+                save_checkpoint(cursor, vcf_path, record_count, last_record, variant_count, genotype_count)
+                conn.commit()
+                conn.execute('BEGIN TRANSACTION')
+
+        if checkpoint_interval:
+            save_checkpoint(cursor, vcf_path, record_count, last_record, variant_count, genotype_count, done=True)
         conn.commit()
         logging.info(f"Successfully processed VCF file: {vcf_path}")
+        log_ingest_rate('row', vcf_path, variant_count, genotype_count, time.perf_counter() - start_time)
+        return variant_count, genotype_count
     except Exception as e:
         conn.rollback()
+        # Ids cached since the last commit may belong to rolled back rows
+        sample_ids.clear()
+        variant_ids.clear()
         logging.error(f"Error processing VCF file {vcf_path}: {e}", exc_info=True)
+        return None
     finally:
         cursor.close()
 
-def process_clinvar_vcf(conn, clinvar_vcf_path):
+def log_ingest_rate(mode, vcf_path, variant_count, genotype_count, elapsed):
+    """
+    Log the number of rows written for a VCF file and the resulting rows/second.
+    """
+    total_rows = variant_count + genotype_count
+    rate = total_rows / elapsed if elapsed > 0 else float('inf')
+    logging.info(
+        f"[{mode}] {vcf_path}: {variant_count} variant rows, {genotype_count} genotype rows "
+        f"in {elapsed:.2f}s ({rate:,.0f} rows/s)"
+    )
+    return rate
+
+def resolve_variant_ids(cursor, keys):
+    """
+    Map (chrom, pos, ref, alt) keys to their variant_id with one range query per chromosome.
+    """
+    positions = {}
+    for chrom, pos, _, _ in keys:
+        low, high = positions.get(chrom, (pos, pos))
+        positions[chrom] = (min(low, pos), max(high, pos))
+
+    variant_ids = {}
+    for chrom, (low, high) in positions.items():
+        cursor.execute("""
+            SELECT chrom, pos, ref, alt, variant_id FROM variants
+            WHERE chrom = ? AND pos BETWEEN ? AND ?
+        """, (chrom, low, high))
+        for row in cursor.fetchall():
+            variant_ids[row[:4]] = row[4]
+    return variant_ids
+
+def flush_variant_batch(cursor, pending, variant_ids=None, info_columns=(), update_existing=False):
+    """
+    Write a batch of buffered variants and their genotypes with executemany.
+
+    Variants found in the variant_ids cache are not inserted again; the others are
+    inserted with ON CONFLICT DO NOTHING and their ids resolved once per batch.
+    With update_existing, every variant and genotype is written and existing rows
+    take the batch's values.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor inside the file's transaction.
+        pending (list): (variant row, genotypes) per ALT allele, where genotypes are
+            (sample_id, genotype) tuples for the 'rows' store, or a (sample_set_id,
+            packed blob) tuple for the packed stores; [] for sites-only records.
+        variant_ids (VariantIdCache): The ingest's variant_key -> variant_id cache.
+        info_columns (tuple): Names of the projected INFO columns ending each variant row.
+        update_existing (bool): Upsert with DO UPDATE instead of keeping existing rows.
+
+    Returns:
+        tuple: (variant rows written, genotypes written)
+    """
+    if not pending:
+        return 0, 0
+    if variant_ids is None:
+        variant_ids = VariantIdCache()
+
+    variant_rows = [row for row, _ in pending]
+    keys = [variant_key(*row[:4]) for row in variant_rows]
+    cached_ids = np.zeros(len(keys), dtype=np.int64) if update_existing else variant_ids.get_many(keys)
+    batch_ids = {}
+    new_rows = []
+    for row, key, variant_id in zip(variant_rows, keys, cached_ids.tolist()):
+        if variant_id:
+            batch_ids[key] = variant_id
+        else:
+            new_rows.append(row)
+    if new_rows:
+        cursor.executemany(upsert_variant_sql(info_columns, update_existing), new_rows)
+        for key, variant_id in resolve_variant_ids(cursor, [row[:4] for row in new_rows]).items():
+            batch_ids[variant_key(*key)] = variant_id
+        variant_ids.update(batch_ids)
+
+    genotype_rows = []
+    matrix_rows = []
+    genotype_count = 0
+    for key, (_, genotypes) in zip(keys, pending):
+        variant_id = batch_ids.get(key)
+        if variant_id is None:
+            continue
+        if isinstance(genotypes, tuple):
+            sample_set_id, blob = genotypes
+            matrix_rows.append((variant_id, sample_set_id, blob))
+            genotype_count += GENOTYPE_HEADER.unpack_from(blob)[1]
+        else:
+            genotype_rows.extend((variant_id, sample_id, genotype) for sample_id, genotype in genotypes)
+
+    cursor.executemany(UPSERT_GENOTYPE_SQL if update_existing else INSERT_GENOTYPE_SQL, genotype_rows)
+    cursor.executemany(UPSERT_GENOTYPE_MATRIX_SQL if update_existing else INSERT_GENOTYPE_MATRIX_SQL, matrix_rows)
+    pending.clear()
+    return len(variant_rows), len(genotype_rows) + genotype_count
+
+def process_vcf_batched(conn, vcf_path, sample_ids, batch_size=INGEST_BATCH_SIZE, region=None,
+                        genotype_store=GENOTYPE_STORE, checkpoint_interval=None, variant_ids=None,
+                        update_existing=False):
+    """
+    Process a single VCF or VCF.GZ file, buffering variant and genotype rows and
+    flushing them with executemany once batch_size rows are pending.
+
+    If region is given as (contig, start, end), only records starting inside that
+    region are processed, using the file's tabix/CSI index. start and end may be
+    None to process the whole contig.
+
+    With checkpoint_interval (whole files only), the rows are committed every
+    checkpoint_interval VCF records together with a checkpoint, and a file with a
+    checkpoint resumes after it. variant_ids is the ingest's variant_key -> variant_id
+    cache, shared across files. update_existing is passed on to flush_variant_batch.
+
+    Returns:
+        tuple: (variant rows, genotype rows) written, or None if the file failed.
+    """
+    if variant_ids is None:
+        variant_ids = VariantIdCache()
+    cursor = conn.cursor()
+    start_time = time.perf_counter()
+    variant_count = 0
+    genotype_count = 0
+    record_count = 0
+    source = vcf_path if region is None else f"{vcf_path} [{format_region(region)}]"
+    if region is not None:
+        checkpoint_interval = None
+    checkpoint = load_checkpoint(conn, vcf_path) if checkpoint_interval else None
+    if checkpoint and checkpoint['done']:
+        logging.info(f"Skipping VCF file finished before the last interruption: {vcf_path}")
+        return checkpoint['variant_count'], checkpoint['genotype_count']
+    try:
+        conn.execute('BEGIN TRANSACTION')
+        logging.info(f"Processing VCF file (batched, batch size {batch_size}): {source}")
+        vcf = VCF(vcf_path)
+
+        for sample in vcf.samples:
+            insert_sample(cursor, sample, sample_ids)
+
+        sample_index, sample_id_list = get_sample_columns(vcf.samples, sample_ids)
+        if genotype_store != 'rows':
+            sample_set_id = get_sample_set(cursor, sample_id_list)
+            compress = genotype_store == 'packed_zlib'
+        info_fields = file_info_fields(vcf)
+        ensure_info_columns(cursor, info_fields)
+        info_columns = tuple(field['id'] for field in info_fields)
+
+        last_record = None
+        if region is not None:
+            records = vcf(format_region(region))
+            _, region_start, region_end = region
+        elif checkpoint:
+            records = skip_checkpointed_records(vcf, checkpoint, vcf_path)
+            record_count = checkpoint['record_count']
+            last_record = (checkpoint['chrom'], checkpoint['pos'], checkpoint['pos_record_count'])
+            variant_count = checkpoint['variant_count']
+            genotype_count = checkpoint['genotype_count']
+        else:
+            records = vcf
+
+        pending = []
+        pending_rows = 0
+        has_genotypes = bool(vcf.samples)
+        for variant in records:
+            if region is not None and region_start is not None and not region_start <= variant.POS <= region_end:
+                continue  # Overlaps the window but starts in a neighbouring one
+            rows = build_variant_rows(variant, info_fields)
+            if not has_genotypes or variant.genotype is None:
+                pending.extend((row, []) for row in rows)  # Sites-only record
+                pending_rows += len(rows)
+            else:
+                # Each ALT allele's row gets the record's genotypes split for that allele
+                allele_splits = split_alleles(genotype_alleles(variant.genotype.array(), sample_index), len(rows))
+                for row, alleles in zip(rows, allele_splits):
+                    if genotype_store != 'rows':
+                        pending.append((row, (sample_set_id, pack_alleles(alleles, compress))))
+                        pending_rows += 2
+                    else:
+                        genotypes = list(zip(sample_id_list, alleles_to_strings(alleles)))
+                        pending.append((row, genotypes))
+                        pending_rows += 1 + len(genotypes)
+
+            record_count += 1
+            last_record = advance_record_position(last_record, *rows[0][:2])
+            checkpoint_due = checkpoint_interval and record_count % checkpoint_interval == 0
+            if pending_rows >= batch_size or checkpoint_due:
+                written_variants, written_genotypes = flush_variant_batch(cursor, pending, variant_ids, info_columns,
+                                                                          update_existing)
+                variant_count += written_variants
+                genotype_count += written_genotypes
+                pending_rows = 0
+            if checkpoint_due:
+                save_checkpoint(cursor, vcf_path, record_count, last_record, variant_count, genotype_count)
+                conn.commit()
+                conn.execute('BEGIN TRANSACTION')
+
+        written_variants, written_genotypes = flush_variant_batch(cursor, pending, variant_ids, info_columns,
+                                                                  update_existing)
+        variant_count += written_variants
+        genotype_count += written_genotypes
+
+        if checkpoint_interval:
+            save_checkpoint(cursor, vcf_path, record_count, last_record, variant_count, genotype_count, done=True)
+        conn.commit()
+        logging.info(f"Successfully processed VCF file: {source}")
+        log_ingest_rate('batched', source, variant_count, genotype_count, time.perf_counter() - start_time)
+        return variant_count, genotype_count
+    except Exception as e:
+        conn.rollback()
+        # Ids cached since the last commit may belong to rolled back rows
+        sample_ids.clear()
+        variant_ids.clear()
+        logging.error(f"Error processing VCF file {source}: {e}", exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+def process_clinvar_vcf(conn, clinvar_vcf_path, replace=False):
     """
     Process the ClinVar VCF file and insert annotations into the database.
+
+    With replace (a new ClinVar release), the existing annotations are deleted in the
+    same transaction, so they are kept if the file fails.
+
+    Returns:
+        int: Number of matched ClinVar alleles, or None if the file failed.
     """
     cursor = conn.cursor()
     unmatched_variants = []
+    matched_count = 0
     try:
         conn.execute('BEGIN TRANSACTION')
+        if replace:
+            cursor.execute("DELETE FROM clinvar_annotations")
         logging.info(f"Processing ClinVar VCF file: {clinvar_vcf_path}")
         clinvar_vcf = VCF(clinvar_vcf_path)
 
@@ -459,6 +1370,7 @@ def process_clinvar_vcf(conn, clinvar_vcf_path):
                 if result:
                     variant_id = result[0]
                     insert_clinvar_annotation(cursor, variant_id, variant.INFO)
+                    matched_count += 1
                 else:
                     unmatched_variants.append(f"{chrom}:{pos}:{ref}>{alt}")
 
@@ -467,20 +1379,888 @@ def process_clinvar_vcf(conn, clinvar_vcf_path):
     except Exception as e:
         conn.rollback()
         logging.error(f"Error processing ClinVar VCF file {clinvar_vcf_path}: {e}", exc_info=True)
+        matched_count = None
     finally:
         cursor.close()
 
-    # Write unmatched variants to a separate log file
+    write_unmatched_variants(unmatched_variants)
+    return matched_count
+
+def write_unmatched_variants(unmatched_variants):
+    """
+    Write ClinVar variants without a matching variants row to a separate log file.
+    """
     if unmatched_variants:
         with open('unmatched_variants.log', 'a') as f:
             for variant in unmatched_variants:
                 f.write(f"{variant}\n")
 
+def load_variant_key_index(conn):
+    """
+    Load a (chrom, pos, ref, alt) -> variant_id dictionary for hash joins.
+    """
+    return {
+        (chrom, pos, ref, alt): variant_id
+        for chrom, pos, ref, alt, variant_id in conn.execute(
+            "SELECT chrom, pos, ref, alt, variant_id FROM variants"
+        )
+    }
+
+def process_clinvar_vcf_merge(conn, clinvar_vcf_path, batch_size=INGEST_BATCH_SIZE, replace=False):
+    """
+    Process the ClinVar VCF file with a streaming sort-merge join against the variants table.
+
+    The ClinVar file is walked in lockstep with a per-chromosome cursor over variants
+    ordered by position, and matched annotations are bulk-inserted with executemany.
+    If the file turns out not to be coordinate-sorted (a chromosome reappears or
+    positions go backwards), the rest of the file is joined against an in-memory
+    hash of all variant keys instead.
+
+    With replace (a new ClinVar release), the existing annotations are deleted in the
+    same transaction, so they are kept if the file fails.
+
+    Returns:
+        int: Number of matched ClinVar alleles, or None if the file failed.
+    """
+    cursor = conn.cursor()
+    unmatched_variants = []
+    annotation_rows = []
+    matched_count = 0
+    start_time = time.perf_counter()
+
+    seen_chroms = set()
+    current_chrom = None
+    last_pos = 0
+    variant_rows = iter(())  # (pos, ref, alt, variant_id) on current_chrom, ordered by pos
+    next_row = None          # First row of variant_rows not consumed yet
+    group_pos = None
+    pos_group = {}           # (ref, alt) -> variant_id for the variants at group_pos
+    key_index = None         # Set once the join falls back to a hash join
+    try:
+        conn.execute('BEGIN TRANSACTION')
+        if replace:
+            cursor.execute("DELETE FROM clinvar_annotations")
+        logging.info(f"Processing ClinVar VCF file (merge join): {clinvar_vcf_path}")
+        clinvar_vcf = VCF(clinvar_vcf_path)
+
+        for variant in clinvar_vcf:
+            chrom = normalize_chrom(variant.CHROM)
+            pos = variant.POS
+            ref = variant.REF.strip()
+            alt_list = [allele.strip() for allele in variant.ALT] if variant.ALT else ['.']
+
+            if key_index is None:
+                if chrom != current_chrom and chrom not in seen_chroms:
+                    seen_chroms.add(chrom)
+                    current_chrom = chrom
+                    last_pos = 0
+                    variant_rows = conn.execute("""
+                        SELECT pos, ref, alt, variant_id FROM variants
+                        WHERE chrom = ? ORDER BY pos
+                    """, (chrom,))
+                    next_row = next(variant_rows, None)
+                    group_pos = None
+                if chrom != current_chrom or pos < last_pos:
+                    logging.warning(
+                        f"ClinVar VCF is not coordinate-sorted at {chrom}:{pos}; "
+                        f"falling back to a hash join for the remaining records."
+                    )
+                    key_index = load_variant_key_index(conn)
+                    variant_rows = iter(())
+
+            if key_index is None:
+                last_pos = pos
+                if pos != group_pos:
+                    # Advance the variants cursor to this position and buffer its alleles
+                    while next_row is not None and next_row[0] < pos:
+                        next_row = next(variant_rows, None)
+                    pos_group = {}
+                    while next_row is not None and next_row[0] == pos:
+                        pos_group[(next_row[1], next_row[2])] = next_row[3]
+                        next_row = next(variant_rows, None)
+                    group_pos = pos
+
+            for alt in alt_list:
+                if key_index is None:
+                    variant_id = pos_group.get((ref, alt))
+                else:
+                    variant_id = key_index.get((chrom, pos, ref, alt))
+                if variant_id is None:
+                    unmatched_variants.append(f"{chrom}:{pos}:{ref}>{alt}")
+                    continue
+                annotation_rows.append(build_clinvar_annotation_row(variant_id, variant.INFO))
+                if len(annotation_rows) >= batch_size:
+                    cursor.executemany(INSERT_CLINVAR_ANNOTATION_SQL, annotation_rows)
+                    matched_count += len(annotation_rows)
+                    annotation_rows.clear()
+
+        cursor.executemany(INSERT_CLINVAR_ANNOTATION_SQL, annotation_rows)
+        matched_count += len(annotation_rows)
+        conn.commit()
+        logging.info(
+            f"Successfully processed ClinVar VCF file: {clinvar_vcf_path} "
+            f"({matched_count} matched, {len(unmatched_variants)} unmatched alleles "
+            f"in {time.perf_counter() - start_time:.2f}s)"
+        )
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Error processing ClinVar VCF file {clinvar_vcf_path}: {e}", exc_info=True)
+        matched_count = None
+    finally:
+        cursor.close()
+
+    write_unmatched_variants(unmatched_variants)
+    return matched_count
+
+# ---------------------------- ClinVar Search Index ---------------------------- #
+
+def create_clinvar_search_index(conn):
+    """
+    Create the clinvar_search FTS5 table over CLINVAR_SEARCH_COLUMNS.
+
+    The table is an external-content index of clinvar_annotations (rowid =
+    annotation_id) with the trigram tokenizer, so LIKE '%text%' on its columns is
+    answered from the index instead of scanning every annotation. SQLite builds
+    without FTS5 (or older than 3.34) keep working without it.
+
+    Returns:
+        bool: True if the table exists.
+    """
+    try:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS clinvar_search USING fts5(
+                {', '.join(CLINVAR_SEARCH_COLUMNS)},
+                content='clinvar_annotations', content_rowid='annotation_id', tokenize='trigram'
+            )
+        """)
+        return True
+    except sqlite3.OperationalError as e:
+        logging.warning(f"ClinVar text search index not available in this SQLite build: {e}")
+        return False
+
+def rebuild_clinvar_search_index(conn):
+    """
+    Rebuild clinvar_search from the current clinvar_annotations rows.
+
+    Called after every change to clinvar_annotations by the ClinVar ingest; a single
+    rebuild is faster than keeping the index in sync row by row with triggers.
+
+    Returns:
+        bool: True if the index was rebuilt.
+    """
+    if not create_clinvar_search_index(conn):
+        return False
+    start_time = time.perf_counter()
+    try:
+        conn.execute("INSERT INTO clinvar_search (clinvar_search) VALUES ('rebuild')")
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logging.error(f"Error rebuilding the ClinVar text search index: {e}", exc_info=True)
+        return False
+    logging.info(f"Rebuilt ClinVar text search index in {time.perf_counter() - start_time:.2f}s")
+    return True
+
+# ---------------------------- Parallel Ingest ---------------------------- #
+
+# Bounded queue shared with the worker processes, set by init_ingest_worker
+worker_queue = None
+
+def init_ingest_worker(batch_queue):
+    """
+    Pool initializer: keep a reference to the writer's batch queue in each worker.
+    """
+    global worker_queue
+    worker_queue = batch_queue
+
+def parse_vcf_worker(vcf_path, batch_size=INGEST_BATCH_SIZE, genotype_store=GENOTYPE_STORE, checkpoint=None):
+    """
+    Parse a VCF file in a worker process and send ready-to-insert batches to the writer.
+
+    Messages are (kind, vcf_path, payload) tuples: 'header' with the sample names and
+    the projected INFO fields, 'batch' with a list of (variant rows, genotypes) per record,
+    where genotypes holds each ALT allele's genotype strings or packed blob (see
+    split_alleles), or is None for sites-only records, then 'done' or 'error'. The queue is bounded, so a worker blocks while the writer
+    catches up. With a checkpoint, parsing starts after the records it covers.
+    """
+    try:
+        vcf = VCF(vcf_path)
+        info_fields = file_info_fields(vcf)
+        worker_queue.put(('header', vcf_path, (list(vcf.samples), info_fields)))
+
+        records = skip_checkpointed_records(vcf, checkpoint, vcf_path) if checkpoint else vcf
+        pending = []
+        pending_rows = 0
+        has_genotypes = bool(vcf.samples)
+        for variant in records:
+            rows = build_variant_rows(variant, info_fields)
+            if not has_genotypes or variant.genotype is None:
+                genotypes = None  # Sites-only record
+                pending_rows += len(rows)
+            else:
+                allele_splits = split_alleles(genotype_alleles(variant.genotype.array()), len(rows))
+                if genotype_store != 'rows':
+                    genotypes = [pack_alleles(alleles, genotype_store == 'packed_zlib') for alleles in allele_splits]
+                    pending_rows += 2 * len(rows)
+                else:
+                    genotypes = [alleles_to_strings(alleles) for alleles in allele_splits]
+                    pending_rows += len(rows) * (1 + len(vcf.samples))
+            pending.append((rows, genotypes))
+            if pending_rows >= batch_size:
+                worker_queue.put(('batch', vcf_path, pending))
+                pending = []
+                pending_rows = 0
+
+        if pending:
+            worker_queue.put(('batch', vcf_path, pending))
+        vcf.close()
+        worker_queue.put(('done', vcf_path, None))
+    except Exception as e:
+        logging.error(f"Worker failed to parse VCF file {vcf_path}: {e}", exc_info=True)
+        worker_queue.put(('error', vcf_path, str(e)))
+
+def process_vcfs_parallel(conn, vcf_files, sample_ids, workers=INGEST_WORKERS,
+                          queue_depth=INGEST_QUEUE_DEPTH, batch_size=INGEST_BATCH_SIZE,
+                          genotype_store=GENOTYPE_STORE, checkpoints=False, variant_ids=None,
+                          update_files=()):
+    """
+    Parse VCF files in a process pool and insert their rows from this (single writer) process.
+
+    Each received batch is written and committed in its own transaction. Once a batch
+    of a file fails (or its worker reports an error), the file's remaining batches are
+    dropped. Without checkpoints, the rows of its committed batches are then removed
+    (see remove_batch_rows), so a failed file is written all or nothing as in the serial
+    modes. With checkpoints, each batch also records its file's checkpoint, a failed
+    file keeps the rows up to its last one and files with a checkpoint resume after it. variant_ids is the ingest's variant_key -> variant_id cache.
+    The batches of the files in update_files are written with update_existing
+    (see flush_variant_batch).
+
+    Returns:
+        dict: vcf_path -> (variant rows, genotypes) written, or None if the file failed.
+    """
+    if variant_ids is None:
+        variant_ids = VariantIdCache()
+    batch_queue = multiprocessing.Queue(maxsize=queue_depth)
+    cursor = conn.cursor()
+    file_columns = {}
+    file_info_columns = {}
+    sample_set_ids = {}
+    file_counts = {vcf_path: [0, 0] for vcf_path in vcf_files}
+    file_records = {vcf_path: 0 for vcf_path in vcf_files}
+    completed_files = set()
+    failed_files = set()
+    start_times = {}
+    # (marks before, marks after) of each committed batch per file, to undo failed files
+    file_batches = {}
+
+    file_checkpoints = {}
+    file_last_records = {}
+    if checkpoints:
+        for vcf_path in vcf_files:
+            checkpoint = load_checkpoint(conn, vcf_path)
+            if checkpoint is None:
+                continue
+            file_counts[vcf_path] = [checkpoint['variant_count'], checkpoint['genotype_count']]
+            file_records[vcf_path] = checkpoint['record_count']
+            file_last_records[vcf_path] = (checkpoint['chrom'], checkpoint['pos'], checkpoint['pos_record_count'])
+            if checkpoint['done']:
+                logging.info(f"Skipping VCF file finished before the last interruption: {vcf_path}")
+                completed_files.add(vcf_path)
+            else:
+                file_checkpoints[vcf_path] = checkpoint
+    parse_files = [vcf_path for vcf_path in vcf_files if vcf_path not in completed_files]
+    remaining = len(parse_files)
+    logging.info(f"Processing {remaining} VCF files with {workers} workers (queue depth {queue_depth}).")
+
+    with multiprocessing.Pool(workers, initializer=init_ingest_worker, initargs=(batch_queue,)) as pool:
+        results = [
+            pool.apply_async(parse_vcf_worker, (vcf_path, batch_size, genotype_store, file_checkpoints.get(vcf_path)))
+            for vcf_path in parse_files
+        ]
+        try:
+            while remaining:
+                try:
+                    kind, vcf_path, payload = batch_queue.get(timeout=5)
+                except queue.Empty:
+                    if all(result.ready() for result in results):
+                        logging.error("All ingest workers exited without reporting completion.")
+                        break
+                    continue
+
+                if kind == 'header':
+                    start_times[vcf_path] = time.perf_counter()
+                    logging.info(f"Processing VCF file (parallel): {vcf_path}")
+                    samples, info_fields = payload
+                    for sample in samples:
+                        insert_sample(cursor, sample, sample_ids)
+                    ensure_info_columns(cursor, info_fields)
+                    conn.commit()
+                    file_columns[vcf_path] = (len(samples),) + get_sample_columns(samples, sample_ids)
+                    file_info_columns[vcf_path] = tuple(field['id'] for field in info_fields)
+                    if genotype_store != 'rows':
+                        sample_set_ids[vcf_path] = get_sample_set(cursor, file_columns[vcf_path][2])
+                        conn.commit()
+                elif kind == 'batch':
+                    if vcf_path in failed_files:
+                        continue  # Dropped after an earlier batch of the file failed
+                    sample_count, sample_index, sample_id_list = file_columns[vcf_path]
+                    all_samples = len(sample_id_list) == sample_count
+                    compress = genotype_store == 'packed_zlib'
+                    pending = []
+                    for rows, allele_genotypes in payload:
+                        if allele_genotypes is None:
+                            pending.extend((row, []) for row in rows)  # Sites-only record
+                        elif genotype_store != 'rows':
+                            for row, blob in zip(rows, allele_genotypes):
+                                if not all_samples:
+                                    # Drop the columns of samples without a sample_id
+                                    blob = pack_alleles(unpack_alleles(blob)[sample_index], compress)
+                                pending.append((row, (sample_set_ids[vcf_path], blob)))
+                        else:
+                            for row, genotypes in zip(rows, allele_genotypes):
+                                if not all_samples:
+                                    genotypes = [genotypes[idx] for idx in sample_index]
+                                pending.append((row, list(zip(sample_id_list, genotypes))))
+                    try:
+                        conn.execute('BEGIN TRANSACTION')
+                        marks = None if checkpoints else ingest_high_water_marks(conn)
+                        written_variants, written_genotypes = flush_variant_batch(cursor, pending, variant_ids,
+                                                                                  file_info_columns[vcf_path],
+                                                                                  vcf_path in update_files)
+                        file_counts[vcf_path][0] += written_variants
+                        file_counts[vcf_path][1] += written_genotypes
+                        file_records[vcf_path] += len(payload)
+                        last_record = file_last_records.get(vcf_path)
+                        for rows, _ in payload:
+                            last_record = advance_record_position(last_record, *rows[0][:2])
+                        file_last_records[vcf_path] = last_record
+                        if checkpoints:
+                            save_checkpoint(cursor, vcf_path, file_records[vcf_path], last_record,
+                                            *file_counts[vcf_path])
+                        conn.commit()
+                        if marks is not None:
+                            file_batches.setdefault(vcf_path, []).append((marks, ingest_high_water_marks(conn)))
+                    except Exception as e:
+                        conn.rollback()
+                        variant_ids.clear()  # May hold ids of the rolled back rows
+                        failed_files.add(vcf_path)
+                        logging.error(f"Error writing batch from VCF file {vcf_path}: {e}", exc_info=True)
+                elif kind == 'done':
+                    remaining -= 1
+                    completed_files.add(vcf_path)
+                    if vcf_path in failed_files:
+                        logging.error(f"VCF file {vcf_path} failed; its batches after the failure were dropped")
+                        continue
+                    if checkpoints:
+                        cursor.execute("UPDATE ingest_checkpoints SET done = 1 WHERE path = ?",
+                                       (os.path.abspath(vcf_path),))
+                        conn.commit()
+                    logging.info(f"Successfully processed VCF file: {vcf_path}")
+                    variant_count, genotype_count = file_counts[vcf_path]
+                    log_ingest_rate('parallel', vcf_path, variant_count, genotype_count,
+                                    time.perf_counter() - start_times.get(vcf_path, time.perf_counter()))
+                elif kind == 'error':
+                    remaining -= 1
+                    failed_files.add(vcf_path)
+                    logging.error(f"Error processing VCF file {vcf_path}: {payload}")
+        finally:
+            cursor.close()
+
+    for vcf_path in failed_files:
+        if vcf_path in file_batches:
+            try:
+                removed_variants, removed_genotypes = remove_batch_rows(conn, file_batches[vcf_path])
+                logging.warning(f"Removed the rows of failed VCF file {vcf_path}: {removed_variants} variants, "
+                                f"{removed_genotypes} genotype rows")
+            except sqlite3.Error as e:
+                logging.error(f"Error removing the rows of failed VCF file {vcf_path}: {e}", exc_info=True)
+    if file_batches.keys() & failed_files:
+        variant_ids.clear()  # May hold ids of the removed variants
+
+    return {
+        vcf_path: tuple(file_counts[vcf_path])
+        if vcf_path in completed_files and vcf_path not in failed_files else None
+        for vcf_path in vcf_files
+    }
+
+# ---------------------------- Region-Sharded Ingest ---------------------------- #
+
+def format_region(region):
+    """
+    Format a (contig, start, end) region as a tabix region string.
+    """
+    contig, start, end = region
+    if start is None:
+        return contig
+    return f"{contig}:{start}-{end}"
+
+def has_vcf_index(vcf_path):
+    """
+    Check whether a VCF.GZ file has a tabix (.tbi) or CSI (.csi) index next to it.
+    """
+    return vcf_path.endswith('.gz') and (
+        os.path.isfile(vcf_path + '.tbi') or os.path.isfile(vcf_path + '.csi')
+    )
+
+def plan_regions(vcf_path, window_size=SHARD_WINDOW_SIZE):
+    """
+    Split an indexed VCF file into (contig, start, end) regions.
+
+    Contigs are split into fixed windows of window_size bp when their length is
+    known from the header; otherwise (or when window_size is None) each contig
+    is a single region.
+    """
+    vcf = VCF(vcf_path)
+    try:
+        contig_lengths = dict(zip(vcf.seqnames, vcf.seqlens))
+    except Exception:
+        contig_lengths = {}
+    contigs = list(vcf.seqnames)
+    vcf.close()
+
+    regions = []
+    for contig in contigs:
+        length = contig_lengths.get(contig)
+        if not window_size or not length:
+            regions.append((contig, None, None))
+            continue
+        for start in range(1, length + 1, window_size):
+            regions.append((contig, start, min(start + window_size - 1, length)))
+    return regions
+
+def ingest_region_shard(vcf_path, region, shard_path, batch_size=INGEST_BATCH_SIZE,
+                        genotype_store=GENOTYPE_STORE):
+    """
+    Worker: ingest one region of an indexed VCF file into its own shard database.
+
+    Returns:
+        tuple: (shard_path, written counts or None on failure). Regions without
+        records return (None, (0, 0)) and create no shard.
+    """
+    try:
+        vcf = VCF(vcf_path)
+        _, region_start, region_end = region
+        try:
+            has_records = any(
+                region_start is None or region_start <= variant.POS <= region_end
+                for variant in vcf(format_region(region))
+            )
+        finally:
+            vcf.close()
+        if not has_records:
+            return None, (0, 0)
+
+        if os.path.exists(shard_path):
+            os.remove(shard_path)
+        conn = connect_db(shard_path)
+        try:
+            # Shards are only read whole by merge_shard, so they never get secondary indexes
+            if BULK_LOAD:
+                apply_pragmas(conn, BULK_LOAD_PRAGMAS)
+            initialize_database(conn, create_indexes=False)
+            counts = process_vcf_batched(conn, vcf_path, {}, batch_size, region=region, genotype_store=genotype_store)
+        finally:
+            conn.close()
+    except (Exception, SystemExit) as e:
+        # connect_db and initialize_database exit on SQLite errors, which would kill the pool worker
+        logging.error(f"Error ingesting region {format_region(region)} of VCF file {vcf_path}: {e}", exc_info=True)
+        return shard_path, None
+    return shard_path, counts
+
+def merge_shard(conn, shard_path):
+    """
+    Merge a shard database into the main database with ATTACH and INSERT ... SELECT.
+
+    Samples and variants are matched on their natural keys (sample_name and
+    chrom/pos/ref/alt), so shard-local ids are remapped to the main database ids.
+    Sample sets of packed genotypes are rewritten with the main sample_ids, and the
+    shard's projected INFO columns are added to the main database if needed.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+        conn.execute('BEGIN TRANSACTION')
+        info_fields = load_info_fields(cursor, 'shard')
+        ensure_info_columns(cursor, info_fields)
+        variant_columns = ', '.join(VARIANT_COLUMNS + [quote_column(field['id']) for field in info_fields])
+        cursor.execute("""
+            INSERT OR IGNORE INTO main.samples (sample_name)
+            SELECT sample_name FROM shard.samples ORDER BY sample_id
+        """)
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO main.variants ({variant_columns})
+            SELECT {variant_columns} FROM shard.variants ORDER BY variant_id
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO main.genotype (variant_id, sample_id, genotype)
+            SELECT mv.variant_id, ms.sample_id, g.genotype
+            FROM shard.genotype AS g
+            JOIN shard.variants AS sv ON sv.variant_id = g.variant_id
+            JOIN main.variants AS mv
+                ON mv.chrom = sv.chrom AND mv.pos = sv.pos AND mv.ref = sv.ref AND mv.alt = sv.alt
+            JOIN shard.samples AS ss ON ss.sample_id = g.sample_id
+            JOIN main.samples AS ms ON ms.sample_name = ss.sample_name
+        """)
+        sample_id_map = dict(cursor.execute("""
+            SELECT ss.sample_id, ms.sample_id
+            FROM shard.samples AS ss
+            JOIN main.samples AS ms ON ms.sample_name = ss.sample_name
+        """).fetchall())
+        for shard_set_id, shard_sample_ids in cursor.execute(
+                "SELECT sample_set_id, sample_ids FROM shard.sample_sets").fetchall():
+            sample_set_id = get_sample_set(cursor, [sample_id_map[sample_id] for sample_id in json.loads(shard_sample_ids)])
+            cursor.execute("""
+                INSERT OR IGNORE INTO main.genotype_matrix (variant_id, sample_set_id, genotypes)
+                SELECT mv.variant_id, ?, gm.genotypes
+                FROM shard.genotype_matrix AS gm
+                JOIN shard.variants AS sv ON sv.variant_id = gm.variant_id
+                JOIN main.variants AS mv
+                    ON mv.chrom = sv.chrom AND mv.pos = sv.pos AND mv.ref = sv.ref AND mv.alt = sv.alt
+                WHERE gm.sample_set_id = ?
+            """, (sample_set_id, shard_set_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("DETACH DATABASE shard")
+        cursor.close()
+
+def process_vcf_sharded(conn, vcf_path, sample_ids, workers=INGEST_WORKERS,
+                        window_size=SHARD_WINDOW_SIZE, shard_directory=SHARD_DIRECTORY,
+                        batch_size=INGEST_BATCH_SIZE, genotype_store=GENOTYPE_STORE):
+    """
+    Ingest an indexed VCF.GZ file by parsing its regions in parallel into shard
+    databases, then merging the shards into the main database in region order.
+
+    Returns:
+        tuple: (variant rows, genotypes) written, or None if any region failed.
+    """
+    start_time = time.perf_counter()
+    regions = plan_regions(vcf_path, window_size)
+    os.makedirs(shard_directory, exist_ok=True)
+    base_name = os.path.basename(vcf_path)
+    tasks = [
+        (vcf_path, region, os.path.join(shard_directory, f"{base_name}.{idx:05d}.db"), batch_size, genotype_store)
+        for idx, region in enumerate(regions)
+    ]
+    logging.info(f"Processing VCF file (sharded, {len(regions)} regions, {workers} workers): {vcf_path}")
+
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.starmap(ingest_region_shard, tasks)
+    parse_elapsed = time.perf_counter() - start_time
+
+    failed = 0
+    for shard_path, counts in results:
+        try:
+            if counts is None:
+                failed += 1
+            elif shard_path is not None:
+                merge_shard(conn, shard_path)
+        except Exception as e:
+            failed += 1
+            logging.error(f"Error merging shard {shard_path} of VCF file {vcf_path}: {e}", exc_info=True)
+        finally:
+            if shard_path is not None and os.path.exists(shard_path):
+                os.remove(shard_path)
+
+    # Shard workers assign their own sample ids; refresh the shared mapping
+    for sample_id, sample_name in conn.execute("SELECT sample_id, sample_name FROM samples"):
+        sample_ids[sample_name] = sample_id
+
+    variant_count = sum(counts[0] for _, counts in results if counts)
+    genotype_count = sum(counts[1] for _, counts in results if counts)
+    if failed:
+        logging.error(f"{failed} of {len(regions)} regions of VCF file {vcf_path} failed; see log above.")
+    else:
+        logging.info(f"Successfully processed VCF file: {vcf_path}")
+    logging.info(f"Sharded parse took {parse_elapsed:.2f}s, merge took {time.perf_counter() - start_time - parse_elapsed:.2f}s")
+    log_ingest_rate('sharded', vcf_path, variant_count, genotype_count, time.perf_counter() - start_time)
+    return None if failed else (variant_count, genotype_count)
+
+# ---------------------------- Ingest Manifest ---------------------------- #
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def plan_incremental_ingest(conn, paths):
+    """
+    Select the files that are new or changed since they were last recorded in ingest_manifest.
+
+    A file whose size and mtime match its manifest entry is skipped without reading it;
+    otherwise its content hash decides. Files that were only touched get their size
+    and mtime refreshed. Files without an entry (new, or being resumed from a checkpoint)
+    are not hashed here; record_ingested_file hashes them once they are ingested.
+
+    Returns:
+        tuple: (list of paths to ingest, dict of path -> content hash)
+    """
+    pending = []
+    content_hashes = {}
+    for path in paths:
+        stat = os.stat(path)
+        entry = conn.execute("""
+            SELECT size, mtime_ns, content_hash FROM ingest_manifest WHERE path = ?
+        """, (os.path.abspath(path),)).fetchone()
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            logging.info(f"Skipping unchanged file: {path}")
+            continue
+        if entry is None:
+            logging.info(f"New file to ingest: {path}")
+            pending.append(path)
+            continue
+
+        content_hash = file_content_hash(path)
+        if entry[2] == content_hash:
+            conn.execute("""
+                UPDATE ingest_manifest SET size = ?, mtime_ns = ? WHERE path = ?
+            """, (stat.st_size, stat.st_mtime_ns, os.path.abspath(path)))
+            conn.commit()
+            logging.info(f"Skipping file with unchanged content: {path}")
+            continue
+
+        logging.warning(f"File changed since it was ingested: {path}")
+        content_hashes[path] = content_hash
+        pending.append(path)
+    return pending, content_hashes
+
+def record_ingested_file(conn, path, variant_count=None, genotype_count=None, content_hash=None):
+    """
+    Record a successfully ingested file and its row counts in ingest_manifest.
+    """
+    stat = os.stat(path)
+    conn.execute("""
+        INSERT OR REPLACE INTO ingest_manifest (
+            path, size, mtime_ns, content_hash, variant_count, genotype_count, ingested_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+        content_hash or file_content_hash(path), variant_count, genotype_count,
+        datetime.now(timezone.utc).isoformat(timespec='seconds')
+    ))
+    conn.execute("DELETE FROM ingest_checkpoints WHERE path = ?", (os.path.abspath(path),))
+    conn.commit()
+
+def genotype_high_water_marks(conn):
+    """
+    Return the highest genotype_id and genotype_matrix rowid, marking the genotypes
+    written before an ingest.
+    """
+    return (
+        conn.execute("SELECT COALESCE(MAX(genotype_id), 0) FROM genotype").fetchone()[0],
+        conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM genotype_matrix").fetchone()[0],
+    )
+
+def ingest_high_water_marks(conn):
+    """
+    Return the highest variant_id followed by genotype_high_water_marks, marking the rows
+    written before a batch.
+    """
+    return (
+        conn.execute("SELECT COALESCE(MAX(variant_id), 0) FROM variants").fetchone()[0],
+    ) + genotype_high_water_marks(conn)
+
+def remove_batch_rows(conn, batches):
+    """
+    Remove the rows written by committed batches of a file that failed afterwards.
+
+    Each batch is given by the ingest_high_water_marks taken before and after it: the
+    genotype and genotype_matrix rows inserted in between are deleted, then the variants
+    inserted in between that no other file has given genotypes. Existing rows a changed
+    file updated keep their new values.
+
+    Returns:
+        tuple: (variant rows removed, genotype and genotype_matrix rows removed)
+    """
+    variant_count = 0
+    genotype_count = 0
+    try:
+        conn.execute('BEGIN TRANSACTION')
+        for (_, first_genotype_id, first_matrix_rowid), (_, last_genotype_id, last_matrix_rowid) in batches:
+            genotype_count += conn.execute(
+                "DELETE FROM genotype WHERE genotype_id > ? AND genotype_id <= ?",
+                (first_genotype_id, last_genotype_id)
+            ).rowcount
+            genotype_count += conn.execute(
+                "DELETE FROM genotype_matrix WHERE rowid > ? AND rowid <= ?",
+                (first_matrix_rowid, last_matrix_rowid)
+            ).rowcount
+        for (first_variant_id, _, _), (last_variant_id, _, _) in batches:
+            variant_count += conn.execute("""
+                DELETE FROM variants
+                WHERE variant_id > ? AND variant_id <= ?
+                  AND NOT EXISTS (SELECT 1 FROM genotype WHERE genotype.variant_id = variants.variant_id)
+                  AND NOT EXISTS (SELECT 1 FROM genotype_matrix WHERE genotype_matrix.variant_id = variants.variant_id)
+            """, (first_variant_id, last_variant_id)).rowcount
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return variant_count, genotype_count
+
+def first_new_genotype_variant(conn, marks):
+    """
+    Return the lowest variant_id with genotypes written after genotype_high_water_marks
+    returned marks, or None if none were written.
+
+    New genotype rows get ids above the marks, so only the rows of this ingest are read.
+    """
+    last_genotype_id, last_matrix_rowid = marks
+    variant_ids = [
+        conn.execute("SELECT MIN(variant_id) FROM genotype WHERE genotype_id > ?", (last_genotype_id,)).fetchone()[0],
+        conn.execute("SELECT MIN(variant_id) FROM genotype_matrix WHERE rowid > ?", (last_matrix_rowid,)).fetchone()[0],
+    ]
+    variant_ids = [variant_id for variant_id in variant_ids if variant_id is not None]
+    return min(variant_ids) if variant_ids else None
+
+# ---------------------------- Ingest Checkpoints ---------------------------- #
+
+def has_ingest_checkpoints(conn):
+    """
+    Return True if an earlier checkpointed load left files unfinished or unrecorded.
+    """
+    try:
+        return conn.execute("SELECT 1 FROM ingest_checkpoints LIMIT 1").fetchone() is not None
+    except sqlite3.OperationalError:
+        return False  # Database created before checkpoints existed
+
+def load_checkpoint(conn, vcf_path):
+    """
+    Return the checkpoint of a VCF file, or None to ingest it from the start.
+
+    A checkpoint taken while the file had another size or mtime is discarded.
+
+    Returns:
+        dict: record_count, chrom, pos, pos_record_count, variant_count, genotype_count and done.
+    """
+    stat = os.stat(vcf_path)
+    row = conn.execute("""
+        SELECT size, mtime_ns, record_count, chrom, pos, pos_record_count, variant_count, genotype_count, done
+        FROM ingest_checkpoints WHERE path = ?
+    """, (os.path.abspath(vcf_path),)).fetchone()
+    if row is None:
+        return None
+    if (row[0], row[1]) != (stat.st_size, stat.st_mtime_ns):
+        logging.warning(f"File changed since its checkpoint, ingesting it from the start: {vcf_path}")
+        conn.execute("DELETE FROM ingest_checkpoints WHERE path = ?", (os.path.abspath(vcf_path),))
+        conn.commit()
+        return None
+    return dict(zip(
+        ('record_count', 'chrom', 'pos', 'pos_record_count', 'variant_count', 'genotype_count', 'done'), row[2:]
+    ))
+
+def save_checkpoint(cursor, vcf_path, record_count, last_record, variant_count, genotype_count, done=False):
+    """
+    Record how far a VCF file has been ingested, inside the transaction of the rows it covers.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor inside the file's transaction.
+        vcf_path (str): VCF file being ingested.
+        record_count (int): Number of VCF records written so far.
+        last_record (tuple): (normalized chrom, pos, records at pos) of the last of them
+            (see advance_record_position), or None.
+        variant_count (int): Variant rows written so far.
+        genotype_count (int): Genotypes written so far.
+        done (bool): The whole file has been written.
+    """
+    stat = os.stat(vcf_path)
+    chrom, pos, pos_record_count = last_record or (None, None, None)
+    cursor.execute("""
+        INSERT OR REPLACE INTO ingest_checkpoints (
+            path, size, mtime_ns, record_count, chrom, pos, pos_record_count, variant_count, genotype_count,
+            done, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        os.path.abspath(vcf_path), stat.st_size, stat.st_mtime_ns, record_count, chrom, pos, pos_record_count,
+        variant_count, genotype_count, int(done), datetime.now(timezone.utc).isoformat(timespec='seconds')
+    ))
+
+def advance_record_position(last_record, chrom, pos):
+    """
+    Return the (chrom, pos, records at pos) position of the record read after last_record.
+
+    The count of records at pos lets a checkpoint be resumed by seeking to pos; it is None
+    when the count is unknown (a checkpoint saved without it, resumed at the same position).
+    """
+    if last_record and last_record[:2] == (chrom, pos):
+        return chrom, pos, last_record[2] + 1 if last_record[2] is not None else None
+    return chrom, pos, 1
+
+def skip_checkpointed_records(vcf, checkpoint, vcf_path):
+    """
+    Advance a VCF file past the records covered by a checkpoint.
+
+    An indexed file is read from the checkpoint position on: the rest of its contig,
+    then the contigs listed after it in the header (the order the sharded ingest also
+    relies on), skipping the records at that position the checkpoint covers. Other files,
+    and checkpoints without a count of those records, are read from the start.
+
+    Returns:
+        iterator: The records after the checkpoint.
+
+    Raises:
+        ValueError: If the last skipped record is not the one the checkpoint names.
+    """
+    logging.info(f"Resuming {vcf_path} after record {checkpoint['record_count']} "
+                 f"({checkpoint['chrom']}:{checkpoint['pos']})")
+    pos_record_count = checkpoint['pos_record_count']
+    if checkpoint['record_count'] and pos_record_count and has_vcf_index(vcf_path):
+        contigs = list(vcf.seqnames)
+        contig_index = next(
+            (index for index, contig in enumerate(contigs) if normalize_chrom(contig) == checkpoint['chrom']), None
+        )
+        if contig_index is not None:
+            # The region query also returns the earlier records overlapping pos
+            records = iter(vcf(f"{contigs[contig_index]}:{checkpoint['pos']}-"))
+            skipped = 0
+            while skipped < pos_record_count:
+                variant = next(records, None)
+                if variant is None or variant.POS > checkpoint['pos']:
+                    raise ValueError(
+                        f"Checkpoint of {vcf_path} covers {pos_record_count} records at "
+                        f"{checkpoint['chrom']}:{checkpoint['pos']} but the file has {skipped} there"
+                    )
+                if variant.POS == checkpoint['pos']:
+                    skipped += 1
+            return chain(records, chain.from_iterable(vcf(contig) for contig in contigs[contig_index + 1:]))
+
+    records = iter(vcf)
+    last_record = None
+    for _ in range(checkpoint['record_count']):
+        variant = next(records, None)
+        if variant is None:
+            break
+        last_record = (normalize_chrom(variant.CHROM), variant.POS)
+    if checkpoint['record_count'] and last_record != (checkpoint['chrom'], checkpoint['pos']):
+        raise ValueError(
+            f"Checkpoint of {vcf_path} ends at {checkpoint['chrom']}:{checkpoint['pos']} "
+            f"(record {checkpoint['record_count']}) but the file has {last_record} there"
+        )
+    return records
+
 # ---------------------------- Main Execution ---------------------------- #
 
 def main():
     conn = connect_db()
-    initialize_database(conn)
+
+    # A checkpointed load that was interrupted resumes instead of rebuilding the database:
+    # files recorded in the manifest are skipped, the others continue from their checkpoint
+    resuming = CHECKPOINT_INTERVAL is not None and has_ingest_checkpoints(conn)
+    if resuming:
+        logging.info("Resuming an interrupted ingest from its checkpoints.")
+
+    # Bulk load: secondary indexes of new tables are built after the load (existing ones are kept)
+    if BULK_LOAD:
+        apply_pragmas(conn, BULK_LOAD_PRAGMAS)
+    load_start = time.perf_counter()
+    initialize_database(conn, rebuild=not (INCREMENTAL_INGEST or resuming), create_indexes=not BULK_LOAD)
 
     # Process your VCF files
     vcf_files = [
@@ -489,20 +2269,119 @@ def main():
         if (f.endswith('.vcf') or f.endswith('.vcf.gz')) and 'clinvar' not in f.lower()
     ]
 
-    sample_ids = {}
+    content_hashes = {}
+    changed_files = set()
+    if INCREMENTAL_INGEST or resuming:
+        # Changed files are merged again: their records overwrite the variants and
+        # genotypes already in the database, new records, samples and genotypes are added.
+        # Records removed from a changed file stay in the database.
+        vcf_files, content_hashes = plan_incremental_ingest(conn, vcf_files)
+        recorded_files = {row[0] for row in conn.execute("SELECT path FROM ingest_manifest")}
+        changed_files = {vcf_path for vcf_path in vcf_files if os.path.abspath(vcf_path) in recorded_files}
+        logging.info(f"Incremental ingest: {len(vcf_files)} new or changed VCF files.")
+    genotype_marks = genotype_high_water_marks(conn)
 
-    for vcf_path in vcf_files:
-        if os.path.isfile(vcf_path):
-            process_vcf(conn, vcf_path, sample_ids)
-        else:
-            logging.warning(f"File not found: {vcf_path}")
+    # Samples already in the database keep their ids
+    sample_ids = {
+        sample_name: sample_id
+        for sample_id, sample_name in conn.execute("SELECT sample_id, sample_name FROM samples")
+    }
+
+    # Variant ids resolved so far, so records repeated across files are not inserted again
+    variant_ids = VariantIdCache(VARIANT_ID_CACHE_SIZE)
 
-    # Process the ClinVar VCF file
-    if os.path.isfile(CLINVAR_VCF_PATH):
-        process_clinvar_vcf(conn, CLINVAR_VCF_PATH)
+    file_counts = {}
+    if INGEST_MODE == 'parallel':
+        file_counts = process_vcfs_parallel(conn, vcf_files, sample_ids, INGEST_WORKERS, INGEST_QUEUE_DEPTH,
+                                            INGEST_BATCH_SIZE, GENOTYPE_STORE, CHECKPOINT_INTERVAL is not None,
+                                            variant_ids, changed_files)
     else:
+        for vcf_path in vcf_files:
+            if not os.path.isfile(vcf_path):
+                logging.warning(f"File not found: {vcf_path}")
+            elif INGEST_MODE == 'sharded' and has_vcf_index(vcf_path) and vcf_path not in changed_files:
+                file_counts[vcf_path] = process_vcf_sharded(conn, vcf_path, sample_ids, INGEST_WORKERS,
+                                                            SHARD_WINDOW_SIZE, SHARD_DIRECTORY,
+                                                            INGEST_BATCH_SIZE, GENOTYPE_STORE)
+            elif INGEST_MODE in ('batched', 'sharded'):
+                file_counts[vcf_path] = process_vcf_batched(conn, vcf_path, sample_ids, INGEST_BATCH_SIZE,
+                                                            genotype_store=GENOTYPE_STORE,
+                                                            checkpoint_interval=CHECKPOINT_INTERVAL,
+                                                            variant_ids=variant_ids,
+                                                            update_existing=vcf_path in changed_files)
+            else:
+                file_counts[vcf_path] = process_vcf(conn, vcf_path, sample_ids, GENOTYPE_STORE,
+                                                    CHECKPOINT_INTERVAL, variant_ids, vcf_path in changed_files)
+
+    # Failed files are left out of the manifest so the next incremental run retries them
+    # (from their checkpoint, if any); recorded files drop their checkpoint
+    for vcf_path, counts in file_counts.items():
+        if counts is not None:
+            record_ingested_file(conn, vcf_path, counts[0], counts[1], content_hashes.get(vcf_path))
+
+    # Incremental runs rebuild the carrier index blocks from the first variant given new
+    # genotypes on; updated genotypes (changed files) and resumed loads rebuild all of it
+    first_variant_id = 0
+    if INCREMENTAL_INGEST and not (changed_files or resuming):
+        first_variant_id = first_new_genotype_variant(conn, genotype_marks)
+    if CARRIER_INDEX and first_variant_id is not None and (vcf_files or not INCREMENTAL_INGEST):
+        start_time = time.perf_counter()
+        try:
+            carrier_variants = build_carrier_index(conn, first_variant_id=first_variant_id)
+            logging.info(f"Built carrier index for {carrier_variants} variants from variant ID {first_variant_id} "
+                         f"in {time.perf_counter() - start_time:.2f}s")
+        except Exception as e:
+            logging.error(f"Error building carrier index: {e}", exc_info=True)
+
+    # Process the ClinVar VCF file; incremental runs redo it only for new variants or a new ClinVar release
+    if not os.path.isfile(CLINVAR_VCF_PATH):
         logging.error(f"ClinVar VCF file not found: {CLINVAR_VCF_PATH}")
+    else:
+        clinvar_files, clinvar_hashes = [CLINVAR_VCF_PATH], {}
+        # A new ClinVar release replaces the annotations of the previous one
+        new_release = False
+        if INCREMENTAL_INGEST:
+            clinvar_files, clinvar_hashes = plan_incremental_ingest(conn, [CLINVAR_VCF_PATH])
+            new_release = bool(clinvar_files)
+            if not clinvar_files and vcf_files:
+                clinvar_files = [CLINVAR_VCF_PATH]  # Annotate the newly ingested variants
+        if clinvar_files:
+            if CLINVAR_JOIN_MODE == 'merge':
+                matched_count = process_clinvar_vcf_merge(conn, CLINVAR_VCF_PATH, INGEST_BATCH_SIZE, new_release)
+            else:
+                matched_count = process_clinvar_vcf(conn, CLINVAR_VCF_PATH, new_release)
+            if matched_count is not None:
+                record_ingested_file(conn, CLINVAR_VCF_PATH, matched_count,
+                                     content_hash=clinvar_hashes.get(CLINVAR_VCF_PATH))
+            rebuild_clinvar_search_index(conn)
+
+    # Functional annotation and ANN display tables of the variants added by this run, read from their ANN column
+    start_time = time.perf_counter()
+    try:
+        annotation_count = build_variant_annotations(conn, INGEST_BATCH_SIZE, rebuild=bool(changed_files))
+        logging.info(f"Wrote {annotation_count} functional annotations in {time.perf_counter() - start_time:.2f}s")
+    except Exception as e:
+        logging.error(f"Error building functional annotations: {e}", exc_info=True)
+
+    if PAYLOAD_COMPRESSION:
+        start_time = time.perf_counter()
+        try:
+            compressed = compress_payloads(conn, PAYLOAD_COMPRESSION, PAYLOAD_DICTIONARY_SIZE,
+                                           PAYLOAD_DICTIONARY_SAMPLES)
+            logging.info(f"Compressed payloads with {PAYLOAD_COMPRESSION} ({compressed}) "
+                         f"in {time.perf_counter() - start_time:.2f}s")
+            if not (INCREMENTAL_INGEST or resuming):
+                # Return the pages freed by the compression to the filesystem; incremental
+                # runs leave them for the rows they add later
+                conn.execute("VACUUM")
+        except Exception as e:
+            logging.error(f"Error compressing payloads: {e}", exc_info=True)
+
+    logging.info(f"Load phase took {time.perf_counter() - load_start:.2f}s")
+    if BULK_LOAD:
+        finish_bulk_load(conn)
 
+    bump_generation(conn)
     conn.close()
     logging.info("Database processing complete.")
 
@@ -0,0 +1,237 @@
+import struct
+import zlib
+import sqlite3
+from functools import lru_cache
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional, zlib is always available
+    zstandard = None
+
+
+# ---------------------------- Compressed Payload Format ---------------------------- #
+
+# variants columns holding rarely read payloads that may be stored compressed
+PAYLOAD_COLUMNS = ('info', 'ANN')
+
+# A compressed payload is a BLOB: a 5-byte header (codec byte, uint32 dictionary_id)
+# followed by the compressed UTF-8 text. Uncompressed payloads stay TEXT, so both
+# kinds can live in the same column. dictionary_id is the CRC-32 of the dictionary.
+PAYLOAD_CODEC_ZLIB = 1
+PAYLOAD_CODEC_ZSTD = 2
+PAYLOAD_CODECS = {'zlib': PAYLOAD_CODEC_ZLIB, 'zstd': PAYLOAD_CODEC_ZSTD}
+PAYLOAD_HEADER = struct.Struct('<BI')
+
+# zlib only looks back 32 KiB, so a longer dictionary would never be used
+ZLIB_MAX_DICTIONARY_SIZE = 32768
+
+# Payloads shorter than this stay uncompressed; the header alone would outweigh the savings
+PAYLOAD_MIN_SIZE = 32
+
+# dictionary_id -> (codec, dictionary) of every dictionary seen by this process. The ids
+# are content hashes, so entries stay valid across connections and database rebuilds.
+payload_dictionaries = {}
+
+# ---------------------------- Dictionaries ---------------------------- #
+
+def train_dictionary(samples, codec='zlib', dictionary_size=ZLIB_MAX_DICTIONARY_SIZE):
+    """
+    Build a compression dictionary from sample payloads.
+
+    zstd trains a dictionary from the samples. zlib has no trainer and uses a preset
+    dictionary of raw content, so the samples are concatenated and the last
+    dictionary_size bytes (at most 32 KiB) are kept.
+
+    Args:
+        samples (list): Sample payloads as bytes.
+        codec (str): 'zlib' or 'zstd'.
+        dictionary_size (int): Maximum dictionary size in bytes.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    if codec == 'zstd':
+        require_codec(codec)
+        try:
+            return zstandard.train_dictionary(dictionary_size, samples).as_bytes()
+        except zstandard.ZstdError:
+            pass  # Too few samples to train on: fall back to a raw-content dictionary
+    return b''.join(samples)[-min(dictionary_size, ZLIB_MAX_DICTIONARY_SIZE):]
+
+def require_codec(codec):
+    """
+    Check that a codec name is known and its library is installed.
+
+    Raises:
+        ValueError: If the codec is neither 'zlib' nor 'zstd'.
+        ImportError: If 'zstd' is requested without the zstandard package.
+    """
+    if codec not in PAYLOAD_CODECS:
+        raise ValueError(f"Unknown payload codec '{codec}'; expected one of {', '.join(PAYLOAD_CODECS)}")
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError("Payload codec 'zstd' needs the zstandard package (pip install zstandard)")
+
+def register_dictionary(codec, dictionary):
+    """
+    Make a dictionary known to this process and return its dictionary_id.
+    """
+    dictionary_id = zlib.crc32(dictionary)
+    payload_dictionaries[dictionary_id] = (codec, dictionary)
+    return dictionary_id
+
+def load_payload_dictionary(conn, dictionary_id):
+    """
+    Read a dictionary from the payload_dictionaries table into the process cache.
+
+    Returns:
+        tuple: (codec, dictionary), or None if the database does not hold it.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Plain tuples, whatever row_factory the connection uses
+    try:
+        row = cursor.execute(
+            "SELECT codec, dictionary FROM payload_dictionaries WHERE dictionary_id = ?", (dictionary_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None  # Database without compressed payloads
+    if row is None:
+        return None
+    payload_dictionaries[dictionary_id] = (row[0], bytes(row[1]))
+    return payload_dictionaries[dictionary_id]
+
+@lru_cache(maxsize=64)
+def primed_codec(dictionary_id):
+    """
+    Build the compressor and decompressor of a known dictionary.
+
+    zlib objects are primed with the dictionary once and copied for each payload,
+    which is several times faster than passing the dictionary to every call. A zstd
+    compressor is reused as is (the compression pass runs in a single thread); zstd
+    decompressors are not thread-safe, so one is created per payload from the
+    shared dictionary.
+    """
+    codec, dictionary = payload_dictionaries[dictionary_id]
+    require_codec(codec)
+    if codec == 'zstd':
+        zstd_dictionary = zstandard.ZstdCompressionDict(dictionary)
+        return codec, zstandard.ZstdCompressor(dict_data=zstd_dictionary), zstd_dictionary
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15, zdict=dictionary)
+    decompressor = zlib.decompressobj(-15, zdict=dictionary)
+    return codec, compressor, decompressor
+
+# ---------------------------- Encoding ---------------------------- #
+
+def compress_payload(text, dictionary_id):
+    """
+    Compress a payload string with a registered dictionary.
+
+    Returns:
+        bytes: Header and compressed payload; None stays None.
+    """
+    if text is None:
+        return None
+    codec, compressor, _ = primed_codec(dictionary_id)
+    data = text.encode('utf-8')
+    if codec == 'zstd':
+        payload = compressor.compress(data)
+    else:
+        compressor = compressor.copy()
+        payload = compressor.compress(data) + compressor.flush()
+    return PAYLOAD_HEADER.pack(PAYLOAD_CODECS[codec], dictionary_id) + payload
+
+def decode_payload(conn, value):
+    """
+    Return a payload column value as text, decompressing it if it was stored compressed.
+
+    Text and None pass through unchanged, so callers need not know whether the
+    database compresses its payloads. Unknown dictionaries are read from conn.
+
+    Raises:
+        ValueError: If the dictionary of a compressed payload is missing.
+    """
+    if not isinstance(value, bytes):
+        return value
+    _, dictionary_id = PAYLOAD_HEADER.unpack_from(value)
+    if dictionary_id not in payload_dictionaries and load_payload_dictionary(conn, dictionary_id) is None:
+        raise ValueError(f"Compressed payload references unknown dictionary {dictionary_id}")
+    codec, _, decompressor = primed_codec(dictionary_id)
+    payload = value[PAYLOAD_HEADER.size:]
+    if codec == 'zstd':
+        data = zstandard.ZstdDecompressor(dict_data=decompressor).decompress(payload)
+    else:
+        data = decompressor.copy().decompress(payload)
+    return data.decode('utf-8')
+
+def decode_payload_row(cursor, row):
+    """
+    Decompress the PAYLOAD_COLUMNS values of a result row, for use in a row_factory.
+
+    Returns:
+        tuple: The row with its payload columns as text.
+    """
+    return tuple(
+        decode_payload(cursor.connection, value) if column[0] in PAYLOAD_COLUMNS else value
+        for column, value in zip(cursor.description, row)
+    )
+
+# ---------------------------- Compression Pass ---------------------------- #
+
+def compress_payloads(conn, codec='zlib', dictionary_size=ZLIB_MAX_DICTIONARY_SIZE, sample_count=5000):
+    """
+    Compress the uncompressed PAYLOAD_COLUMNS values of the variants table in place.
+
+    Each column gets its own dictionary, trained on a random sample of its values the
+    first time the column is compressed with the codec and reused for rows added later
+    (incremental ingest). Values shorter than PAYLOAD_MIN_SIZE stay text.
+
+    Returns:
+        dict: column -> number of values compressed.
+    """
+    require_codec(codec)
+    compressed = {}
+    cursor = conn.cursor()
+    try:
+        for column in PAYLOAD_COLUMNS:
+            pending = f"typeof({column}) = 'text' AND length({column}) >= {PAYLOAD_MIN_SIZE}"
+            row = cursor.execute("""
+                SELECT dictionary_id FROM payload_dictionaries
+                WHERE column_name = ? AND codec = ?
+                ORDER BY created_at DESC LIMIT 1
+            """, (column, codec)).fetchone()
+            if row is None or load_payload_dictionary(conn, row[0]) is None:
+                samples = [
+                    value.encode('utf-8') for (value,) in cursor.execute(
+                        f"SELECT {column} FROM variants WHERE {pending} ORDER BY random() LIMIT ?", (sample_count,)
+                    )
+                ]
+                if not samples:
+                    compressed[column] = 0
+                    continue
+                dictionary = train_dictionary(samples, codec, dictionary_size)
+                dictionary_id = register_dictionary(codec, dictionary)
+                cursor.execute("""
+                    INSERT OR REPLACE INTO payload_dictionaries (dictionary_id, column_name, codec, dictionary, created_at)
+                    VALUES (?, ?, ?, ?, datetime('now'))
+                """, (dictionary_id, column, codec, dictionary))
+            else:
+                dictionary_id = row[0]
+
+            conn.create_function('compress_payload', 1, lambda text: compress_payload(text, dictionary_id))
+            cursor.execute(f"UPDATE variants SET {column} = compress_payload({column}) WHERE {pending}")
+            compressed[column] = cursor.rowcount
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return compressed
+
+# ---------------------------- SQL Functions ---------------------------- #
+
+def register_payload_functions(conn):
+    """
+    Register the SQL function payload_text(value) on a connection: the text of a
+    payload column, compressed or not, e.g. SELECT payload_text(ANN) FROM variants.
+    """
+    conn.create_function('payload_text', 1, lambda value: decode_payload(conn, value), deterministic=True)
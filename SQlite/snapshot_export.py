@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import logging
+from urllib.parse import quote
+from urllib.request import pathname2url
+from info_columns import quote_column
+from payload_store import PAYLOAD_COLUMNS, decode_payload
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed to write snapshots
+    pa = None
+
+# ---------------------------- Configuration ---------------------------- #
+
+# Database to snapshot and the directory the snapshot replaces
+DATABASE_PATH = 'genomic_variants.db'
+SNAPSHOT_DIRECTORY = 'snapshot'
+LOG_FILE = 'snapshot_export.log'
+
+# 'parquet' writes Parquet files compressed with PARQUET_COMPRESSION; 'arrow' writes
+# uncompressed Arrow IPC files, which readers can memory-map
+SNAPSHOT_FORMAT = 'parquet'
+PARQUET_COMPRESSION = 'zstd'
+
+# Rows read and written per record batch (one Parquet row group); bounds memory use,
+# about 2 KB per row while a batch is converted
+SNAPSHOT_BATCH_SIZE = 16384
+
+# Low-cardinality text columns written dictionary-encoded
+DICTIONARY_COLUMNS = ['filter', 'clinical_significance', 'review_status', 'CLNREVSTAT', 'CLNSIG',
+                      'CLNVC', 'CLNVCSO', 'ORIGIN']
+
+# The info and ANN JSON payloads are large and rarely scanned; True adds them as text
+# columns (decompressed). The first ANN entry's fields are always included.
+SNAPSHOT_PAYLOADS = False
+
+# ---------------------------- Logging Setup ---------------------------- #
+
+logging.basicConfig(
+    filename=LOG_FILE,
+    filemode='a',
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+
+# ---------------------------- Schema ---------------------------- #
+
+def table_columns(conn, table):
+    """
+    Return the (name, declared type) pairs of a table's columns, or [] if it does not exist.
+    """
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def arrow_type(name, declared_type):
+    """
+    Map a column to its Arrow type: dictionary-encoded text for DICTIONARY_COLUMNS,
+    otherwise by the declared type's SQLite affinity (INTEGER, REAL or text).
+    """
+    if name in DICTIONARY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return pa.int64()
+    if any(affinity in declared_type for affinity in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.string()
+
+def snapshot_columns(conn):
+    """
+    Select the columns of the snapshot: every variants column (projected INFO fields
+    included), the ClinVar annotation and, if the database has it, the first ANN
+    entry's fields from variant_ann_display.
+
+    chrom is the partition key, so it is not stored in the files. ClinVar columns
+    whose name is taken by a variants column get a 'clinvar_' prefix.
+
+    Returns:
+        list: (SQL expression, column name, Arrow type) tuples in snapshot order.
+    """
+    columns = []
+    for name, declared_type in table_columns(conn, 'variants'):
+        if name == 'chrom' or (name in PAYLOAD_COLUMNS and not SNAPSHOT_PAYLOADS):
+            continue
+        columns.append((f"variants.{quote_column(name)}", name, arrow_type(name, declared_type)))
+    taken = {name.lower() for _, name, _ in columns} | {'chrom'}
+    for name, declared_type in table_columns(conn, 'clinvar_annotations'):
+        if name in ('annotation_id', 'variant_id'):
+            continue
+        alias = f"clinvar_{name}" if name.lower() in taken else name
+        columns.append((f"clinvar_annotations.{quote_column(name)}", alias, arrow_type(name, declared_type)))
+    for name, declared_type in table_columns(conn, 'variant_ann_display'):
+        if name != 'variant_id':
+            columns.append((f"variant_ann_display.{quote_column(name)}", name, arrow_type(name, declared_type)))
+    return columns
+
+def snapshot_query(conn, columns):
+    """
+    Build the query reading one chromosome's rows in position order (idx_variants_chrom_pos).
+    """
+    ann_join = ""
+    if table_columns(conn, 'variant_ann_display'):
+        ann_join = "LEFT JOIN variant_ann_display ON variants.variant_id = variant_ann_display.variant_id"
+    return f"""
+        SELECT {', '.join(expression for expression, _, _ in columns)}
+        FROM variants
+        LEFT JOIN clinvar_annotations ON variants.variant_id = clinvar_annotations.variant_id
+        {ann_join}
+        WHERE variants.chrom = ?
+        ORDER BY variants.pos, variants.variant_id
+    """
+
+# ---------------------------- Writing ---------------------------- #
+
+class DictionaryEncoder:
+    """
+    Dictionary-encode one text column of a partition file.
+
+    The dictionary only grows, so a value keeps its index in every batch of the file
+    and each batch's dictionary extends the previous one (an Arrow IPC delta).
+    """
+
+    def __init__(self):
+        self.indices = {}
+        self.values = []
+
+    def encode(self, values):
+        """
+        Return a batch of values (None for NULL) as a DictionaryArray.
+        """
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            index = self.indices.get(value)
+            if index is None:
+                index = self.indices[value] = len(self.values)
+                self.values.append(str(value))
+            indices.append(index)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), pa.array(self.values, pa.string()))
+
+def open_writer(path, schema, snapshot_format=SNAPSHOT_FORMAT):
+    """
+    Open a Parquet or Arrow IPC file writer; both take record batches with write_batch.
+    """
+    if snapshot_format == 'arrow':
+        return pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+    return pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+
+def write_partition(conn, query, columns, schema, chrom, path, snapshot_format=SNAPSHOT_FORMAT,
+                    batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Write the rows of one chromosome to a partition file, one record batch per fetchmany.
+
+    Returns:
+        int: Number of rows written.
+    """
+    payload_indexes = {index for index, (_, name, _) in enumerate(columns) if name in PAYLOAD_COLUMNS}
+    encoders = {
+        index: DictionaryEncoder() for index, (_, _, column_type) in enumerate(columns)
+        if pa.types.is_dictionary(column_type)
+    }
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Plain tuples
+    row_count = 0
+    writer = open_writer(path, schema, snapshot_format)
+    try:
+        cursor.execute(query, (chrom,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            arrays = []
+            for index, values in enumerate(zip(*rows)):
+                if index in payload_indexes:
+                    values = [decode_payload(conn, value) for value in values]
+                if index in encoders:
+                    arrays.append(encoders[index].encode(values))
+                else:
+                    arrays.append(pa.array(values, schema.field(index).type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            row_count += len(rows)
+    finally:
+        writer.close()
+        cursor.close()
+    return row_count
+
+def write_snapshot(database_path=DATABASE_PATH, snapshot_directory=SNAPSHOT_DIRECTORY,
+                   snapshot_format=SNAPSHOT_FORMAT, batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Write the variants / clinvar_annotations join as a columnar snapshot partitioned by
+    chromosome: <snapshot_directory>/chrom=<chrom>/part-0.parquet (or .arrow).
+
+    All partitions are read in one read transaction, so the snapshot is consistent
+    even if models.py writes to the database meanwhile. The snapshot is written next
+    to the directory and replaces it when complete.
+
+    Returns:
+        dict: chrom -> number of rows written.
+    """
+    if pa is None:
+        raise ImportError("Snapshots need the pyarrow package (pip install pyarrow)")
+    if snapshot_format not in ('parquet', 'arrow'):
+        raise ValueError(f"Unknown snapshot format '{snapshot_format}'; expected 'parquet' or 'arrow'")
+
+    conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(database_path))}?mode=ro", uri=True)
+    staging_directory = f"{snapshot_directory}.tmp"
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    partition_rows = {}
+    try:
+        conn.execute('BEGIN')  # One snapshot of the database for every partition
+        columns = snapshot_columns(conn)
+        query = snapshot_query(conn, columns)
+        try:
+            generation = conn.execute("SELECT value FROM metadata WHERE key = 'generation'").fetchone()
+        except sqlite3.OperationalError:
+            generation = None
+        schema = pa.schema(
+            [pa.field(name, column_type) for _, name, column_type in columns],
+            metadata={'source': os.path.basename(database_path), 'generation': str(generation[0] if generation else '')}
+        )
+
+        chromosomes = [row[0] for row in conn.execute("SELECT DISTINCT chrom FROM variants ORDER BY chrom")]
+        for chrom in chromosomes:
+            start_time = time.perf_counter()
+            partition_directory = os.path.join(staging_directory, f"chrom={quote(str(chrom), safe='')}")
+            os.makedirs(partition_directory)
+            path = os.path.join(partition_directory, f"part-0.{snapshot_format}")
+            partition_rows[chrom] = write_partition(conn, query, columns, schema, chrom, path,
+                                                    snapshot_format, batch_size)
+            logging.info(f"Wrote {partition_rows[chrom]} rows of chromosome {chrom} in {time.perf_counter() - start_time:.2f}s")
+        conn.rollback()
+
+        shutil.rmtree(snapshot_directory, ignore_errors=True)
+        os.replace(staging_directory, snapshot_directory)
+    except Exception:
+        shutil.rmtree(staging_directory, ignore_errors=True)
+        raise
+    finally:
+        conn.close()
+    return partition_rows
+
+# ---------------------------- Main Execution ---------------------------- #
+
+def main():
+    """
+    Write the snapshot configured above.
+    """
+    start_time = time.perf_counter()
+    try:
+        partition_rows = write_snapshot()
+    except Exception as e:
+        logging.error(f"Snapshot export failed: {e}", exc_info=True)
+        print(f"Snapshot export failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    message = (f"Wrote {sum(partition_rows.values())} rows in {len(partition_rows)} chromosome partitions "
+               f"to {SNAPSHOT_DIRECTORY} ({SNAPSHOT_FORMAT}) in {time.perf_counter() - start_time:.2f}s")
+    logging.info(message)
+    print(message)
+
+# ---------------------------- Entry Point ---------------------------- #
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import Flask, render_template, request, abort, Response
+from flask import Flask, render_template, request, abort, Response, jsonify
 from tinydb import TinyDB, Query
 from flask_paginate import Pagination, get_page_parameter
 import os
@@ -10,6 +10,14 @@ import sys
 from datetime import datetime
 import math
 import csv
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+# ResultCache is shared with the SQLite browser and lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_cache import ResultCache
 
 app = Flask(__name__)
 
@@ -19,6 +27,10 @@ app = Flask(__name__)
 DB_PATH = '/home/mohadese/Desktop/Task2/TinyDB/genomic_db.json'  # Ensure the filename and path are correct
 LOG_FILE = 'flask_app.log'
 
+# Result cache of listing pages, keyed on the normalized search and cleared when the generation changes
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Total pickled size of the cached pages
+RESULT_CACHE_TTL = 300  # Seconds a cached page is served before it is recomputed
+
 # ---------------------------- Logging Setup ---------------------------- #
 
 # Initialize logger
@@ -159,7 +171,7 @@ def build_query(search_criteria, logic='and'):
                 queries.append(Variant[field] == value)
                 logger.debug(f"Added query: Variant['{field}'] == '{value}'")
             elif operator == 'contains':
-                queries.append(Variant[field].test(lambda v: value.lower() in str(v).lower()))
+                queries.append(Variant[field].test(lambda v, needle=value.lower(): needle in str(v).lower()))
                 logger.debug(f"Added query: Variant['{field}'].contains('{value}')")
             else:
                 logger.warning(f"Unsupported operator '{operator}' for text field '{field}'.")
@@ -185,6 +197,185 @@ def build_query(search_criteria, logic='and'):
     logger.debug(f"Final built query: {query}")
     return query
 
+# ---------------------------- Secondary Indexes ---------------------------- #
+
+# One build of the indexes, never modified once published, so a search reads the
+# documents and indexes of a single database generation:
+#   documents: doc_id -> document
+#   text_index: field -> {value: set of doc_ids}
+#   contains_index: field -> {lowercased str(value): set of doc_ids}
+#   numeric_index: field -> (sorted values, doc_ids in the same order)
+VariantIndexState = namedtuple(
+    'VariantIndexState', ['documents', 'text_index', 'contains_index', 'numeric_index', 'generation']
+)
+
+class VariantIndex:
+    """
+    In-memory secondary indexes over the TinyDB variant table.
+
+    Text fields get a hash index (value -> doc_ids) and numeric fields a sorted
+    array of values with their doc_ids, so search criteria are answered by
+    intersecting or joining doc_id sets instead of running a query over every
+    document. The indexes are rebuilt lazily when the database file changes and
+    replaced as one VariantIndexState, so searches running meanwhile keep theirs.
+    """
+
+    def __init__(self, db, db_path):
+        self.db = db
+        self.db_path = db_path
+        self.signature = None
+        self.lock = threading.Lock()
+        self.state = VariantIndexState({}, {}, {}, {}, None)
+
+    def file_signature(self):
+        """
+        Return the database file's (mtime, size).
+        """
+        stat = os.stat(self.db_path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """
+        Rebuild the indexes if the database file's mtime or size changed.
+
+        Returns:
+            VariantIndexState: The current indexes and the database generation they
+            were built from.
+        """
+        signature = self.file_signature()
+        with self.lock:
+            if signature != self.signature:
+                self.state = self.rebuild()
+                self.signature = signature
+            return self.state
+
+    def rebuild(self):
+        """
+        Load all documents and build the hash and sorted indexes.
+
+        Returns:
+            VariantIndexState: The new indexes, published by refresh.
+        """
+        start_time = time.perf_counter()
+        self.db.clear_cache()
+        documents = {doc.doc_id: doc for doc in self.db.all()}
+
+        # Generation bumped by models.py on every run; older databases fall back to the file signature
+        entry = self.db.table('metadata').get(Variant.key == 'generation')
+        generation = entry['value'] if entry else self.file_signature()
+
+        text_index = {}
+        contains_index = {}
+        numeric_index = {}
+        for column in get_filterable_columns():
+            field = column['name']
+            if column['type'] == 'number':
+                pairs = sorted(
+                    (doc[field], doc_id) for doc_id, doc in documents.items()
+                    if isinstance(doc.get(field), (int, float))
+                )
+                numeric_index[field] = ([value for value, _ in pairs], [doc_id for _, doc_id in pairs])
+            else:
+                exact = {}
+                lowered = {}
+                for doc_id, doc in documents.items():
+                    if field not in doc:
+                        continue
+                    value = doc[field]
+                    try:
+                        exact.setdefault(value, set()).add(doc_id)
+                    except TypeError:
+                        pass  # Unhashable (list) values can never equal a search string
+                    lowered.setdefault(str(value).lower(), set()).add(doc_id)
+                text_index[field] = exact
+                contains_index[field] = lowered
+
+        logger.info(f"Built variant indexes for {len(documents)} documents in {time.perf_counter() - start_time:.2f}s.")
+        return VariantIndexState(documents, text_index, contains_index, numeric_index, generation)
+
+    def match(self, state, criterion):
+        """
+        Return the set of doc_ids of state matching one criterion, or None if the
+        criterion is skipped (incomplete, invalid or unsupported, as in build_query).
+        """
+        field = (criterion.get('field') or '').strip()
+        operator = (criterion.get('operator') or '').strip()
+        value = criterion.get('value')
+        if not field or not operator or value is None:
+            return None
+        value = value.strip()
+
+        field_type = next((col['type'] for col in get_filterable_columns() if col['name'] == field), 'text')
+        if field_type == 'number':
+            try:
+                numeric_value = float(value)
+            except ValueError:
+                return None
+            values, doc_ids = state.numeric_index[field]
+            if operator == 'equals':
+                low, high = bisect_left(values, numeric_value), bisect_right(values, numeric_value)
+            elif operator == 'greater_than':
+                low, high = bisect_right(values, numeric_value), len(values)
+            elif operator == 'less_than':
+                low, high = 0, bisect_left(values, numeric_value)
+            elif operator == 'greater_than_or_equal':
+                low, high = bisect_left(values, numeric_value), len(values)
+            elif operator == 'less_than_or_equal':
+                low, high = 0, bisect_right(values, numeric_value)
+            else:
+                return None
+            return set(doc_ids[low:high])
+
+        if field not in state.text_index:
+            # Not a filterable column: evaluate the TinyDB query over the cached documents
+            query = build_query([criterion])
+            if query is None:
+                return None
+            return {doc_id for doc_id, doc in state.documents.items() if query(doc)}
+        if operator == 'equals':
+            return set(state.text_index[field].get(value, ()))
+        elif operator == 'contains':
+            needle = value.lower()
+            matched = set()
+            for text, doc_ids in state.contains_index[field].items():
+                if needle in text:
+                    matched |= doc_ids
+            return matched
+        return None
+
+    def search(self, search_criteria, logic='and'):
+        """
+        Return the documents matching the search criteria, in doc_id order.
+
+        Args:
+            search_criteria (list): List of dictionaries with 'field', 'operator', and 'value'.
+            logic (str): 'and' or 'or' to combine conditions.
+
+        Returns:
+            tuple: (matching TinyDB documents, all documents if no criterion applies;
+            the database generation they were read from, for cache keys).
+        """
+        state = self.refresh()
+        matched = None
+        for criterion in search_criteria:
+            doc_ids = self.match(state, criterion)
+            if doc_ids is None:
+                continue
+            if matched is None:
+                matched = doc_ids
+            elif logic == 'and':
+                matched &= doc_ids
+            else:
+                matched |= doc_ids
+
+        if matched is None:
+            return list(state.documents.values()), state.generation
+        return [state.documents[doc_id] for doc_id in sorted(matched)], state.generation
+
+variant_index = VariantIndex(db, DB_PATH)
+
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+
 # ---------------------------- Routes ---------------------------- #
 
 @app.route('/')
@@ -211,35 +402,47 @@ def variants():
     logger.debug(f"Received search criteria: {search_criteria}")
     logger.debug(f"Combine logic: {logic}")
 
-    # Build and execute query
-    query = build_query(search_criteria, logic)
-    if query:
-        all_variants = db.search(query)
+    # Serve repeated searches from the result cache. Criteria are normalized (sorted,
+    # values stripped) so equivalent searches share an entry; results are in doc_id order.
+    generation = variant_index.refresh().generation
+    normalized_criteria = tuple(sorted(
+        (criterion['field'], criterion['operator'], criterion['value'].strip()) for criterion in search_criteria
+    ))
+    cache_key = (normalized_criteria, logic, 'doc_id', page, per_page)
+    result = result_cache.get(generation, cache_key)
+    if result is None:
+        # Answer the search from the secondary indexes
+        # Cached under the generation the search actually read, in case the indexes
+        # were rebuilt since the lookup
+        all_variants, generation = variant_index.search(search_criteria, logic)
         logger.debug(f"Applied search criteria. {len(all_variants)} variants found.")
-    else:
-        all_variants = db.all()
-        logger.debug(f"No search criteria applied. Retrieved {len(all_variants)} variants.")
 
-    # Total variants after filtering
-    total = len(all_variants)
-    logger.debug(f"Total variants after filtering: {total}")
-
-    # Calculate total pages
-    total_pages = math.ceil(total / per_page) if total > 0 else 1
-    logger.debug(f"Calculated total_pages: {total_pages}")
-
-    # Ensure current page is within range
-    if page < 1:
-        page = 1
-    elif page > total_pages:
-        page = total_pages
-
-    # Pagination slicing
-    start = (page - 1) * per_page
-    end = start + per_page
-    variants_paginated = all_variants[start:end]
-    logger.debug(f"Start index: {start}, End index: {end}")
-    logger.debug(f"Variants paginated count: {len(variants_paginated)}")
+        # Total variants after filtering
+        total = len(all_variants)
+        logger.debug(f"Total variants after filtering: {total}")
+
+        # Calculate total pages
+        total_pages = math.ceil(total / per_page) if total > 0 else 1
+        logger.debug(f"Calculated total_pages: {total_pages}")
+
+        # Ensure current page is within range
+        if page < 1:
+            page = 1
+        elif page > total_pages:
+            page = total_pages
+
+        # Pagination slicing
+        start = (page - 1) * per_page
+        end = start + per_page
+        variants_paginated = all_variants[start:end]
+        logger.debug(f"Start index: {start}, End index: {end}")
+        logger.debug(f"Variants paginated count: {len(variants_paginated)}")
+
+        result = {'variants': variants_paginated, 'total': total, 'page': page}
+        result_cache.put(generation, cache_key, result)
+    else:
+        logger.debug(f"Served search from the result cache: {cache_key}")
+    variants_paginated, total, page = result['variants'], result['total'], result['page']
 
     # Prepare pagination
     pagination = Pagination(
@@ -273,6 +476,11 @@ def variants():
                            header_keys=header_keys,
                            current_year=datetime.now().year)
 
+@app.route('/cache-stats')
+def cache_stats():
+    """Report the result cache's hit/miss counters and occupancy as JSON."""
+    return jsonify(result_cache.stats())
+
 @app.route('/export', methods=['GET'])
 def export_variants():
     """
@@ -295,14 +503,9 @@ def export_variants():
     logger.debug(f"Export - Received search criteria: {search_criteria}")
     logger.debug(f"Export - Combine logic: {logic}")
 
-    # Build query
-    query = build_query(search_criteria, logic)
-    if query:
-        variants = db.search(query)
-        logger.debug(f"Export - Applied search criteria. {len(variants)} variants found.")
-    else:
-        variants = db.all()
-        logger.debug(f"Export - No search criteria applied. Retrieved {len(variants)} variants.")
+    # Answer the search from the secondary indexes
+    variants, _ = variant_index.search(search_criteria, logic)
+    logger.debug(f"Export - Applied search criteria. {len(variants)} variants found.")
 
     # Define CSV headers
     filterable_columns = get_filterable_columns()
@@ -358,14 +561,10 @@ def debug_search():
     logger.debug(f"Debug Search - Received search criteria: {search_criteria}")
     logger.debug(f"Debug Search - Combine logic: {logic}")
 
-    # Build and execute query
+    # Build the query for display and answer the search from the secondary indexes
     query = build_query(search_criteria, logic)
-    if query:
-        all_variants = db.search(query)
-        logger.debug(f"Debug Search - Applied search criteria. {len(all_variants)} variants found.")
-    else:
-        all_variants = db.all()
-        logger.debug(f"Debug Search - No search criteria applied. Retrieved {len(all_variants)} variants.")
+    all_variants, _ = variant_index.search(search_criteria, logic)
+    logger.debug(f"Debug Search - Applied search criteria. {len(all_variants)} variants found.")
 
     # Total variants after filtering
     total = len(all_variants)
@@ -2,11 +2,29 @@
 import os
 import logging
 from tinydb import TinyDB, Query
+from tinydb.storages import Storage
+from tinydb.middlewares import CachingMiddleware
 from cyvcf2 import VCF
 from tqdm import tqdm
 from logging.handlers import RotatingFileHandler
 import sys
 
+# Use the fastest available JSON codec for the database file
+try:
+    import orjson
+
+    def json_dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    json_loads = orjson.loads
+except ImportError:
+    import json
+
+    def json_dumps(data):
+        return json.dumps(data).encode('utf-8')
+
+    json_loads = json.loads
+
 # ---------------------------- Configuration ---------------------------- #
 
 # Paths for VCF and ClinVar VCF files
@@ -16,6 +34,17 @@ DB_PATH = 'genomic_dab.json'
 LOG_FILE = 'integration.log'
 BATCH_SIZE = 1000
 
+# Storage backend: 'cached' keeps the database in memory and writes the JSON file
+# every CACHE_FLUSH_INTERVAL writes (None writes it once, when the database is
+# closed); 'json' is TinyDB's default JSONStorage, which rewrites the whole file
+# on every write
+STORAGE_MODE = 'cached'
+CACHE_FLUSH_INTERVAL = None
+
+# Table holding the database generation number, bumped on every run so the app
+# drops results cached for older contents
+METADATA_TABLE = 'metadata'
+
 # ---------------------------- Logging Setup ---------------------------- #
 
 # Initialize logger
@@ -38,6 +67,55 @@ console_handler.setFormatter(console_formatter)
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
+# ---------------------------- Storage ---------------------------- #
+
+class FastJSONStorage(Storage):
+    """
+    TinyDB storage writing the same JSON layout as JSONStorage, using the fastest
+    available JSON codec and replacing the file atomically on write.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__()
+        self.path = path
+
+    def read(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return None  # Let TinyDB initialize an empty database
+        with open(self.path, 'rb') as f:
+            return json_loads(f.read())
+
+    def write(self, data):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+def open_database(db_path=DB_PATH, storage_mode=STORAGE_MODE, flush_interval=CACHE_FLUSH_INTERVAL):
+    """
+    Open the TinyDB database with the configured storage backend.
+
+    Args:
+        db_path (str): Path to the TinyDB JSON file.
+        storage_mode (str): 'cached' or 'json'.
+        flush_interval (int): Writes between flushes in 'cached' mode; None flushes on close only.
+
+    Returns:
+        TinyDB: Database instance; use it as a context manager so cached data is flushed.
+    """
+    if storage_mode == 'json':
+        return TinyDB(db_path)
+
+    db = TinyDB(db_path, storage=CachingMiddleware(FastJSONStorage))
+    db.storage.WRITE_CACHE_SIZE = flush_interval or float('inf')
+    logger.info(f"Opened {db_path} with cached storage (flush interval: {flush_interval or 'on close'}).")
+    return db
+
 # ---------------------------- Helper Functions ---------------------------- #
 
 def normalize_chrom(chrom):
@@ -54,22 +132,55 @@ def normalize_chrom(chrom):
         return chrom[3:].upper()
     return chrom.upper()
 
-def insert_records(db, records):
+def variant_key(record):
+    """
+    Build the (chrom, pos, ref, alt) lookup key of a variant record.
+
+    Args:
+        record (dict): Variant record or TinyDB document.
+
+    Returns:
+        tuple: Variant key.
+    """
+    return (record.get('chrom'), record.get('pos'), record.get('ref'), record.get('alt'))
+
+def insert_records(db, records, variant_index=None):
     """
     Insert records into TinyDB in batches.
 
     Args:
         db (TinyDB): TinyDB database instance.
         records (list): List of dictionaries representing variant records.
+        variant_index (dict): Optional variant key -> doc_id map to record the new doc_ids in.
     """
     if records:
         try:
-            db.insert_multiple(records)
+            doc_ids = db.insert_multiple(records)
+            if variant_index is not None:
+                for record, doc_id in zip(records, doc_ids):
+                    variant_index[variant_key(record)] = doc_id
             logger.debug(f"Inserted {len(records)} records.")
             records.clear()
         except Exception as e:
             logger.error(f"Failed to insert records: {e}")
 
+def bump_generation(db):
+    """
+    Increment the database generation number stored in the metadata table.
+
+    Args:
+        db (TinyDB): TinyDB database instance.
+
+    Returns:
+        int: The new generation number.
+    """
+    metadata = db.table(METADATA_TABLE)
+    entry = metadata.get(Query().key == 'generation')
+    generation = (entry['value'] if entry else 0) + 1
+    metadata.upsert({'key': 'generation', 'value': generation}, Query().key == 'generation')
+    logger.info(f"Database generation is now {generation}.")
+    return generation
+
 # process_vcf.py
 
 def get_int(info_fields, key, default=0):
@@ -111,22 +222,20 @@ def get_float(info_fields, key, default=0.0):
 
 def load_existing_variants(db):
     """
-    Load existing variants from TinyDB into a set for quick lookup.
+    Load existing variants from TinyDB into a key -> doc_id map for quick lookup.
 
     Args:
         db (TinyDB): TinyDB database instance.
 
     Returns:
-        set: Set of tuples representing existing variants (chrom, pos, ref, alt).
+        dict: Map of variant keys (chrom, pos, ref, alt) to their TinyDB doc_id.
     """
     logger.info("Loading existing variants from the database into memory...")
-    Variant = Query()
-    existing = set()
+    existing = {}
     try:
         all_records = db.all()
         for record in all_records:
-            key = (record.get('chrom'), record.get('pos'), record.get('ref'), record.get('alt'))
-            existing.add(key)
+            existing[variant_key(record)] = record.doc_id
         logger.info(f"Loaded {len(existing)} existing variants.")
     except Exception as e:
         logger.error(f"Error loading existing variants: {e}")
@@ -139,10 +248,9 @@ def parse_vcf(db, vcf_directory, existing_variants):
     Args:
         db (TinyDB): TinyDB database instance.
         vcf_directory (str): Path to directory containing VCF files.
-        existing_variants (set): Set of existing variant keys to avoid duplication.
+        existing_variants (dict): Map of existing variant keys to doc_ids, to avoid duplication.
     """
     vcf_files = [os.path.join(vcf_directory, f) for f in os.listdir(vcf_directory) if f.endswith('.vcf.gz')]
-    Variant = Query()
 
     for vcf_file in vcf_files:
         logger.info(f"Processing VCF file: {vcf_file}")
@@ -183,13 +291,13 @@ def parse_vcf(db, vcf_directory, existing_variants):
                     }
 
                     records.append(record)
-                    existing_variants.add(key)  # Add to existing to prevent future duplicates
+                    existing_variants[key] = None  # Reserve the key; doc_id is set on insert
 
                     if len(records) >= BATCH_SIZE:
-                        insert_records(db, records)
+                        insert_records(db, records, existing_variants)
 
             # Insert any remaining records after processing the file
-            insert_records(db, records)
+            insert_records(db, records, existing_variants)
             logger.info(f"Completed processing {vcf_file}")
         except Exception as e:
             logger.error(f"Error processing {vcf_file}: {e}", exc_info=True)
@@ -197,6 +305,28 @@ def parse_vcf(db, vcf_directory, existing_variants):
             if vcf:
                 vcf.close()
 
+def apply_clinvar_updates(db, existing_variants, clinvar_updates):
+    """
+    Apply collected ClinVar annotations to their variant documents in one batched update.
+
+    Args:
+        db (TinyDB): TinyDB database instance.
+        existing_variants (dict): Map of variant keys to doc_ids.
+        clinvar_updates (dict): Map of variant keys to the ClinVar fields to set.
+
+    Returns:
+        list: doc_ids of the updated documents.
+    """
+    doc_ids = [existing_variants[key] for key in clinvar_updates if existing_variants.get(key) is not None]
+    if not doc_ids:
+        return []
+
+    def apply_annotation(doc):
+        doc.update(clinvar_updates[variant_key(doc)])
+
+    # A single update call reads and writes the table once for all doc_ids
+    return db.update(apply_annotation, doc_ids=doc_ids)
+
 def parse_clinvar(db, clinvar_vcf, existing_variants):
     """
     Parse ClinVar VCF and update annotations in TinyDB for existing variants.
@@ -205,16 +335,15 @@ def parse_clinvar(db, clinvar_vcf, existing_variants):
     Args:
         db (TinyDB): TinyDB database instance.
         clinvar_vcf (str): Path to ClinVar VCF file.
-        existing_variants (set): Set of existing variant keys to identify updates.
+        existing_variants (dict): Map of existing variant keys to doc_ids to identify updates.
     """
     logger.info("Processing ClinVar VCF for chromosome 17...")
     clinvar = None
     unmatched_variants = []
-    Variant = Query()
+    clinvar_updates = {}
 
     try:
         clinvar = VCF(clinvar_vcf)
-        records_updated = 0
         for variant in tqdm(clinvar, desc="Processing ClinVar VCF", unit="variants"):
             chrom_normalized = normalize_chrom(variant.CHROM)
             if chrom_normalized != '17':
@@ -243,17 +372,14 @@ def parse_clinvar(db, clinvar_vcf, existing_variants):
                 }
 
                 if key in existing_variants:
-                    # Update existing record with ClinVar data
-                    db.update(clinvar_data, (Variant.chrom == chrom_normalized) & 
-                             (Variant.pos == pos) & 
-                             (Variant.ref == ref) & 
-                             (Variant.alt == alt))
-                    records_updated += 1
+                    # Collect the update; all matches are written in one batch below
+                    clinvar_updates[key] = clinvar_data
                 else:
                     # Do not insert new records for ClinVar-only variants
                     unmatched_variants.append(f"{chrom_normalized}:{pos}:{ref}>{alt}")
 
         clinvar.close()
+        records_updated = len(apply_clinvar_updates(db, existing_variants, clinvar_updates))
         logger.info(f"Successfully processed ClinVar VCF file. Updated {records_updated} records.")
 
     except Exception as e:
@@ -274,7 +400,7 @@ def main():
     """
     try:
         logger.info("Starting integration process...")
-        with TinyDB(DB_PATH) as db:
+        with open_database(DB_PATH, STORAGE_MODE, CACHE_FLUSH_INTERVAL) as db:
             # Load existing variants to minimize database searches
             existing_variants = load_existing_variants(db)
             
@@ -283,6 +409,9 @@ def main():
             
             # Parse and integrate ClinVar annotations
             parse_clinvar(db, CLINVAR_VCF_PATH, existing_variants)
+
+            # Invalidate the results the app cached for the previous contents
+            bump_generation(db)
         
         logger.info("Integration process complete.")
     except Exception as e:
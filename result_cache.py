@@ -0,0 +1,101 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Shared by the SQLite and TinyDB browsers (SQlite/app.py and TinyDB/app.py), which
+# import it from the repository root
+
+
+# ---------------------------- Result Cache ---------------------------- #
+
+class ResultCache:
+    """
+    LRU cache of computed results (listing pages, resolved filters), bounded by the
+    total size of its entries in bytes (measured as their pickled size) and by a time
+    to live per entry.
+
+    Entries belong to one database generation: the first lookup with a newer
+    generation empties the cache, so results of an older load are never served.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.generation = None
+        self.entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def check_generation(self, generation):
+        """Drop every entry if the database generation changed. Call with the lock held."""
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.size = 0
+            self.generation = generation
+
+    def get(self, generation, key):
+        """
+        Return the cached value of a key, or None on a miss or an expired entry.
+        """
+        with self.lock:
+            self.check_generation(generation)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                self.size -= entry[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, generation, key, value):
+        """
+        Cache a value, evicting the least recently used entries to stay within max_bytes.
+        Values larger than max_bytes on their own are not cached.
+        """
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.check_generation(generation)
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Return the hit/miss counters and current occupancy, for sizing the cache.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'generation': self.generation,
+            }